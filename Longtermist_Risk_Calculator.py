@@ -7,7 +7,7 @@ import streamlit as st
 import plotly.express as px
 import numpy as np
 import pandas as pd
-from calculators.simple_calc.simple_calc import SimpleCalc
+from calculators.simple_calc import simple_calc
 st.set_page_config(
         page_title="L-risk calculator",
 )
@@ -82,34 +82,79 @@ def set_query_params():
     st.experimental_set_query_params(**query_params)
 
 
-def update_transitions(transition_name, current_state):
-    """For every transitional probability from the current state, update the value of the slider"""
+# The slider behind each of SimpleCalc's keyword transition probabilities (the rest are whatever's
+# left over from their origin state)
+keyword_names = {
+    'Extinction from preindustrial': 'extinction_given_preindustrial',
+    'Extinction from industrial': 'extinction_given_industrial',
+
+    'Extinction from present perils': 'extinction_given_present_perils',
+    'Preindustrial from present perils': 'preindustrial_given_present_perils',
+    'Industrial from present perils': 'industrial_given_present_perils',
+    "A 'minor' technological regression† from present perils": 'future_perils_given_present_perils',
+    'Interstellar/existential security from present perils': 'interstellar_given_present_perils',
+
+    'Extinction from future perils': 'extinction_given_future_perils',
+    'Preindustrial from future perils': 'preindustrial_given_future_perils',
+    'Industrial from future perils': 'industrial_given_future_perils',
+    'Interstellar/existential security from future perils': 'interstellar_given_future_perils',
+
+    'Extinction from multiplanetary': 'extinction_given_multiplanetary',
+    'Preindustrial from multiplanetary': 'preindustrial_given_multiplanetary',
+    'Industrial from multiplanetary': 'industrial_given_multiplanetary',
+    'Future perils from multiplanetary': 'future_perils_given_multiplanetary',
+}
+
+def rebalanced_transitions(transition_name, current_state, value, values):
+    """The value of every transitional probability from the current state (keyed like the session
+    state) after setting transition_name to value, with the others adjusted so they still sum to 1,
+    given the current values of all of them"""
+    values = {transition + " " + current_state: values[transition + " " + current_state]
+              for transition in all_transitions[current_state]}
+    values[transition_name + " " + current_state] = value
     other_transitions = [transition for transition in all_transitions[current_state]
                          if transition != transition_name][::-1]
-    st.session_state[transition_name + " " + current_state] = st.session_state[
-        transition_name + " " + current_state + '_from_input']
     # Given the change, determine how much we need to adjust other transitional probabilities to
     # ensure they sum to 1
-    excess_probability = sum(st.session_state[transition + ' ' + current_state] for transition in all_transitions[current_state]) - 1
+    excess_probability = sum(values.values()) - 1
 
     for transition in other_transitions:
         # If excess_probability is positive that means we've lowered the value of the transition
         # we're updating, and need to raise another
-        if 0 < excess_probability <= st.session_state[transition  + " " + current_state]:
+        if 0 < excess_probability <= values[transition  + " " + current_state]:
             # The difference is low enough to be absorbed by this transition, so we're done
             # adjusting sliders
-            st.session_state[transition + " " + current_state] += -excess_probability
+            values[transition + " " + current_state] += -excess_probability
             break
         if excess_probability > 0:
             # Reduce this transition to 0 and continue to the next
-            excess_probability -= st.session_state[transition + " " + current_state]
-            st.session_state[transition + " " + current_state] = .0
+            excess_probability -= values[transition + " " + current_state]
+            values[transition + " " + current_state] = .0
     # If excess_probability is negative or 0, we add the difference it to extinction unless it's
     # extinction we modified, then we add it to the next-most regressed state)
     if excess_probability < 0 and transition_name + " " + current_state in last_listed_transitions:
-        st.session_state[all_transitions[current_state][-2] + " " + current_state] -= excess_probability
+        values[all_transitions[current_state][-2] + " " + current_state] -= excess_probability
     elif excess_probability < 0:
-        st.session_state[all_transitions[current_state][-1] + " " + current_state] -= excess_probability
+        values[all_transitions[current_state][-1] + " " + current_state] -= excess_probability
+    return values
+
+def keyword_transition_probabilities(values):
+    """SimpleCalc's keyword transition probabilities for whichever of values (keyed like the session
+    state) have one"""
+    return {keyword_names[transition]: value for transition, value in values.items()
+            if transition in keyword_names}
+
+def update_transitions(transition_name, current_state):
+    """For every transitional probability from the current state, update the value of the slider,
+    and the session's SimpleCalc to match"""
+    values = rebalanced_transitions(
+        transition_name, current_state,
+        st.session_state[transition_name + " " + current_state + '_from_input'], st.session_state)
+    st.session_state.update(values)
+    changes = keyword_transition_probabilities(values)
+    if changes and 'simple_calc' in st.session_state:
+        # Every change is out of the same state, so its solver only needs a rank-one update
+        st.session_state['simple_calc'].update_transition_probabilities(**changes)
     set_query_params()
 
 for session_value in target_states:
@@ -262,36 +307,18 @@ for transition in all_transitions['from multiplanetary']:
 
 st.markdown("""## Comparing the value of outcomes""")
 
-all_transition_probabilities = {
-    'extinction_given_preindustrial': st.session_state['Extinction from preindustrial'],
-    'extinction_given_industrial': st.session_state['Extinction from industrial'],
-
-    'extinction_given_present_perils': st.session_state['Extinction from present perils'],
-    'preindustrial_given_present_perils': st.session_state['Preindustrial from present perils'],
-    'industrial_given_present_perils': st.session_state['Industrial from present perils'],
-    'future_perils_given_present_perils': st.session_state["A 'minor' technological regression† from present perils"],
-    'interstellar_given_present_perils': st.session_state['Interstellar/existential security from present perils'],
-
-    'extinction_given_future_perils': st.session_state['Extinction from future perils'],
-    'preindustrial_given_future_perils': st.session_state['Preindustrial from future perils'],
-    'industrial_given_future_perils': st.session_state['Industrial from future perils'],
-    'interstellar_given_future_perils': st.session_state['Interstellar/existential security from future perils'],
-
-    'extinction_given_multiplanetary': st.session_state['Extinction from multiplanetary'],
-    'preindustrial_given_multiplanetary': st.session_state['Preindustrial from multiplanetary'],
-    'industrial_given_multiplanetary': st.session_state['Industrial from multiplanetary'],
-    'future_perils_given_multiplanetary': st.session_state['Future perils from multiplanetary'],
-}
+all_transition_probabilities = keyword_transition_probabilities(st.session_state)
+if 'simple_calc' not in st.session_state:
+    st.session_state['simple_calc'] = simple_calc.SimpleCalc(**all_transition_probabilities)
+session_calc = st.session_state['simple_calc']
 
-calc = SimpleCalc(**all_transition_probabilities)
-mc = calc.markov_chain()
-success_probabilities = mc.absorption_probabilities()[1]
-data = dict(zip(mc.transient_states, success_probabilities))
+results = simple_calc.evaluate(calc=session_calc, **all_transition_probabilities)
+success_probabilities = results.success_probabilities
 probabilities_df = pd.DataFrame(
-    data.items(),
+    success_probabilities.items(),
     columns=['Civilisation state', 'Probability of becoming interstellar'])
 
-st.markdown(f"### tl;dr: we have a {round(success_probabilities[2] * 100)}% chance of becoming interstellar")
+st.markdown(f"### tl;dr: we have a {round(success_probabilities['Present perils'] * 100)}% chance of becoming interstellar")
 
 
 st.markdown("""<h6 style="text-align: center;">
@@ -316,6 +343,33 @@ probabilties_fig = px.bar(probabilities_df,
 
 st.plotly_chart(probabilties_fig, use_container_width=True)
 
+st.markdown("""<h6 style="text-align: center;">
+            What if you changed one of your estimates?
+            </h6>""", unsafe_allow_html=True)
+
+preview_options = [(transition, origin_state) for origin_state, transitions in all_transitions.items()
+                   if origin_state != 'from abstract state' for transition in transitions]
+preview_transition, preview_origin_state = st.selectbox(
+    'Estimate', preview_options, format_func=lambda option: option[0] + " " + option[1])
+candidate_values = np.round(np.linspace(0, 1, 21), 2)
+# Each candidate moves the chosen slider, rebalancing the others from its state as moving it would
+previews = session_calc.preview_absorption_probabilities(
+    [keyword_transition_probabilities(rebalanced_transitions(
+        preview_transition, preview_origin_state, value, st.session_state))
+     for value in candidate_values])
+present_perils_column = list(success_probabilities).index('Present perils')
+preview_df = pd.DataFrame({
+    preview_transition + " " + preview_origin_state: candidate_values,
+    'Probability of becoming interstellar from present perils':
+        previews[:, 1, present_perils_column]})
+preview_fig = px.line(preview_df,
+                      x=preview_transition + " " + preview_origin_state,
+                      y='Probability of becoming interstellar from present perils',
+                      markers=True)
+preview_fig.add_vline(x=st.session_state[preview_transition + " " + preview_origin_state],
+                      line_dash='dash', line_color=highlighted_red)
+st.plotly_chart(preview_fig, use_container_width=True)
+
 
 st.markdown("""
 Let $V$ be the value we imagine of humans becoming interstellar and $V_{\\text{state}}$ be
@@ -341,7 +395,7 @@ st.latex(r'''
 ''')
 
 difference_df = pd.DataFrame(
-    calc.probability_differences().items(),
+    results.probability_differences.items(),
     columns=['State', 'Value of transitioning to state (as a multiple of V)'])
 difference_fig = px.bar(
     difference_df,
@@ -372,7 +426,7 @@ success is less than 50%).
 x='State'
 y='Cost of transitioning to state as a percentage of the cost of extinction'
 proportion_df = pd.DataFrame(
-    calc.probability_proportion_differences().items(),
+    results.probability_proportion_differences.items(),
     columns=[x, y])
 proportion_fig = px.bar(
     proportion_df,
@@ -430,7 +484,7 @@ for state, col in zip(all_transitions['from abstract state'][3:], (col1, col2, c
 
 st.write(obelus_string, unsafe_allow_html=True)
 
-probability_differences = np.array(list(calc.probability_differences().values()))
+probability_differences = np.array(list(results.probability_differences.values()))
 counterfactual_transitional_probabilities = (
     np.array([st.session_state[state + " " + 'from abstract state']
               for state in all_transitions['from abstract state']]))
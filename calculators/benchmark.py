@@ -0,0 +1,262 @@
+# pylint: disable=too-many-locals
+
+"""Benchmarks for the full and simple calculators, to catch performance regressions and to size
+hardware for a given set of runtime constants.
+
+For each point of a grid of MAX_PLANETS/MAX_CIVILISATIONS/MAX_PROGRESS_YEARS values this times, in
+a fresh process,
+
+- perils_construction/multiplanetary_construction: building every time of perils/multiplanetary
+  sub-chain's transition matrix
+- perils_solve/multiplanetary_solve: solving those sub-chains for their absorption probabilities
+- full_construction: assembling the full chain from the solved sub-chains
+- full_solve: solving the full chain
+
+along with the peak resident memory of the whole run, then times single and batch evaluations of
+the simple calculator (which don't depend on the runtime constants). Results are written as JSON
+tagged with the git commit, so runs on different commits can be compared with --compare, eg
+
+    python -m calculators.benchmark --output before.json
+    git checkout my-branch
+    python -m calculators.benchmark --output after.json --compare before.json
+
+which exits with status 1 if any phase got more than --threshold times slower.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import argparse
+import datetime
+import io
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from calculators.full_calc import full_chain
+from calculators.full_calc import sub_markov_chains
+from calculators.full_calc import tracing
+from calculators.full_calc.params import Params
+from calculators.simple_calc import simple_calc
+
+DEFAULT_GRID = {'MAX_PLANETS': [5, 10],
+                'MAX_CIVILISATIONS': [3, 5],
+                'MAX_PROGRESS_YEARS': [200, 500]}
+
+# Roughly the Streamlit page's defaults
+SIMPLE_CALC_TRANSITION_PROBABILITIES = {
+    'extinction_given_preindustrial': 0.01, 'extinction_given_industrial': 0.01,
+    'extinction_given_present_perils': 0.05, 'preindustrial_given_present_perils': 0.05,
+    'industrial_given_present_perils': 0.1, 'future_perils_given_present_perils': 0.1,
+    'interstellar_given_present_perils': 0.3, 'extinction_given_future_perils': 0.05,
+    'preindustrial_given_future_perils': 0.05, 'industrial_given_future_perils': 0.1,
+    'interstellar_given_future_perils': 0.3, 'extinction_given_multiplanetary': 0.01,
+    'preindustrial_given_multiplanetary': 0.01, 'industrial_given_multiplanetary': 0.01,
+    'future_perils_given_multiplanetary': 0.05}
+SIMPLE_CALC_BATCH_SIZE = 1000
+SIMPLE_CALC_SINGLE_REPEATS = 200
+
+DEFAULT_THRESHOLD = 1.2
+
+
+class _PhaseTimer:
+    """Records the wall time (and, if trace_memory, the peak Python heap allocation) of each
+    phase of a run"""
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.seconds = {}
+        self.peak_traced_bytes = {}
+
+    def time(self, phase, function, *args):
+        """Call function(*args), recording it under phase, and return its result"""
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = function(*args)
+        self.seconds[phase] = self.seconds.get(phase, 0) + time.perf_counter() - start
+        if self.trace_memory:
+            self.peak_traced_bytes[phase] = max(self.peak_traced_bytes.get(phase, 0),
+                                                tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        return result
+
+
+def _solved(chain):
+    chain.mc.absorption_probabilities()
+    return chain
+
+
+def _benchmark_full_calc(params_dict, runtime_constants, trace_memory):
+    full_chain.use_params(params_dict)
+    full_chain.use_runtime_constants(runtime_constants)
+    timer = _PhaseTimer(trace_memory)
+    civilisations = range(runtime_constants['MAX_CIVILISATIONS'])
+    with redirect_stdout(io.StringIO()): # The sub-chains announce themselves as they're built
+        perils_chains = [timer.time('perils_construction', sub_markov_chains.IntraPerilsMCWrapper, k)
+                         for k in civilisations]
+        for chain in perils_chains:
+            timer.time('perils_solve', _solved, chain)
+        multiplanetary_chains = [
+            timer.time('multiplanetary_construction',
+                       sub_markov_chains.IntraMultiplanetaryMCWrapper, k)
+            for k in civilisations]
+        for chain in multiplanetary_chains:
+            timer.time('multiplanetary_solve', _solved, chain)
+        mc = timer.time('full_construction', full_chain.full_markov_chain, None, perils_chains,
+                        multiplanetary_chains)
+        timer.time('full_solve', mc.absorption_probabilities)
+    return _phase_results(timer)
+
+
+def _benchmark_simple_calc(trace_memory):
+    timer = _PhaseTimer(trace_memory)
+    for _ in range(SIMPLE_CALC_SINGLE_REPEATS):
+        timer.time('single_evaluation', lambda: simple_calc.SimpleCalc(
+            **SIMPLE_CALC_TRANSITION_PROBABILITIES).absorption_probabilities())
+    timer.seconds['single_evaluation'] /= SIMPLE_CALC_SINGLE_REPEATS
+
+    # Vary each probability by up to 10% so no two chains in the batch are the same
+    rng = np.random.default_rng(0)
+    batch = [{name: probability * rng.uniform(0.9, 1.1)
+              for name, probability in SIMPLE_CALC_TRANSITION_PROBABILITIES.items()}
+             for _ in range(SIMPLE_CALC_BATCH_SIZE)]
+    timer.time('batch_evaluation', simple_calc.batch_absorption_probabilities, batch)
+    results = _phase_results(timer)
+    results['batch_size'] = SIMPLE_CALC_BATCH_SIZE
+    return results
+
+
+def _phase_results(timer):
+    results = {'seconds': timer.seconds, 'peak_rss_bytes': tracing.peak_rss_bytes()}
+    if timer.trace_memory:
+        results['peak_traced_bytes'] = timer.peak_traced_bytes
+    return results
+
+
+def _in_fresh_process(function, *args):
+    """Run function in a process of its own, so that its peak RSS and module state are its alone"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(function, *args).result()
+
+
+def _fastest(runs):
+    """Combine repeats of a benchmark, keeping the fastest time and the highest memory use seen"""
+    combined = dict(runs[0])
+    combined['seconds'] = {phase: min(run['seconds'][phase] for run in runs)
+                           for phase in runs[0]['seconds']}
+    combined['peak_rss_bytes'] = max(run['peak_rss_bytes'] for run in runs)
+    if 'peak_traced_bytes' in combined:
+        combined['peak_traced_bytes'] = {
+            phase: max(run['peak_traced_bytes'][phase] for run in runs)
+            for phase in runs[0]['peak_traced_bytes']}
+    return combined
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(grid=None, repeat=1, trace_memory=False, params_dict=None):
+    """Benchmark the full calculator at every point of grid (a dict of runtime constant name to a
+    list of values - see DEFAULT_GRID) and the simple calculator, taking the fastest of repeat
+    runs of each. Returns the results as a JSON-serialisable dict."""
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    params_dict = params_dict if params_dict is not None else Params().dictionary
+    full_calc_results = []
+    for values in itertools.product(*(grid[name] for name in full_chain.RUNTIME_CONSTANT_NAMES)):
+        runtime_constants = dict(zip(full_chain.RUNTIME_CONSTANT_NAMES, values))
+        print(f'Benchmarking the full calculator with {runtime_constants}')
+        full_calc_results.append({
+            'runtime_constants': runtime_constants,
+            **_fastest([_in_fresh_process(_benchmark_full_calc, params_dict, runtime_constants,
+                                          trace_memory)
+                        for _ in range(repeat)])})
+    print('Benchmarking the simple calculator')
+    simple_calc_results = _fastest([_in_fresh_process(_benchmark_simple_calc, trace_memory)
+                                    for _ in range(repeat)])
+    return {'commit': _git_commit(),
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'repeat': repeat,
+            'full_calc': full_calc_results,
+            'simple_calc': simple_calc_results}
+
+
+def regressions(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """Compare two run_benchmarks() results, returning a list of (benchmark, phase, baseline
+    seconds, seconds) for every phase that's more than threshold times slower in results.
+    Full calc grid points that only appear in one of them are ignored."""
+    def _keyed(benchmarks):
+        keyed = {json.dumps(benchmark['runtime_constants'], sort_keys=True): benchmark
+                 for benchmark in benchmarks['full_calc']}
+        keyed['simple_calc'] = benchmarks['simple_calc']
+        return keyed
+
+    baseline_benchmarks = _keyed(baseline)
+    slower = []
+    for name, benchmark in _keyed(results).items():
+        if name not in baseline_benchmarks:
+            continue
+        for phase, seconds in benchmark['seconds'].items():
+            baseline_seconds = baseline_benchmarks[name]['seconds'].get(phase)
+            if baseline_seconds and seconds > baseline_seconds * threshold:
+                slower.append((name, phase, baseline_seconds, seconds))
+    return slower
+
+
+def _print_summary(results):
+    for benchmark in results['full_calc'] + [dict(results['simple_calc'],
+                                                  runtime_constants='simple_calc')]:
+        print(f"{benchmark['runtime_constants']}: "
+              f"peak RSS {benchmark['peak_rss_bytes'] / 2 ** 20:.0f}MiB")
+        for phase, seconds in benchmark['seconds'].items():
+            print(f'    {phase}: {seconds:.4g}s')
+
+
+def main():
+    """Command line interface - see the module docstring"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    for name, values in DEFAULT_GRID.items():
+        parser.add_argument(f'--{name.lower().replace("_", "-")}', dest=name, type=int, nargs='+',
+                            default=values, help=f'{name} values to benchmark (default: {values})')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Run each benchmark this many times and keep the fastest')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Also record each phase\'s peak Python allocations (slows every phase)')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slowdown ratio counted as a regression by --compare')
+
+    args = parser.parse_args()
+    results = run_benchmarks({name: getattr(args, name) for name in DEFAULT_GRID},
+                             repeat=args.repeat, trace_memory=args.trace_memory)
+    _print_summary(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(results, output, indent=2)
+        print(f'Saved results to {args.output}')
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            slower = regressions(json.load(baseline_file), results, args.threshold)
+        for name, phase, baseline_seconds, seconds in slower:
+            print(f'REGRESSION {name} {phase}: {baseline_seconds:.4g}s -> {seconds:.4g}s')
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
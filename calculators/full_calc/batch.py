@@ -0,0 +1,194 @@
+# pylint: disable=broad-except
+
+"""Evaluates the full chain for a stream of parameter sets, one JSON object per line, eg
+
+    {"id": "low-extinction", "params": {"perils.extinction.y_scale": 0.0001}}
+    {"params": {"perils": {"extinction": {"y_scale": 0.0002}}}, "runtime_constants": {"MAX_PLANETS": 5}}
+
+where params overrides the base params (params.yml, unless --params is given) in the same nested
+or dotted form as params.with_overrides(), runtime_constants overrides runtime_constants.py, and
+id is optional. Lines are read as they're needed and evaluated on a bounded pool of worker
+processes, and each result is written as soon as it's finished (so not necessarily in input order),
+either as a JSON line, with the input's line number and id, or as a run in the results store:
+
+    python -m calculators.full_calc.batch parameter_sets.jsonl --output results.jsonl
+    my_tool | python -m calculators.full_calc.batch - --store results.sqlite
+
+Lines that fail are reported as {"line": ..., "id": ..., "error": ...} and don't stop the batch.
+Each worker keeps the most recently used sub-chains (see sub_markov_chains.exit_probabilities_key),
+so lines that only differ in, eg, multiplanetary params don't re-solve their perils sub-chains. The
+caches aren't shared, and lines go to whichever worker is free, so a sub-chain can still be solved
+once by each worker whose lines need it - at most --workers times rather than once per line.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack, redirect_stdout
+import argparse
+import datetime
+import io
+import json
+import os
+import sys
+import traceback
+
+import yaml
+
+from calculators.full_calc import full_chain
+from calculators.full_calc import sub_markov_chains
+from calculators.full_calc.params import Params, parameter_hash, with_overrides
+from calculators.full_calc.results_store import ResultsStore, SUCCESS_PROBABILITY
+
+SUB_CHAIN_CACHE_SIZE = 1024 # Per worker; each entry is a handful of floats
+IN_FLIGHT_PER_WORKER = 2 # Enough to keep every worker busy without reading far ahead
+
+_WRAPPER_CLASSES = {'perils': sub_markov_chains.IntraPerilsMCWrapper,
+                    'multiplanetary': sub_markov_chains.IntraMultiplanetaryMCWrapper}
+
+_sub_chain_cache = OrderedDict() # Only this worker process's - see the module docstring
+
+
+def _cached_sub_chain(kind, k, params_dict, runtime_constants):
+    """The kind sub-chain for civilisation k, recreated from this worker's cache of exit
+    probabilities if possible"""
+    key = sub_markov_chains.exit_probabilities_key(kind, k, params_dict, runtime_constants)
+    if key in _sub_chain_cache:
+        _sub_chain_cache.move_to_end(key)
+        return _WRAPPER_CLASSES[kind](k, exit_probabilities=_sub_chain_cache[key])
+    chain = _WRAPPER_CLASSES[kind](k)
+    _sub_chain_cache[key] = chain.exit_probabilities()
+    if len(_sub_chain_cache) > SUB_CHAIN_CACHE_SIZE:
+        _sub_chain_cache.popitem(last=False)
+    return chain
+
+
+def evaluate(params_dict, runtime_constants):
+    """The success probabilities by state for params_dict and runtime_constants (which must give
+    every runtime constant), plus the runtime in seconds, reusing this process's cached
+    sub-chains and solving the reduced chain (see full_chain.reduced_success_probabilities()).
+    Like full_chain.run(), this changes the params and constants for the whole process."""
+    start = datetime.datetime.now()
+    full_chain.use_params(params_dict)
+    full_chain.use_runtime_constants(runtime_constants)
+    civilisation_range = range(runtime_constants['MAX_CIVILISATIONS'])
+    with redirect_stdout(io.StringIO()): # The sub-chains announce themselves as they're built
+        probabilities = full_chain.reduced_success_probabilities(
+            [_cached_sub_chain('perils', k, params_dict, runtime_constants)
+             for k in civilisation_range],
+            [_cached_sub_chain('multiplanetary', k, params_dict, runtime_constants)
+             for k in civilisation_range])
+    return {'success_probabilities': probabilities,
+            'runtime': (datetime.datetime.now() - start).total_seconds()}
+
+
+def _evaluate_line(params_dict, runtime_constants):
+    try:
+        return evaluate(params_dict, runtime_constants)
+    except Exception:
+        return {'error': traceback.format_exc()}
+
+
+def _parsed_lines(lines, base_params, base_runtime_constants):
+    """Yield (line number, id, params dict, runtime constants, error) for each non-blank line"""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            unknown_keys = set(request) - {'id', 'params', 'runtime_constants'}
+            if unknown_keys:
+                raise ValueError(f"Unknown keys: {', '.join(sorted(unknown_keys))}")
+            runtime_constants = {**base_runtime_constants, **request.get('runtime_constants', {})}
+            unknown_constants = set(runtime_constants) - set(full_chain.RUNTIME_CONSTANT_NAMES)
+            if unknown_constants:
+                raise ValueError(
+                    f"Unknown runtime constants: {', '.join(sorted(unknown_constants))}")
+            params_dict = with_overrides(base_params, request.get('params', {}))
+        except (ValueError, KeyError, AttributeError) as error:
+            yield line_number, request_id, None, None, f'{type(error).__name__}: {error}'
+            continue
+        yield line_number, request_id, params_dict, runtime_constants, None
+
+
+def run_batch(lines, emit, base_params=None, base_runtime_constants=None, max_workers=None):
+    """Evaluate every parameter set in lines (an iterable of JSON strings - see the module
+    docstring) on max_workers processes (default: one per CPU), calling
+    emit(line number, id, params dict, runtime constants, result) as each finishes, where result
+    is a full_chain.run()-style dict or {'error': ...}. Returns the number of lines evaluated."""
+    base_params = base_params if base_params is not None else Params().dictionary
+    base_runtime_constants = {**full_chain.current_runtime_constants(),
+                              **(base_runtime_constants or {})}
+    max_workers = max_workers or os.cpu_count()
+    in_flight = {}
+    evaluated = 0
+
+    def _emit_finished(block):
+        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED if block else ALL_COMPLETED,
+                           timeout=None if block else 0)
+        for future in finished:
+            emit(*in_flight.pop(future), future.result())
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for line_number, request_id, params_dict, runtime_constants, error in _parsed_lines(
+                lines, base_params, base_runtime_constants):
+            evaluated += 1
+            if error:
+                emit(line_number, request_id, params_dict, runtime_constants, {'error': error})
+                continue
+            future = executor.submit(_evaluate_line, params_dict, runtime_constants)
+            in_flight[future] = (line_number, request_id, params_dict, runtime_constants)
+            _emit_finished(block=len(in_flight) >= max_workers * IN_FLIGHT_PER_WORKER)
+        while in_flight:
+            _emit_finished(block=True)
+    return evaluated
+
+
+def main():
+    """Command line interface - see the module docstring"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="JSONL file of parameter sets, or - for stdin")
+    parser.add_argument('--params', help='YAML file of base params (default: params.yml)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    destination = parser.add_mutually_exclusive_group()
+    destination.add_argument('--output', help='Write results to this JSONL file (default: stdout)')
+    destination.add_argument('--store', help='Add results as runs in this results store instead')
+    args = parser.parse_args()
+
+    base_params = None
+    if args.params:
+        with open(args.params, 'r', encoding='utf-8') as stream:
+            base_params = yaml.safe_load(stream)
+    store = ResultsStore(args.store) if args.store else None
+    failures = []
+
+    def emit(line_number, request_id, params_dict, runtime_constants, result):
+        if 'error' in result:
+            failures.append(line_number)
+        if store and 'error' not in result:
+            store.add_run(params_dict, runtime_constants,
+                          {SUCCESS_PROBABILITY: result['success_probabilities']},
+                          runtime=result['runtime'], description=request_id or '',
+                          source=f'batch:{args.input}:{line_number}')
+            return
+        record = {'line': line_number, 'id': request_id, **result}
+        if 'error' not in result:
+            record['param_hash'] = parameter_hash(params_dict, runtime_constants)
+        (sys.stderr if store else output).write(json.dumps(record) + '\n')
+        (sys.stderr if store else output).flush()
+
+    with ExitStack() as stack:
+        output = (stack.enter_context(open(args.output, 'w', encoding='utf-8')) if args.output
+                  else sys.stdout)
+        lines = (sys.stdin if args.input == '-'
+                 else stack.enter_context(open(args.input, 'r', encoding='utf-8')))
+        evaluated = run_batch(lines, emit, base_params, max_workers=args.workers)
+    print(f'Evaluated {evaluated} parameter sets, {len(failures)} of which failed', file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Bundles of a full calc run's solved chains, for querying later without recomputing them.
+
+A bundle is a directory of uncompressed .npy files - the full chain's transition matrix and
+absorption probabilities, each sub-chain's transition matrix and exit probabilities, and the success
+probabilities by state - plus a manifest of the params, runtime constants and the state names
+labelling each axis of each array. Reloading one memory maps the arrays, so even multi-GB matrices
+are available at once, and only the parts actually queried are read from disk:
+
+    from calculators.full_calc.bundle import Bundle
+    bundle = Bundle('my_run')
+    bundle.entry('full_absorption_probabilities', 'Interstellar', 'preindustrial-1')
+    bundle['perils-0_transition_matrix'][70, 71]
+
+Write one from full_calc.py with --export <directory>.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from calculators.full_calc.params import parameter_hash
+
+MANIFEST = 'manifest.json'
+
+
+def can_write_bundle(directory):
+    """Whether write_bundle() would write to directory - ie nothing's there yet, or a bundle is"""
+    return (not os.path.lexists(directory)
+            or os.path.isfile(os.path.join(directory, MANIFEST)))
+
+
+def write_bundle(directory, params_dict, runtime_constants, probabilities, mc=None,
+                 perils_chains=(), multiplanetary_chains=()):
+    """Write a bundle to directory, replacing any bundle already there, given a run's params
+    (structured like params.yml), runtime constants, success probabilities by state and, if there
+    are any, its full Markov chain and solved sub-chains. Sub-chains recreated from checkpoints
+    have no transition matrix to write, so only their exit probabilities are written. Raises
+    FileExistsError if directory exists but isn't a bundle, rather than replace it.
+
+    The bundle is written to a temporary directory alongside, and swapped in by renaming any
+    previous bundle aside first, so a crash mid-write never leaves a partial bundle in directory,
+    and a failed swap puts the previous bundle back."""
+    if not can_write_bundle(directory):
+        raise FileExistsError(f"{directory} already exists and isn't a bundle, so won't be "
+                              "replaced - export to a new directory instead")
+    replacing = os.path.lexists(directory)
+    absolute_directory = os.path.abspath(directory)
+    staging_directory = tempfile.mkdtemp(prefix=f'.{os.path.basename(absolute_directory)}.',
+                                         suffix='.partial',
+                                         dir=os.path.dirname(absolute_directory))
+    new_directory = os.path.join(staging_directory, 'bundle')
+    previous_directory = os.path.join(staging_directory, 'previous')
+    try:
+        os.makedirs(new_directory)
+        _write_arrays(new_directory, params_dict, runtime_constants, probabilities, mc,
+                      perils_chains, multiplanetary_chains)
+    except BaseException:
+        shutil.rmtree(staging_directory, ignore_errors=True)
+        raise
+
+    if replacing:
+        os.replace(directory, previous_directory)
+    try:
+        os.replace(new_directory, directory)
+    except OSError:
+        if replacing:
+            os.replace(previous_directory, directory)
+        shutil.rmtree(staging_directory, ignore_errors=True)
+        raise
+    shutil.rmtree(staging_directory, ignore_errors=True)
+
+
+def _write_arrays(directory, params_dict, runtime_constants, probabilities, mc, perils_chains,
+                  multiplanetary_chains):
+    labels = {}
+
+    def _write(name, array, rows, columns=None):
+        np.save(os.path.join(directory, f'{name}.npy'), np.asarray(array))
+        labels[name] = {'rows': list(rows), 'columns': list(columns) if columns else None}
+
+    _write('success_probabilities', list(probabilities.values()), probabilities)
+    if mc is not None:
+        absorbing_states = list(mc.absorbing_states)
+        transient_states = [state for state in mc.states if state not in absorbing_states]
+        _write('full_transition_matrix', mc.p, mc.states, mc.states)
+        _write('full_absorption_probabilities', mc.absorption_probabilities(), absorbing_states,
+               transient_states)
+    for kind, chains in (('perils', perils_chains), ('multiplanetary', multiplanetary_chains)):
+        for k, chain in enumerate(chains):
+            if chain.mc is not None:
+                _write(f'{kind}-{k}_transition_matrix', chain.mc.p, chain.mc.states,
+                       chain.mc.states)
+            columns = (['from year 0', f'from year {chain.starting_year}'] if kind == 'perils'
+                       else None)
+            _write(f'{kind}-{k}_exit_probabilities', chain.exit_probabilities(),
+                   chain.EXIT_STATES, columns)
+
+    manifest = {'param_hash': parameter_hash(params_dict, runtime_constants),
+                'params': params_dict,
+                'runtime_constants': runtime_constants,
+                'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'arrays': labels}
+    with open(os.path.join(directory, MANIFEST), 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+class Bundle:
+    """A bundle written by write_bundle(), whose arrays are memory mapped (read-only) as they're
+    first accessed, by name, eg bundle['full_transition_matrix']"""
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+        self.param_hash = manifest['param_hash']
+        self.params = manifest['params']
+        self.runtime_constants = manifest['runtime_constants']
+        self.created_at = manifest['created_at']
+        self.labels = manifest['arrays']
+        self._arrays = {}
+
+    def names(self):
+        """The names of the bundle's arrays"""
+        return list(self.labels)
+
+    def __getitem__(self, name):
+        if name not in self.labels:
+            raise KeyError(f"No array called {name} in the bundle at {self.directory}")
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.directory, f'{name}.npy'),
+                                         mmap_mode='r')
+        return self._arrays[name]
+
+    def entry(self, name, row, column=None):
+        """The entry of the named array labelled row (and column, for a 2D array), eg
+        entry('full_transition_matrix', 'perils-0', 'multiplanetary-0')"""
+        index = self.labels[name]['rows'].index(row)
+        if column is None:
+            return self[name][index]
+        return self[name][index, self.labels[name]['columns'].index(column)]
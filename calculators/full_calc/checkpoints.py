@@ -0,0 +1,99 @@
+"""Checkpoints of the solved sub-chains of a full calc run, so that an interrupted run can resume
+without re-solving them.
+
+Each time of perils and multiplanetary sub-chain is only needed by the full chain for its exit
+probabilities (see sub_markov_chains.py), so those are written to disk as each sub-chain is solved,
+in a directory per parameter hash containing a manifest of the params and runtime constants. Every
+file is written to a temporary name and then atomically renamed, so concurrent runs with the same
+params (which compute identical values) never see a partial file, and a crash mid-write leaves no
+corrupt checkpoint behind.
+"""
+
+from contextlib import suppress
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc.params import parameter_hash
+
+CHECKPOINT_DIRECTORY = 'full_calc_checkpoints'
+MANIFEST = 'manifest.json'
+
+
+class CheckpointStore:
+    """Reads and writes the sub-chain checkpoints for one set of params (structured like params.yml)
+    and runtime constants. Unless resume is set, existing checkpoints are never read, only
+    overwritten."""
+    def __init__(self, params_dict, runtime_constants, directory=CHECKPOINT_DIRECTORY,
+                 resume=False):
+        # The perils sub-chains also depend on the regression window, which isn't one of the
+        # runtime constants a run can override, so it's hashed and recorded alongside them
+        runtime_constants = {**runtime_constants, 'MAX_PROGRESS_YEAR_REGRESSION_STEPS':
+                             constant.MAX_PROGRESS_YEAR_REGRESSION_STEPS}
+        self.param_hash = parameter_hash(params_dict, runtime_constants)
+        self.directory = os.path.join(directory, self.param_hash)
+        self.resume = resume
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = {'param_hash': self.param_hash,
+                    'params': params_dict,
+                    'runtime_constants': runtime_constants,
+                    'created_at': datetime.datetime.now().isoformat(timespec='seconds')}
+        if self._read_manifest() is None:
+            self._write_atomically(MANIFEST, lambda file: file.write(
+                json.dumps(manifest, indent=2).encode('utf-8')))
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST), 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return None
+        if manifest.get('param_hash') != self.param_hash:
+            raise ValueError(f"The checkpoints in {self.directory} are for different params "
+                             f"(hash {manifest.get('param_hash')}) - delete them to start afresh")
+        return manifest
+
+    def _path(self, kind, k):
+        return os.path.join(self.directory, f'{kind}-{k}.npz')
+
+    def _write_atomically(self, name, write):
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, prefix=f'.{name}.')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as file:
+                write(file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, os.path.join(self.directory, name))
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.remove(temporary_path)
+            raise
+
+    def save(self, kind, k, exit_probabilities):
+        """Checkpoint the exit probabilities of the kind ('perils' or 'multiplanetary') sub-chain
+        for civilisation k"""
+        self._write_atomically(os.path.basename(self._path(kind, k)), lambda file: np.savez(
+            file, exit_probabilities=exit_probabilities, param_hash=np.array(self.param_hash)))
+
+    def load(self, kind, k):
+        """The checkpointed exit probabilities of the kind sub-chain for civilisation k, or None if
+        there aren't any (or resume isn't set). Raises ValueError if the checkpoint was written for
+        different params."""
+        if not self.resume:
+            return None
+        try:
+            with np.load(self._path(kind, k)) as checkpoint:
+                if checkpoint['param_hash'].item() != self.param_hash:
+                    raise ValueError(f"{self._path(kind, k)} is a checkpoint for different params")
+                return checkpoint['exit_probabilities']
+        except FileNotFoundError:
+            return None
+
+    def clear(self):
+        """Delete every checkpoint for these params, eg once their results have been saved"""
+        shutil.rmtree(self.directory, ignore_errors=True)
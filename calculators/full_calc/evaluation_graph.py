@@ -0,0 +1,141 @@
+"""A dependency-tracked evaluation of the full calc for live sessions (eg a notebook or the full
+calculator page), in which changing a param only recomputes what depends on it:
+
+    graph = EvaluationGraph(runtime_constants={'MAX_PROGRESS_YEARS': 1000})
+    graph.success_probabilities() # Solves everything
+    graph.update({'preperils.industrial.stretch_per_reboot': 1.5})
+    graph.success_probabilities() # Only re-solves the top-level chain
+    graph.recomputed # ['reduced_solve']
+
+The evaluation is a graph of nodes:
+
+- the compiled coefficients of each perils-k transition (see perils.compiled_transition_parameters),
+  each depending only on the params of its target state (and the current_perils_ overrides only for
+  k = 0)
+- each perils-k sub-chain's exit probabilities, depending on its coefficients, the progress year
+  params and the runtime constants that shape it
+- the multiplanetary sub-chain's exit probabilities (the same for every k), depending on the
+  multiplanetary params and MAX_PLANETS
+- the top-level success probabilities, from the reduced chain (see
+  full_chain.reduced_success_probabilities()), depending on the sub-chains' exit probabilities and
+  the preperils params
+
+Every node is memoised by a hash of its inputs - for the sub-chains and the top-level solve, the
+values of the nodes they depend on, rather than the params behind them - so an edit that leaves a
+node's inputs unchanged, eg one that only affects other civilisations' coefficients, reuses it and
+everything it feeds. Only a bounded number of the most recently used node values are kept.
+"""
+
+from collections import OrderedDict
+from contextlib import redirect_stdout
+import io
+
+import numpy as np
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc import full_chain
+from calculators.full_calc import perils
+from calculators.full_calc import sub_markov_chains
+from calculators.full_calc.params import Params, parameter_hash, with_overrides
+
+CACHE_SIZE = 1024 # Node values; each is at most a handful of floats per state
+
+
+class EvaluationGraph:
+    """The params (structured like params.yml) and runtime constants of a live session, with the
+    memoised nodes evaluated for them so far. Like full_chain.run(), evaluating it changes the params
+    and constants used by every full calc module for the rest of the process."""
+    def __init__(self, params_dict=None, runtime_constants=None, cache_size=CACHE_SIZE):
+        self.params = params_dict if params_dict is not None else Params().dictionary
+        self.runtime_constants = {}
+        self.cache_size = cache_size
+        self.recomputed = [] # The names of the nodes computed by the last evaluation
+        self._values = OrderedDict() # Node hash to value, least recently used first
+        self.update(runtime_constants=full_chain.current_runtime_constants())
+        self.update(runtime_constants=runtime_constants)
+
+    def update(self, overrides=None, runtime_constants=None):
+        """Change some of the params, given in any form params.with_overrides() accepts, and/or
+        runtime constants. Nothing is recomputed until the next evaluation."""
+        unknown_constants = set(runtime_constants or {}) - set(full_chain.RUNTIME_CONSTANT_NAMES)
+        if unknown_constants:
+            raise ValueError(f"Unknown runtime constants: {', '.join(sorted(unknown_constants))}")
+        if overrides:
+            self.params = with_overrides(self.params, overrides)
+        self.runtime_constants = {**self.runtime_constants, **(runtime_constants or {})}
+
+    def success_probabilities(self):
+        """An ordered dict of the probability of eventually becoming interstellar from each
+        transient state of the full chain (in the same order as full_chain.success_probabilities()),
+        recomputing only the nodes whose inputs have changed since they were last evaluated"""
+        self.recomputed = []
+        full_chain.use_params(self.params)
+        full_chain.use_runtime_constants(self.runtime_constants)
+        civilisation_range = range(self.runtime_constants['MAX_CIVILISATIONS'])
+
+        perils_nodes = [self._perils_chain(k) for k in civilisation_range]
+        multiplanetary_node = self._multiplanetary_chain()
+        inputs = {'perils': [node_hash for node_hash, _ in perils_nodes],
+                  'multiplanetary': multiplanetary_node[0],
+                  'preperils': self.params['preperils'],
+                  'MAX_CIVILISATIONS': self.runtime_constants['MAX_CIVILISATIONS']}
+
+        def _solve():
+            return full_chain.reduced_success_probabilities(
+                [sub_markov_chains.IntraPerilsMCWrapper(k, exit_probabilities=exit_probabilities)
+                 for k, (_, exit_probabilities) in zip(civilisation_range, perils_nodes)],
+                [sub_markov_chains.IntraMultiplanetaryMCWrapper(
+                    k, exit_probabilities=multiplanetary_node[1]) for k in civilisation_range])
+
+        return self._evaluated('reduced_solve', inputs, _solve)[1].copy()
+
+    def _evaluated(self, name, inputs, compute):
+        """The (hash, value) of the node called name with inputs (anything JSON serialisable),
+        computing its value if it isn't memoised"""
+        node_hash = parameter_hash({'node': name, 'inputs': inputs}, {})
+        if node_hash in self._values:
+            self._values.move_to_end(node_hash)
+        else:
+            self.recomputed.append(name)
+            self._values[node_hash] = compute()
+            if len(self._values) > self.cache_size:
+                self._values.popitem(last=False)
+        return node_hash, self._values[node_hash]
+
+    def _perils_coefficients(self, k, target_state):
+        target_params = self.params['perils'][target_state]
+        if k:
+            # The current_perils_ values only apply to our current time of perils
+            target_params = {key: value for key, value in target_params.items()
+                             if not key.startswith('current_perils_')}
+        return self._evaluated(f'perils-{k} {target_state} coefficients',
+                               {'k': k, 'params': target_params},
+                               lambda: perils.compiled_transition_parameters(k, target_state))
+
+    def _perils_chain(self, k):
+        coefficients = [self._perils_coefficients(k, target_state)[1]
+                        for target_state in sub_markov_chains.IntraPerilsMCWrapper.EXIT_STATES]
+        inputs = {'k': k,
+                  'coefficients': [[getattr(values, name) for name in values.__slots__]
+                                   for values in coefficients],
+                  'progress_year_n': self.params['perils']['progress_year_n'],
+                  'current_progress_year': self.params['perils']['current_progress_year'],
+                  'MAX_PROGRESS_YEARS': self.runtime_constants['MAX_PROGRESS_YEARS'],
+                  'MAX_PROGRESS_YEAR_REGRESSION_STEPS':
+                      constant.MAX_PROGRESS_YEAR_REGRESSION_STEPS}
+        return self._evaluated(f'perils-{k} sub-chain', inputs,
+                               lambda: _exit_probabilities(sub_markov_chains.IntraPerilsMCWrapper,
+                                                           k))
+
+    def _multiplanetary_chain(self):
+        # Only how we leave a multiplanetary state depends on k, so one chain does for every k
+        inputs = {'params': self.params['multiplanetary'],
+                  'MAX_PLANETS': self.runtime_constants['MAX_PLANETS']}
+        return self._evaluated(
+            'multiplanetary sub-chain', inputs,
+            lambda: _exit_probabilities(sub_markov_chains.IntraMultiplanetaryMCWrapper, 0))
+
+
+def _exit_probabilities(wrapper_class, k):
+    with redirect_stdout(io.StringIO()): # The sub-chains announce themselves as they're built
+        return np.array(wrapper_class(k).exit_probabilities())
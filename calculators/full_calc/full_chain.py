@@ -0,0 +1,316 @@
+# pylint: disable=line-too-long, fixme, too-many-locals
+
+"""The full Markov chain, plus helpers to evaluate it for a given set of params and runtime constants
+without going through the full_calc.py script."""
+
+from collections import OrderedDict
+import datetime
+
+import numpy as np
+from pydtmc import MarkovChain
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc import multiplanetary
+from calculators.full_calc import perils
+from calculators.full_calc import preperils
+from calculators.full_calc import sub_markov_chains
+from calculators.full_calc import tracing
+from calculators.full_calc import validation
+from calculators.full_calc.model_spec import StateFamily, Transition, compile_model
+from calculators.full_calc.params import Params
+
+RUNTIME_CONSTANT_NAMES = ('MAX_PLANETS', 'MAX_CIVILISATIONS', 'MAX_PROGRESS_YEARS')
+
+def full_markov_chain(progress=None, perils_chains=None, multiplanetary_chains=None,
+                      checkpoints=None):
+    """Wrapper for a pydtmc Markov chain that implements the full decay/perils-focused/multiplanetary
+    model as described here: https://forum.effectivealtruism.org/s/gWsTMm5Nbgdxedyns/p/YnBwoNNqe6knBJH8p
+
+    If given, progress is called as progress(completed_steps, total_steps) each time one of the
+    sub-chains has been solved. perils_chains and multiplanetary_chains can supply already-solved
+    sub-chains for each k (anything indexable by k), in which case they aren't rebuilt. If given
+    a checkpoints.CheckpointStore, each sub-chain is checkpointed as it's solved, or restored from
+    its checkpoint instead if the store is resuming.
+
+    Building and solving each sub-chain, and assembling the full chain, are recorded as tracing
+    spans (see tracing.py)."""
+    if perils_chains is None or multiplanetary_chains is None:
+        solved_perils_chains, solved_multiplanetary_chains = solved_sub_chains(
+            progress, checkpoints, perils=perils_chains is None,
+            multiplanetary=multiplanetary_chains is None)
+        perils_chains = perils_chains if perils_chains is not None else solved_perils_chains
+        multiplanetary_chains = (multiplanetary_chains if multiplanetary_chains is not None
+                                 else solved_multiplanetary_chains)
+    with tracing.span('full_assembly'):
+        return _assembled_markov_chain(perils_chains, multiplanetary_chains)
+
+
+def solved_sub_chains(progress=None, checkpoints=None, perils=True, multiplanetary=True):
+    """Lists of the solved time of perils and multiplanetary sub-chains for each k (either of which
+    is None if not requested), with progress and checkpoints as for full_markov_chain()"""
+    total_steps = (perils + multiplanetary) * constant.MAX_CIVILISATIONS
+    completed_steps = []
+
+    def _report_progress():
+        completed_steps.append(1)
+        if progress:
+            progress(len(completed_steps), total_steps)
+
+    civilisation_range = range(0, constant.MAX_CIVILISATIONS)
+    perils_chains = [_solved_sub_chain('perils', sub_markov_chains.IntraPerilsMCWrapper, k,
+                                       _report_progress, checkpoints)
+                     for k in civilisation_range] if perils else None
+    multiplanetary_chains = [_solved_sub_chain('multiplanetary',
+                                               sub_markov_chains.IntraMultiplanetaryMCWrapper, k,
+                                               _report_progress, checkpoints)
+                             for k in civilisation_range] if multiplanetary else None
+    return perils_chains, multiplanetary_chains
+
+
+def _solved_sub_chain(kind, wrapper_class, k, report_progress, checkpoints=None):
+    """Create and solve the time of perils or multiplanetary sub-chain for civilisation k, or
+    restore it from checkpoints"""
+    exit_probabilities = checkpoints.load(kind, k) if checkpoints else None
+    if exit_probabilities is not None:
+        with tracing.span(f'{kind}_restore', k=k):
+            chain = wrapper_class(k, exit_probabilities=exit_probabilities)
+    else:
+        with tracing.span(f'{kind}_build', k=k):
+            chain = wrapper_class(k)
+        with tracing.span(f'{kind}_solve', k=k):
+            exit_probabilities = chain.exit_probabilities()
+        if checkpoints:
+            checkpoints.save(kind, k, exit_probabilities)
+    report_progress()
+    return chain
+
+
+def full_model(perils_chains, multiplanetary_chains):
+    """The declarative description of the full chain (see model_spec.py), given solved perils and
+    multiplanetary sub-chains for each k"""
+    preperils_civilisation_range = range(1, constant.MAX_CIVILISATIONS)
+    modern_civilisation_range = range(0, constant.MAX_CIVILISATIONS)
+    return [
+        StateFamily('preindustrial', preperils_civilisation_range, [
+            Transition('industrial', 0, lambda k: preperils.industrial_given_preindustrial(k, k)),
+            Transition('Extinction', None, preperils.extinction_given_preindustrial)]),
+        StateFamily('industrial', preperils_civilisation_range, [
+            Transition('perils', 0, lambda k: preperils.perils_given_industrial(k, k)),
+            Transition('Extinction', None, preperils.extinction_given_industrial)]),
+        # TODO: allow transition to perils k+1
+        StateFamily('perils', modern_civilisation_range, [
+            Transition('preindustrial', 1,
+                       lambda k: perils_chains[k].preindustrial_given_perils(k + 1)),
+            Transition('industrial', 1, lambda k: perils_chains[k].industrial_given_perils(k + 1)),
+            Transition('multiplanetary', 0,
+                       lambda k: perils_chains[k].multiplanetary_given_perils(k)),
+            Transition('Extinction', None, lambda k: perils_chains[k].extinction_given_perils()),
+            Transition('Interstellar', None,
+                       lambda k: perils_chains[k].interstellar_given_perils())]),
+        StateFamily('multiplanetary', modern_civilisation_range, [
+            Transition('preindustrial', 1,
+                       lambda k: multiplanetary_chains[k].preindustrial_given_multiplanetary(k + 1)),
+            Transition('industrial', 1,
+                       lambda k: multiplanetary_chains[k].industrial_given_multiplanetary(k + 1)),
+            Transition('perils', 1,
+                       lambda k: multiplanetary_chains[k].perils_given_multiplanetary(k + 1)),
+            Transition('Extinction', None,
+                       lambda k: multiplanetary_chains[k].extinction_given_multiplanetary()),
+            Transition('Interstellar', None,
+                       lambda k: multiplanetary_chains[k].interstellar_given_multiplanetary())])]
+
+
+def _assembled_markov_chain(perils_chains, multiplanetary_chains):
+    """The full Markov chain, given solved perils and multiplanetary sub-chains for each k"""
+    model = compile_model(full_model(perils_chains, multiplanetary_chains),
+                          ['Extinction', 'Interstellar'])
+    return MarkovChain(validation.validated(model.transition_matrix(), model.states, 'full chain'),
+                       model.states)
+
+
+def reduced_success_probabilities(perils_chains, multiplanetary_chains):
+    """The same as success_probabilities(full_markov_chain(...)) for the given solved sub-chains,
+    but solved without building the full chain.
+
+    Every preindustrial-k state's only transient successor is industrial-k, and every industrial-k
+    state's is perils-k, so the preperils states can be eliminated: a transition into
+    preindustrial-k or industrial-k is folded into one straight to perils-k, scaled by the
+    probability of getting there (the rest goes to Extinction, which we don't need to track). That
+    leaves only the perils and multiplanetary states to solve for, after which each preperils
+    state's success probability is its probability of reaching perils-k times perils-k's."""
+    civilisations = constant.MAX_CIVILISATIONS
+    preperils_civilisation_range = range(1, civilisations)
+    # Probabilities of eventually reaching perils-k from industrial-k and preindustrial-k, indexed
+    # by k (there are no preperils states for k=0)
+    perils_given_industrial = np.zeros(civilisations)
+    perils_given_preindustrial = np.zeros(civilisations)
+    for k in preperils_civilisation_range:
+        perils_given_industrial[k] = preperils.perils_given_industrial(k, k)
+        perils_given_preindustrial[k] = (preperils.industrial_given_preindustrial(k, k)
+                                         * perils_given_industrial[k])
+
+    # Rows 0..civilisations-1 are the perils states, the rest the multiplanetary states
+    transitions = np.zeros((2 * civilisations, 2 * civilisations))
+    interstellar = np.zeros(2 * civilisations)
+    for k in range(0, civilisations):
+        perils_row = transitions[k]
+        multiplanetary_row = transitions[civilisations + k]
+        for k1 in preperils_civilisation_range:
+            perils_row[k1] += (
+                perils_chains[k].preindustrial_given_perils(k1) * perils_given_preindustrial[k1]
+                + perils_chains[k].industrial_given_perils(k1) * perils_given_industrial[k1])
+            multiplanetary_row[k1] += (
+                multiplanetary_chains[k].preindustrial_given_multiplanetary(k1)
+                * perils_given_preindustrial[k1]
+                + multiplanetary_chains[k].industrial_given_multiplanetary(k1)
+                * perils_given_industrial[k1])
+        for k1 in range(0, civilisations):
+            perils_row[civilisations + k1] += perils_chains[k].multiplanetary_given_perils(k1)
+            multiplanetary_row[k1] += multiplanetary_chains[k].perils_given_multiplanetary(k1)
+        interstellar[k] = perils_chains[k].interstellar_given_perils()
+        interstellar[civilisations + k] = multiplanetary_chains[k].interstellar_given_multiplanetary()
+
+    # Success probabilities x satisfy x = transitions @ x + interstellar
+    modern_success = np.linalg.solve(np.identity(2 * civilisations) - transitions, interstellar)
+    perils_success = modern_success[:civilisations]
+    return OrderedDict(
+        [(f'preindustrial-{k}', perils_given_preindustrial[k] * perils_success[k])
+         for k in preperils_civilisation_range]
+        + [(f'industrial-{k}', perils_given_industrial[k] * perils_success[k])
+           for k in preperils_civilisation_range]
+        + [(f'perils-{k}', perils_success[k]) for k in range(0, civilisations)]
+        + [(f'multiplanetary-{k}', modern_success[civilisations + k])
+           for k in range(0, civilisations)])
+
+
+def reboot_distribution(perils_chains, multiplanetary_chains):
+    """The probabilities, starting from perils-0, of becoming interstellar and of going extinct in
+    each civilisation k - ie after exactly k reboots - as a dict of 'interstellar' and 'extinction'
+    to a list indexed by k, given solved perils and multiplanetary sub-chains for each k.
+
+    A civilisation can only ever be followed by the next one, so this is a single forward sweep
+    over them, carrying the probability of reaching each time of perils from the last."""
+    civilisations = constant.MAX_CIVILISATIONS
+    interstellar = [0] * civilisations
+    extinction = [0] * civilisations
+    perils_probability = 1 # Of reaching perils-k
+    for k in range(0, civilisations):
+        perils_chain = perils_chains[k]
+        multiplanetary_chain = multiplanetary_chains[k]
+        multiplanetary_probability = perils_probability * perils_chain.multiplanetary_given_perils(k)
+        interstellar[k] += (
+            perils_probability * perils_chain.interstellar_given_perils()
+            + multiplanetary_probability * multiplanetary_chain.interstellar_given_multiplanetary())
+        extinction[k] += (
+            perils_probability * perils_chain.extinction_given_perils()
+            + multiplanetary_probability * multiplanetary_chain.extinction_given_multiplanetary())
+        if k + 1 >= civilisations:
+            break # The wrappers already count regressing from here as extinction
+
+        # Then the next civilisation's preperils states, if we regressed that far
+        preindustrial_probability = (
+            perils_probability * perils_chain.preindustrial_given_perils(k + 1)
+            + multiplanetary_probability
+            * multiplanetary_chain.preindustrial_given_multiplanetary(k + 1))
+        industrial_probability = (
+            perils_probability * perils_chain.industrial_given_perils(k + 1)
+            + multiplanetary_probability * multiplanetary_chain.industrial_given_multiplanetary(k + 1)
+            + preindustrial_probability * preperils.industrial_given_preindustrial(k + 1, k + 1))
+        extinction[k + 1] += (
+            preindustrial_probability * preperils.extinction_given_preindustrial(k + 1)
+            + industrial_probability * preperils.extinction_given_industrial(k + 1))
+        perils_probability = (
+            industrial_probability * preperils.perils_given_industrial(k + 1, k + 1)
+            + multiplanetary_probability * multiplanetary_chain.perils_given_multiplanetary(k + 1))
+    return {'interstellar': interstellar, 'extinction': extinction}
+
+
+def use_params(params_dict):
+    """Make every full calc module use params_dict (structured like params.yml) rather than the
+    params they loaded from params.yml on import"""
+    perils.params = params_dict['perils']
+    multiplanetary.params = params_dict['multiplanetary']
+    preperils.params = Params(params_dict).preperils
+    perils.compiled_transition_parameters.cache_clear()
+
+
+def use_runtime_constants(runtime_constants):
+    """Override any of the RUNTIME_CONSTANT_NAMES values set in runtime_constants.py, given as a dict
+    of name to value"""
+    for name, value in runtime_constants.items():
+        if name not in RUNTIME_CONSTANT_NAMES:
+            raise ValueError(f"Unknown runtime constant: {name}")
+        setattr(constant, name, value)
+
+
+def current_runtime_constants():
+    """The runtime constants currently in use, as a dict of name to value"""
+    return {name: getattr(constant, name) for name in RUNTIME_CONSTANT_NAMES}
+
+
+def success_probabilities(mc):
+    """An ordered dict of the probability of eventually becoming interstellar from each transient
+    state of the full Markov chain, keyed by state name"""
+    return OrderedDict(
+        (state, mc.absorption_probabilities()[1][mc.states.index(state)])
+        for state in mc.states if state not in ('Extinction', 'Interstellar'))
+
+
+def expected_visits(mc, states=None, start='perils-0'):
+    """An ordered dict of the expected number of times the full Markov chain is in each of states
+    (default: every transient state) before it's absorbed, starting from start (which counts as a
+    visit to it), or if start is None, starting from each of states itself.
+
+    These are entries of the fundamental matrix (I - Q)^-1, where Q is the transitions between
+    transient states - from start, the row N[start] solves (I - Q)^T x = e_start, and otherwise
+    each diagonal entry N[j, j] is the jth entry of the solution of (I - Q) x = e_j - so rather
+    than inverting I - Q we make one solve, or one per requested state. Since the latter for every
+    state would amount to inverting it, states must be given if start is None."""
+    if start is None and states is None:
+        raise ValueError("Give the states to find return visits to - finding them for every state "
+                         "would need the whole fundamental matrix")
+    transient_states = [state for state in mc.states if state not in ('Extinction', 'Interstellar')]
+    states = transient_states if states is None else list(states)
+    indices = [transient_states.index(state) for state in states]
+    transient_indices = [mc.states.index(state) for state in transient_states]
+    # I - Q, adding 1s to the diagonal in place rather than building an identity matrix
+    fundamental_inverse = -mc.p[np.ix_(transient_indices, transient_indices)]
+    fundamental_inverse[np.diag_indices(len(transient_states))] += 1
+    if start is None:
+        unit_vectors = np.zeros((len(transient_states), len(indices)))
+        unit_vectors[indices, range(len(indices))] = 1
+        visits = np.linalg.solve(fundamental_inverse, unit_vectors)[indices, range(len(indices))]
+    else:
+        unit_vector = np.zeros(len(transient_states))
+        unit_vector[transient_states.index(start)] = 1
+        visits = np.linalg.solve(fundamental_inverse.T, unit_vector)[indices]
+    return OrderedDict(zip(states, visits.tolist()))
+
+
+def run(params_dict=None, runtime_constants=None, progress=None, checkpoints=None, reduced=False):
+    """Evaluate the full chain for params_dict (defaulting to params.yml) and runtime_constants (a
+    dict overriding some or all of runtime_constants.py), returning a dict of the success
+    probabilities by state, the runtime in seconds and the tracing spans of the run (see
+    tracing.py). checkpoints is passed to full_markov_chain(). If reduced is set, the success
+    probabilities come from reduced_success_probabilities() instead of the full chain.
+
+    This changes the params and constants used by every full calc module for the rest of the
+    process, so run it in a process of its own if anything else is using them."""
+    tracer = tracing.Tracer()
+    with tracing.tracing(tracer):
+        use_params(params_dict if params_dict is not None else Params().dictionary)
+        use_runtime_constants(runtime_constants or {})
+
+        start = datetime.datetime.now()
+        if reduced:
+            perils_chains, multiplanetary_chains = solved_sub_chains(progress, checkpoints)
+            with tracing.span('reduced_solve'):
+                probabilities = reduced_success_probabilities(perils_chains,
+                                                              multiplanetary_chains)
+        else:
+            mc = full_markov_chain(progress=progress, checkpoints=checkpoints)
+            with tracing.span('full_solve'):
+                probabilities = success_probabilities(mc)
+    return {'success_probabilities': probabilities,
+            'runtime': (datetime.datetime.now() - start).total_seconds(),
+            'spans': tracer.spans}
@@ -4,6 +4,8 @@
 
 import math
 
+import numpy as np
+
 # TODO simplify these functions if possible
 
 def sigmoid_curved_risk(
@@ -47,6 +49,24 @@ def sigmoid_curved_risk(
 
     return y_scale /  (1 + modified_x_value ** -sharpness * math.e ** -(modified_x_value))
 
+def sigmoid_curved_risks(x, x_scale, y_scale, x_translation, sharpness=2):
+    """Array version of sigmoid_curved_risk. All arguments broadcast against each other, so eg
+    passing an array of progress years with an array of x_scales shaped as a column (one per k)
+    gives the whole grid in one call. Returns a float array of the broadcast shape."""
+    x, x_scale, y_scale, x_translation, sharpness = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (x, x_scale, y_scale, x_translation, sharpness)))
+
+    translated_x = x - x_translation
+    modified_x_value = 1 / x_scale * translated_x
+    climbing = (translated_x != 0) & (modified_x_value >= 0) # Everywhere else is the 0 branch of
+    # the scalar version
+
+    risks = np.zeros(x.shape)
+    modified_x_value = modified_x_value[climbing]
+    risks[climbing] = y_scale[climbing] / (
+        1 + modified_x_value ** -sharpness[climbing] * math.e ** -modified_x_value)
+    return risks
+
 def exponentially_decaying_risk(x, starting_value, decay_rate, min_probability=0, x_translation=2):
     """The simplest way I can think of to intuit the various risks given multiple interplanetary
     settlements is as an exponential decay based on the number of planets.
@@ -68,3 +88,28 @@ def exponentially_decaying_risk(x, starting_value, decay_rate, min_probability=0
 
     TODO: look into simpler scipy implementations"""
     return starting_value * (1 - decay_rate) ** (x - x_translation) + min_probability
+
+def exponentially_decaying_risks(x, starting_value, decay_rate, min_probability=0, x_translation=2):
+    """Array version of exponentially_decaying_risk, with all arguments broadcasting against each
+    other (eg an array of planet counts)."""
+    x, starting_value, decay_rate, min_probability, x_translation = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float)
+          for value in (x, starting_value, decay_rate, min_probability, x_translation)))
+    return starting_value * (1 - decay_rate) ** (x - x_translation) + min_probability
+
+def row_remainders(matrix, columns):
+    """For each row of matrix, 1 minus the sum of every entry except the one in that row's element
+    of columns, using Neumaier's compensated summation vectorised over the rows. Setting those
+    entries to the result makes each row sum to 1 to within a rounding error."""
+    matrix = np.asarray(matrix, dtype=float)
+    columns = np.asarray(columns)
+    totals = np.ones(matrix.shape[0])
+    compensations = np.zeros(matrix.shape[0])
+    for column in range(matrix.shape[1]):
+        terms = np.where(columns == column, 0, -matrix[:, column])
+        new_totals = totals + terms
+        compensations += np.where(np.abs(totals) >= np.abs(terms),
+                                  (totals - new_totals) + terms,
+                                  (terms - new_totals) + totals)
+        totals = new_totals
+    return totals + compensations
@@ -0,0 +1,161 @@
+# pylint: disable=broad-except
+
+"""Runs full calc evaluations on a pool of background worker processes, tracking them in a SQLite
+job table. Jobs are identified by the hash of their params and runtime constants, so submitting the
+same thing twice reuses the first job (and its results, once it's finished) rather than starting
+another run. Jobs checkpoint their sub-chains as they go (see checkpoints.py), so resubmitting an
+interrupted job picks up where it left off."""
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+import datetime
+import json
+import multiprocessing
+import sqlite3
+import traceback
+
+from calculators.full_calc import full_chain
+from calculators.full_calc.checkpoints import CHECKPOINT_DIRECTORY, CheckpointStore
+from calculators.full_calc.params import parameter_hash
+from calculators.full_calc.predictor import current_backend
+
+DATABASE_PATH = 'full_calc_jobs.sqlite'
+MAX_WORKERS = 2 # Each worker runs one full calc at a time, using a whole CPU core
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+INTERRUPTED = 'interrupted' # The process running the pool stopped before the job finished
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    completed_steps INTEGER NOT NULL DEFAULT 0,
+    total_steps INTEGER,
+    params TEXT NOT NULL,
+    runtime_constants TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    submitted_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT)"""
+
+
+def _connect(database_path):
+    connection = sqlite3.connect(database_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    return closing(connection)
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def _update_job(database_path, job_id, **columns):
+    assignments = ', '.join(f'{column} = ?' for column in columns)
+    with _connect(database_path) as connection, connection:
+        connection.execute(f'UPDATE jobs SET {assignments} WHERE id = ?',
+                           (*columns.values(), job_id))
+
+
+def _run_job(database_path, job_id, params_dict, runtime_constants,
+             checkpoint_directory=CHECKPOINT_DIRECTORY):
+    """Evaluate one job inside a worker process, recording its progress and outcome"""
+    _update_job(database_path, job_id, status=RUNNING, started_at=_now())
+
+    def progress(completed_steps, total_steps):
+        _update_job(database_path, job_id, completed_steps=completed_steps,
+                    total_steps=total_steps)
+
+    try:
+        checkpoints = CheckpointStore(params_dict, runtime_constants, checkpoint_directory,
+                                      resume=True)
+        result = full_chain.run(params_dict, runtime_constants, progress=progress,
+                                checkpoints=checkpoints)
+    except Exception:
+        _update_job(database_path, job_id, status=FAILED, error=traceback.format_exc(),
+                    finished_at=_now())
+        return
+    _update_job(database_path, job_id, status=FINISHED, result=json.dumps(result),
+                finished_at=_now())
+    checkpoints.clear()
+
+
+class JobRunner:
+    """A pool of worker processes for full calc jobs, plus the job table recording them. Create
+    one per server process (eg with st.cache_resource) and share it between sessions."""
+    def __init__(self, database_path=DATABASE_PATH, max_workers=MAX_WORKERS, predictor=None,
+                 checkpoint_directory=CHECKPOINT_DIRECTORY):
+        self.database_path = database_path
+        self.checkpoint_directory = checkpoint_directory
+        if predictor and predictor.backend != current_backend():
+            raise ValueError(f"The predictor is calibrated for the {predictor.backend} backend, but "
+                             f"jobs will use the {current_backend()} one")
+        self.predictor = predictor
+        with _connect(database_path) as connection, connection:
+            connection.execute('PRAGMA journal_mode=WAL') # Lets pages read while workers write
+            connection.execute(_SCHEMA)
+            # Anything a previous pool left unfinished will never finish now
+            connection.execute('UPDATE jobs SET status = ? WHERE status IN (?, ?)',
+                               (INTERRUPTED, QUEUED, RUNNING))
+        # Worker processes are spawned rather than forked, since the runner lives in a server
+        # process with threads running, and forking one can deadlock
+        self.executor = ProcessPoolExecutor(max_workers=max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, params_dict, runtime_constants):
+        """Queue a full calc run for params_dict (structured like params.yml) and
+        runtime_constants (a dict of full_chain.RUNTIME_CONSTANT_NAMES to values), unless an
+        identical job is already queued, running or finished. Returns the job's id.
+
+        If the runner has a predictor.Predictor (which must be calibrated for the backend jobs use -
+        see predictor.current_backend()), new jobs whose estimated runtime or memory use
+        exceed its default limits are refused with predictor.LimitExceeded."""
+        job_id = parameter_hash(params_dict, runtime_constants)
+        existing_job = self.job(job_id)
+        if self.predictor and (existing_job is None or existing_job['status'] in (FAILED,
+                                                                                  INTERRUPTED)):
+            self.predictor.check(runtime_constants)
+        with _connect(self.database_path) as connection, connection:
+            queued = connection.execute(
+                '''INSERT OR IGNORE INTO jobs (id, status, params, runtime_constants, submitted_at)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (job_id, QUEUED, json.dumps(params_dict), json.dumps(runtime_constants),
+                 _now())).rowcount
+            if not queued:
+                # Only retry jobs that can't otherwise produce results
+                queued = connection.execute(
+                    '''UPDATE jobs SET status = ?, completed_steps = 0, total_steps = NULL,
+                       error = NULL, submitted_at = ?, started_at = NULL, finished_at = NULL
+                       WHERE id = ? AND status IN (?, ?)''',
+                    (QUEUED, _now(), job_id, FAILED, INTERRUPTED)).rowcount
+        if queued:
+            self.executor.submit(_run_job, self.database_path, job_id, params_dict,
+                                 runtime_constants, self.checkpoint_directory)
+        return job_id
+
+    def job(self, job_id):
+        """The job table row for job_id as a dict, with its JSON columns decoded, or None"""
+        with _connect(self.database_path) as connection:
+            row = connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return _decoded(row) if row else None
+
+    def recent_jobs(self, limit=20):
+        """The most recently submitted jobs, newest first"""
+        with _connect(self.database_path) as connection:
+            rows = connection.execute('SELECT * FROM jobs ORDER BY submitted_at DESC LIMIT ?',
+                                      (limit,)).fetchall()
+        return [_decoded(row) for row in rows]
+
+    def shutdown(self):
+        """Stop the worker pool, abandoning any queued jobs"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _decoded(row):
+    job = dict(row)
+    for column in ('params', 'runtime_constants', 'result'):
+        if job[column] is not None:
+            job[column] = json.loads(job[column])
+    return job
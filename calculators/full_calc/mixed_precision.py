@@ -0,0 +1,79 @@
+"""Solves a sub-chain for its absorption probabilities with a float32 factorisation, recovering
+float64 accuracy by iterative refinement, for when constant.MIXED_PRECISION_SOLVE is set.
+
+pydtmc's absorption_probabilities() inverts the whole of I - Q in float64, so solving the largest
+perils sub-chains needs several dense float64 matrices the size of the chain. Here the only new
+dense matrix is the float32 LU factorisation of I - Q, half the size of one of them. Each round of
+refinement finds the residual of the current solution in float64, using the chain's own float64
+transition matrix, and corrects the solution by solving for the residual with the float32
+factorisation. This converges as long as I - Q is far enough from singular for float32 - ie the
+chain can't be expected to stay in its transient states for millions of steps. If it doesn't, or
+the factorisation is singular, RefinementFailed is raised, so the caller can fall back to a float64
+solve; otherwise the residual of the final solution is returned with it.
+"""
+
+import numpy as np
+from scipy import linalg
+
+# Refinement stops once it no longer makes the residuals smaller, or after this many rounds
+MAX_REFINEMENTS = 10
+# Rows of I - Q formed at once when finding residuals
+RESIDUAL_BLOCK_SIZE = 256
+
+
+class RefinementFailed(ArithmeticError):
+    """Refinement didn't reach a solution whose residuals are within rounding error of 0 - ie at
+    most the number of transient states times float64's machine epsilon times the solution's
+    largest entry"""
+
+
+def absorption_probabilities(transition_matrix, transient_count, start_states):
+    """The probabilities of being absorbed in each absorbing state of transition_matrix (a chain's
+    transient states first, then its absorbing ones) from each transient state in start_states, as
+    an array with a row per absorbing state and a column per start state, and the largest absolute
+    residual of the linear system that gave them. Raises RefinementFailed if that residual is
+    bigger than rounding error (or isn't finite).
+
+    Rather than find every transient state's absorption probabilities, this solves
+    (I - Q)^T x = e_s for each start state s, after which x^T R are its absorption probabilities."""
+    transition_matrix = np.asarray(transition_matrix)
+    transitions = transition_matrix[:transient_count, :transient_count]
+    # Built in place, so the only new dense matrix is the float32 one
+    float32_system = transitions.T.astype(np.float32)
+    float32_system *= -1
+    float32_system[np.diag_indices(transient_count)] += 1
+    factorisation = linalg.lu_factor(float32_system, overwrite_a=True, check_finite=False)
+    del float32_system
+
+    unit_vectors = np.zeros((transient_count, len(start_states)))
+    unit_vectors[start_states, range(len(start_states))] = 1
+    solution = linalg.lu_solve(factorisation, unit_vectors.astype(np.float32),
+                               check_finite=False).astype(float)
+    residual = _residual(transitions, unit_vectors, solution)
+    residual_size = np.abs(residual).max()
+    for _ in range(MAX_REFINEMENTS):
+        refined = solution + linalg.lu_solve(factorisation, residual.astype(np.float32),
+                                             check_finite=False)
+        refined_residual = _residual(transitions, unit_vectors, refined)
+        refined_size = np.abs(refined_residual).max()
+        if refined_size >= residual_size:
+            break # We're down to the rounding error of the residual itself
+        solution, residual, residual_size = refined, refined_residual, refined_size
+
+    tolerance = transient_count * np.finfo(float).eps * np.abs(solution).max()
+    if not np.isfinite(residual_size) or residual_size > tolerance:
+        raise RefinementFailed(f"Mixed precision refinement stopped at a residual of "
+                               f"{residual_size:.3g}, above the tolerance of {tolerance:.3g}")
+    return transition_matrix[:transient_count, transient_count:].T @ solution, residual_size
+
+
+def _residual(transitions, unit_vectors, solution):
+    """unit_vectors - (I - Q)^T solution in float64, with transitions the chain's Q. The rows of
+    (I - Q)^T are formed a block at a time rather than computing solution - Q^T solution, which
+    loses several more bits to cancellation."""
+    residual = unit_vectors.copy()
+    for start in range(0, len(solution), RESIDUAL_BLOCK_SIZE):
+        block = -transitions[:, start:start + RESIDUAL_BLOCK_SIZE].T
+        block[range(len(block)), range(start, start + len(block))] += 1
+        residual[start:start + len(block)] -= block @ solution
+    return residual
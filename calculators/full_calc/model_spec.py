@@ -0,0 +1,97 @@
+"""A declarative description of a Markov chain over families of states indexed by civilisation, eg
+preindustrial-1, preindustrial-2, ..., and a compiler turning it into sparse transition matrices.
+
+A model is a list of StateFamily, each naming its civilisations and how its states transition:
+
+    StateFamily('industrial', range(1, civilisations), [
+        Transition('perils', 0, lambda k: preperils.perils_given_industrial(k, k)),
+        Transition('Extinction', None, preperils.extinction_given_industrial)])
+
+where each Transition's k_offset says which civilisation of the target family it goes to (k plus the
+offset), or is None for an absorbing state, and probability(k) gives its probability from the kth
+state. Transitions to states that don't exist (eg regressing from the last civilisation) must have
+zero probability. compile_model() turns this into the transient-to-transient and
+transient-to-absorbing blocks (Q, R) of the transition matrix, with a map of state name to index, in
+time linear in the number of non-zero transitions.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from scipy import sparse
+
+StateFamily = namedtuple('StateFamily', ['name', 'civilisations', 'transitions'])
+Transition = namedtuple('Transition', ['target', 'k_offset', 'probability'])
+
+
+def state_name(family, k):
+    """The name of the kth state of family, eg perils-0"""
+    return f'{family}-{k}'
+
+
+class CompiledModel:
+    """The transition matrix of a compiled model, as sparse blocks q (transient to transient) and r
+    (transient to absorbing), with the names of the transient and absorbing states in matrix order
+    and index, a dict of every state name to its index in the full matrix (transient states first)"""
+    def __init__(self, transient_states, absorbing_states, q, r):
+        self.transient_states = transient_states
+        self.absorbing_states = absorbing_states
+        self.states = transient_states + absorbing_states
+        self.index = {state: index for index, state in enumerate(self.states)}
+        self.q = q
+        self.r = r
+
+    def transition_matrix(self):
+        """The full, dense transition matrix, with each absorbing state transitioning to itself"""
+        transient_count = len(self.transient_states)
+        absorbing_count = len(self.absorbing_states)
+        matrix = np.zeros((len(self.states), len(self.states)))
+        matrix[:transient_count, :transient_count] = self.q.toarray()
+        matrix[:transient_count, transient_count:] = self.r.toarray()
+        matrix[transient_count:, transient_count:] = np.identity(absorbing_count)
+        return matrix
+
+
+def compile_model(families, absorbing_states):
+    """Compile a list of StateFamily into a CompiledModel, with the transient states in the order of
+    families and then civilisation, followed by absorbing_states. Raises ValueError for a transition
+    to an unknown family or absorbing state, or a non-zero transition to a state that doesn't
+    exist."""
+    transient_states = [state_name(family.name, k)
+                        for family in families for k in family.civilisations]
+    transient_index = {state: index for index, state in enumerate(transient_states)}
+    absorbing_index = {state: index for index, state in enumerate(absorbing_states)}
+    family_names = {family.name for family in families}
+
+    entries = {'q': ([], [], []), 'r': ([], [], [])}
+    for family in families:
+        for transition in family.transitions:
+            if transition.k_offset is None and transition.target not in absorbing_index:
+                raise ValueError(f"{family.name} transitions to unknown absorbing state "
+                                 f"{transition.target}")
+            if transition.k_offset is not None and transition.target not in family_names:
+                raise ValueError(f"{family.name} transitions to unknown family {transition.target}")
+            for k in family.civilisations:
+                probability = transition.probability(k)
+                if not probability:
+                    continue
+                if transition.k_offset is None:
+                    block, column = 'r', absorbing_index[transition.target]
+                else:
+                    target = state_name(transition.target, k + transition.k_offset)
+                    if target not in transient_index:
+                        raise ValueError(f"{state_name(family.name, k)} transitions to {target}, "
+                                         f"which isn't in the model, with probability {probability}")
+                    block, column = 'q', transient_index[target]
+                rows, columns, values = entries[block]
+                rows.append(transient_index[state_name(family.name, k)])
+                columns.append(column)
+                values.append(probability)
+
+    def _block(name, column_count):
+        rows, columns, values = entries[name]
+        return sparse.csr_matrix((values, (rows, columns)),
+                                 shape=(len(transient_states), column_count))
+
+    return CompiledModel(transient_states, list(absorbing_states),
+                         _block('q', len(transient_states)), _block('r', len(absorbing_states)))
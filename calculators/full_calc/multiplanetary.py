@@ -3,8 +3,12 @@
 """Functions to calculate transition probabilities from multiplanetary states."""
 
 
+import numpy as np
+
 import calculators.full_calc.runtime_constants as constant
-from calculators.full_calc.graph_functions import sigmoid_curved_risk, exponentially_decaying_risk
+from calculators.full_calc.graph_functions import (sigmoid_curved_risk, sigmoid_curved_risks,
+                                                   exponentially_decaying_risk,
+                                                   exponentially_decaying_risks)
 from calculators.full_calc.params import Params
 
 params = Params().dictionary['multiplanetary']
@@ -49,6 +53,15 @@ def interstellar_given_multiplanetary(planet_count):
     return sigmoid_curved_risk(planet_count, x_scale(), y_scale(), x_translation(), sharpness())
 
 
+def interstellar_given_multiplanetary_counts(planet_counts):
+    """Array version of interstellar_given_multiplanetary"""
+    return sigmoid_curved_risks(planet_counts,
+                                params['interstellar']['x_scale'],
+                                params['interstellar']['y_scale'],
+                                2,
+                                params['interstellar']['sharpness'])
+
+
 def parameterised_decaying_transition_probability(target_state, planet_count=None):
     """Calculate the overall probability of transition for specified value of q given
     user-determined params"""
@@ -75,6 +88,29 @@ def parameterised_decaying_transition_probability(target_state, planet_count=Non
 )
 
 
+def parameterised_decaying_transition_probabilities(target_state, planet_counts):
+    """Array version of parameterised_decaying_transition_probability, over an array of planet
+    counts"""
+    planet_counts = np.asarray(planet_counts, dtype=float)
+    if params[target_state]['two_planet_risk'] == 0:
+        return np.zeros(planet_counts.shape)
+    return exponentially_decaying_risks(
+        x=planet_counts,
+        starting_value=params[target_state]['two_planet_risk'],
+        decay_rate=params[target_state]['decay_rate'],
+        min_probability=params[target_state]['min_risk'])
+
+
+def is_structurally_zero(target_state):
+    """Whether the probability of exiting a multiplanetary state to target_state ('extinction',
+    'preindustrial', 'industrial', 'perils' or 'interstellar') is 0 for every planet count"""
+    if target_state == 'interstellar':
+        return params['interstellar']['y_scale'] == 0
+    if target_state == 'perils':
+        # Regressing to one planet is a share of any regression
+        return params['n_planets']['two_planet_risk'] == 0 and params['n_planets']['min_risk'] == 0
+    return params[target_state]['two_planet_risk'] == 0
+
 def transition_to_n_planets_given_multiplanetary(planet_count, n):
     """Should be a value between 0 and 1. Lower treats events that could cause regression to a
     1-planet civilisation in a perils state as having their probability less reduced by having
@@ -181,12 +217,5 @@ def perils_given_multiplanetary(planet_count):
 # row = exit_probabilities + intra_transition_probabilities
 # # transition_to_n_planets_given_multiplanetary(1, 9, 3)
 
-
-
-# TODO - consider reintroducing this checksum
-# if not 1 == (extinction_given_multiplanetary(k)
-#              + preindustrial_given_multiplanetary(k)
-#              + industrial_given_multiplanetary(k)
-#              + perils_given_multiplanetary(k)
-#              + interstellar_given_multiplanetary(k)):
-#   raise InvalidTransitionProbabilities("Transition probabilities from multiplanetary must == 1")
+# The transition probabilities out of each multiplanetary state are checked to sum to 1 when the
+# sub-chain is built - see validation.py
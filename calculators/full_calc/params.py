@@ -1,12 +1,19 @@
+import copy
+import hashlib
+import json
+
 import yaml
 
+from calculators.full_calc import tracing
+
 class Params:
     """Wrapper to unpack the params.yml file and allow for easy access to its
     parameters via dot notation"""
     def __init__(self, params_dict=None):
 
         if params_dict is None:
-            with open('calculators/full_calc/params.yml', 'r', encoding="utf-8") as stream:
+            with tracing.span('load_params'), \
+                 open('calculators/full_calc/params.yml', 'r', encoding="utf-8") as stream:
                 params_dict = yaml.safe_load(stream)
 
         self.dictionary = params_dict
@@ -50,3 +57,61 @@ class Params:
                 # Append the value to the list if it's the lowest level
                 values.append(value)
         return values
+
+
+def parameter_hash(params_dict, runtime_constants):
+    """A stable hex digest identifying a run of the full calc: the same params and runtime
+    constants always give the same hash, regardless of key order"""
+    canonical = json.dumps({'params': params_dict, 'runtime_constants': runtime_constants},
+                           sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def with_overrides(params_dict, overrides):
+    """A copy of params_dict with some values replaced. overrides can be nested like params.yml,
+    or use dotted paths as keys (eg {'perils.extinction.y_scale': 0.0004}), or a mix of the two.
+    Raises KeyError for paths which don't already exist, since those are almost always typos."""
+    params_dict = copy.deepcopy(params_dict)
+
+    def override(target, path, value, prefix=''):
+        key, *rest = path
+        full_key = prefix + key
+        if not isinstance(target, dict) or key not in target:
+            raise KeyError(f"Unknown param: {full_key}")
+        if rest:
+            override(target[key], rest, value, full_key + '.')
+        elif isinstance(value, dict):
+            for nested_key, nested_value in value.items():
+                override(target[key], nested_key.split('.'), nested_value, full_key + '.')
+        else:
+            target[key] = value
+
+    for key, value in overrides.items():
+        override(params_dict, key.split('.'), value)
+    return params_dict
+
+
+def check_structure(params_dict, reference=None):
+    """Raise ValueError unless params_dict is structured like reference (default: params.yml): a
+    dict with every section and param that it has, each section itself a dict. Extra params (eg
+    the optional current_perils_ ones) are allowed, and the values of params aren't checked."""
+    if reference is None:
+        reference = Params().dictionary
+    problems = []
+
+    def check(target, expected, prefix=''):
+        for key, expected_value in expected.items():
+            full_key = prefix + key
+            if key not in target:
+                problems.append(f"{full_key} is missing")
+            elif isinstance(expected_value, dict) and not isinstance(target[key], dict):
+                problems.append(f"{full_key} should be a section of params, not {target[key]!r}")
+            elif isinstance(expected_value, dict):
+                check(target[key], expected_value, full_key + '.')
+
+    if not isinstance(params_dict, dict):
+        raise ValueError(f"Params should be a mapping of sections like params.yml's, not "
+                         f"{type(params_dict).__name__}")
+    check(params_dict, reference)
+    if problems:
+        raise ValueError("Params aren't structured like params.yml: " + '; '.join(problems))
@@ -2,10 +2,12 @@
 
 """Functions to calculate the transitional probabilities from time of perils states."""
 
+from functools import cache
 
+import numpy as np
 
 import calculators.full_calc.runtime_constants as constant
-from calculators.full_calc.graph_functions import sigmoid_curved_risk
+from calculators.full_calc.graph_functions import sigmoid_curved_risk, sigmoid_curved_risks
 from calculators.full_calc.params import Params
 
 params = Params().dictionary['perils']
@@ -40,41 +42,90 @@ def interstellar_given_perils(k, progress_year):
     of progress years into the perils state of the kth civilisation"""
     return _parameterised_transition_probability(k, progress_year, 'interstellar')
 
-def _parameterised_transition_probability(k, progress_year, target_state):
-    if k == 0:
+class TransitionParameters:
+    """The sigmoid coefficients and background risk for transitioning to one target state from the
+    kth time of perils, with any current_perils_ overrides already resolved"""
+    __slots__ = ('x_scale', 'y_scale', 'x_translation', 'sharpness', 'background_risk')
+
+    def __init__(self, x_scale, y_scale, x_translation, sharpness, background_risk):
+        self.x_scale = x_scale
+        self.y_scale = y_scale
+        self.x_translation = x_translation
+        self.sharpness = sharpness
+        self.background_risk = background_risk
+
+
+@cache
+def compiled_transition_parameters(k, target_state):
+    """Resolve the params for transitioning to target_state from the kth time of perils once, so
+    that the per-progress-year calls don't have to repeat the lookups.
+
+    The result is cached for the lifetime of the params, so if you swap the module's params out,
+    call compiled_transition_parameters.cache_clear()"""
+    target_params = params[target_state]
+
+    def resolved(key):
         # Some kruft required to deal with values potentially being 0
-        base_x_scale = params[target_state].get('current_perils_base_x_scale')
-        base_x_scale = base_x_scale if base_x_scale is not None else params[target_state]['base_x_scale']
-        x_scale_stretch = params[target_state].get('current_perils_stretch_per_reboot')
-        x_scale_stretch = (x_scale_stretch if x_scale_stretch is not None else params[target_state]['stretch_per_reboot']) ** k
-        y_scale = params[target_state].get('current_perils_y_scale')
-        y_scale = y_scale if y_scale is not None else params[target_state]['y_scale']
-        x_translation = params[target_state].get('current_perils_x_translation')
-        x_translation = x_translation if x_translation is not None else params[target_state]['x_translation']
-        sharpness = params[target_state].get('current_perils_sharpness')
-        sharpness = sharpness if sharpness is not None else params[target_state]['sharpness']
-    else:
-        base_x_scale = params[target_state]['base_x_scale']
-        x_scale_stretch = params[target_state]['stretch_per_reboot'] ** k
-        y_scale = params[target_state]['y_scale']
-        x_translation = params[target_state]['x_translation']
-        sharpness = params[target_state]['sharpness']
+        value = target_params.get('current_perils_' + key) if k == 0 else None
+        return value if value is not None else target_params[key]
 
-    total_x_scale = base_x_scale * x_scale_stretch
+    # Exponent should be >0, since this is a probability that should be settable to 0 (and can't
+    # be if the exponent is 0)
+    background_risk = (target_params['per_civilisation_background_risk_numerator'] ** (k + 1)
+                       / target_params['base_background_risk_denominator'])
 
+    return TransitionParameters(
+        x_scale=resolved('base_x_scale') * resolved('stretch_per_reboot') ** k,
+        y_scale=resolved('y_scale'),
+        x_translation=resolved('x_translation'),
+        sharpness=resolved('sharpness'),
+        background_risk=background_risk)
 
-    def background_risk():
-        # Exponent should be >0, since this is a probability that should be settable to 0 (and can't
-        # be if the exponent is 0)
-        return (params[target_state]['per_civilisation_background_risk_numerator'] ** (k + 1)
-                /params[target_state]['base_background_risk_denominator'])
 
-    return background_risk() + sigmoid_curved_risk(
+def is_structurally_zero(k, target_state):
+    """Whether the probability of transitioning to target_state from the kth time of perils is 0 in
+    every progress year, ie its sigmoid has no height and there's no background risk"""
+    coefficients = compiled_transition_parameters(k, target_state)
+    return coefficients.y_scale == 0 and coefficients.background_risk == 0
+
+def _parameterised_transition_probability(k, progress_year, target_state):
+    coefficients = compiled_transition_parameters(k, target_state)
+    return coefficients.background_risk + sigmoid_curved_risk(
         x=progress_year,
-        x_scale=total_x_scale,
-        y_scale=y_scale,
-        x_translation=x_translation,
-        sharpness=sharpness)
+        x_scale=coefficients.x_scale,
+        y_scale=coefficients.y_scale,
+        x_translation=coefficients.x_translation,
+        sharpness=coefficients.sharpness)
+
+
+def parameterised_transition_probabilities(k, progress_years, target_state):
+    """Array version of the per-target functions above. k and progress_years broadcast against
+    each other, so eg np.arange(constant.MAX_PROGRESS_YEARS) gives a whole exit column of the kth
+    perils sub-chain, and a column of ks against that gives one column per civilisation."""
+    k = np.asarray(k)
+    coefficients = [compiled_transition_parameters(int(civilisation), target_state)
+                    for civilisation in k.ravel()]
+
+    def coefficient_array(name):
+        return np.reshape([getattr(record, name) for record in coefficients], k.shape)
+
+    return coefficient_array('background_risk') + sigmoid_curved_risks(
+        x=progress_years,
+        x_scale=coefficient_array('x_scale'),
+        y_scale=coefficient_array('y_scale'),
+        x_translation=coefficient_array('x_translation'),
+        sharpness=coefficient_array('sharpness'))
+
+
+@cache
+def zipf_tables(exponent, max_terms):
+    """Arrays indexed by x from 0 to max_terms of the Zipf weights 1/x**exponent and of the
+    generalised harmonic numbers 1 + 1/2**exponent + ... + 1/x**exponent that normalise them,
+    computed once per exponent so that the per-transition calls are just lookups (index 0 of each
+    is unused/0)"""
+    weights = np.zeros(max_terms + 1)
+    weights[1:] = 1 / np.arange(1, max_terms + 1, dtype=float) ** exponent
+    return weights, np.cumsum(weights)
 
 
 def transition_to_year_n_given_perils(k:int, progress_year:int, n=None):
@@ -106,31 +157,15 @@ def transition_to_year_n_given_perils(k:int, progress_year:int, n=None):
                     + interstellar_given_perils(k, progress_year))
 
     def zipf_algorithm():
-        pass
-
-        # ChatGPT code below implementing a finite zipf distribution that works
-        # in isolation, but needs to be incorporated into program
-        # import numpy as np
-
-        # def generalized_harmonic_number(n, a):
-        #     return np.sum([1 / (k ** a) for k in range(1, n + 1)])
-
-        # def f(x, n, a):
-        #     # Ensure x, n, and a are positive and within specified bounds
-        #     if x < 1 or x > n or n <= 0 or a <= 0:
-        #         raise ValueError("Invalid input values")
-
-        #     hn = generalized_harmonic_number(n, a)
-        #     return 1 / (hn * (x ** a))
-
-        # # Example usage
-        # n = 10  # Replace with desired n value
-        # a = 2   # Replace with desired a value
-        # x_values = np.arange(1, n+1)  # Discrete values from 1 to n
-
-        # # Calculate f for each x in the domain
-        # f_values = [f(x, n, a) for x in x_values]
-
+        regression_size = possible_regressions - n # 1 for a regression to the current year
+        if regression_size > constant.MAX_PROGRESS_YEAR_REGRESSION_STEPS:
+            # As for the exponential algorithm, we round regressions this big to 0
+            return 0
+        weights, harmonic_numbers = zipf_tables(params['progress_year_n']['zipf_exponent'],
+                                                constant.MAX_PROGRESS_YEAR_REGRESSION_STEPS)
+        possible_targets = min(possible_regressions, constant.MAX_PROGRESS_YEAR_REGRESSION_STEPS)
+        return (any_intra_perils_regression() * weights[regression_size]
+                / harmonic_numbers[possible_targets])
 
     def exponential_algorithm():
         if possible_regressions - n > constant.MAX_PROGRESS_YEAR_REGRESSION_STEPS:
@@ -191,6 +226,8 @@ def transition_to_year_n_given_perils(k:int, progress_year:int, n=None):
         return linear_algorithm()
     elif params['progress_year_n']['algorithm'] == 'mean':
         return mean_algorithm()
+    elif params['progress_year_n']['algorithm'] == 'zipf':
+        return zipf_algorithm()
     else:
         raise "Invalid algorithm given for progress_year_n"
 
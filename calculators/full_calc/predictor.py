@@ -0,0 +1,265 @@
+# pylint: disable=too-many-locals
+
+"""Predicts the runtime and peak memory of a full calc run from its runtime constants, so that runs
+which would take too long or run out of memory can be refused before they start.
+
+The predictor calibrates itself by timing a few small runs on this machine, then fits
+
+- the time to build and solve each of the MAX_CIVILISATIONS time of perils sub-chains as
+  a + b*MAX_PROGRESS_YEARS^2 + c*MAX_PROGRESS_YEARS^3 (building the transition matrix is quadratic,
+  solving it cubic)
+- the same for each multiplanetary sub-chain, in terms of MAX_PLANETS
+- everything else (loading params, assembling and solving the full chain) as
+  a + b*MAX_CIVILISATIONS^3
+- peak RSS as a + b*MAX_PROGRESS_YEARS^2 + c*MAX_CIVILISATIONS*MAX_PROGRESS_YEARS^2 + the same for
+  MAX_PLANETS, since every solved sub-chain is kept until the full chain is assembled
+
+with non-negative coefficients. Estimates well beyond the calibration grid (eg for 20
+civilisations, from a grid going up to 5) are extrapolations, so treat them as rough.
+
+Calibrations are saved per backend - how the sub-chains are solved, either pydtmc's float64 solve
+or the mixed precision one (see mixed_precision.py), which needs about half the memory - since each
+scales differently. Calibrate, then estimate, with eg
+
+    python -m calculators.full_calc.predictor calibrate
+    python -m calculators.full_calc.predictor --backend mixed-precision calibrate
+    python -m calculators.full_calc.predictor estimate --max-progress-years 4000 --max-memory-gib 16
+
+which exits with status 1 if the estimate exceeds the given limits.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import argparse
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import warnings
+
+import numpy as np
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc import full_chain
+from calculators.full_calc.params import Params
+
+CALIBRATION_PATH = 'full_calc_calibration.json'
+
+PYDTMC = 'pydtmc'
+MIXED_PRECISION = 'mixed-precision'
+BACKENDS = (PYDTMC, MIXED_PRECISION)
+
+# Small enough to calibrate in a minute or two, but big enough for the higher order terms to show.
+# Every constant has at least three values, so no cubic term is fitted from a single difference.
+CALIBRATION_GRID = {'MAX_PLANETS': [5, 20, 40],
+                    'MAX_CIVILISATIONS': [2, 3, 5],
+                    'MAX_PROGRESS_YEARS': [100, 250, 400]}
+
+# Default limits, roughly one overnight run on one of our nodes
+MAX_RUNTIME_SECONDS = 12 * 60 * 60
+MAX_PEAK_RSS_BYTES = 16 * 2 ** 30
+
+Estimate = namedtuple('Estimate', ['runtime_seconds', 'peak_rss_bytes'])
+
+
+class LimitExceeded(ValueError):
+    """Raised when a run's estimated runtime or peak memory exceeds the configured limits"""
+
+
+def _features(model, runtime_constants):
+    planets = runtime_constants['MAX_PLANETS']
+    civilisations = runtime_constants['MAX_CIVILISATIONS']
+    years = runtime_constants['MAX_PROGRESS_YEARS']
+    return {'perils': [1, years ** 2, years ** 3],
+            'multiplanetary': [1, planets ** 2, planets ** 3],
+            'overhead': [1, civilisations ** 3],
+            'peak_rss': [1, years ** 2, civilisations * years ** 2,
+                         planets ** 2, civilisations * planets ** 2]}[model]
+
+
+def _non_negative_fit(features, targets):
+    """Least squares coefficients for features @ coefficients ~ targets, constrained to be
+    non-negative by repeatedly dropping the most negative one and refitting"""
+    features = np.asarray(features, dtype=float)
+    targets = np.asarray(targets, dtype=float)
+    active = list(range(features.shape[1]))
+    coefficients = np.zeros(features.shape[1])
+    while active:
+        fitted = np.linalg.lstsq(features[:, active], targets, rcond=None)[0]
+        if (fitted >= 0).all():
+            coefficients[active] = fitted
+            break
+        del active[int(np.argmin(fitted))]
+    return coefficients.tolist()
+
+
+def current_backend():
+    """The backend full calc runs in this process use, given constant.MIXED_PRECISION_SOLVE"""
+    return MIXED_PRECISION if constant.MIXED_PRECISION_SOLVE else PYDTMC
+
+
+def _calibration_run(backend, params_dict, runtime_constants):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend} (expected one of {BACKENDS})")
+    constant.MIXED_PRECISION_SOLVE = backend == MIXED_PRECISION
+    with redirect_stdout(io.StringIO()): # The sub-chains announce themselves as they're built
+        return full_chain.run(params_dict, runtime_constants)['spans']
+
+
+def calibrate(backend=PYDTMC, grid=None, params_dict=None):
+    """Time a full calc run, each in a fresh process, at every point of grid (a dict of runtime
+    constant name to a list of values - see CALIBRATION_GRID) and return a Predictor fitted to
+    them"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend} (expected one of {BACKENDS})")
+    grid = {**CALIBRATION_GRID, **(grid or {})}
+    params_dict = params_dict if params_dict is not None else Params().dictionary
+    samples = {'perils': ([], []), 'multiplanetary': ([], []), 'overhead': ([], []),
+               'peak_rss': ([], [])}
+
+    def _add_sample(model, runtime_constants, value):
+        samples[model][0].append(_features(model, runtime_constants))
+        samples[model][1].append(value)
+
+    for values in itertools.product(*(grid[name] for name in full_chain.RUNTIME_CONSTANT_NAMES)):
+        runtime_constants = dict(zip(full_chain.RUNTIME_CONSTANT_NAMES, values))
+        print(f'Calibrating with {runtime_constants}')
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            spans = executor.submit(_calibration_run, backend, params_dict,
+                                    runtime_constants).result()
+        # One sample per sub-chain (summing its build and solve) and one for everything else
+        seconds = {}
+        for span in spans:
+            model = span['name'].rsplit('_', 1)[0]
+            key = (model, span['attributes']['k']) if model in ('perils', 'multiplanetary') \
+                else ('overhead', None)
+            seconds[key] = seconds.get(key, 0) + span['wall_seconds']
+        for (model, _), model_seconds in seconds.items():
+            _add_sample(model, runtime_constants, model_seconds)
+        _add_sample('peak_rss', runtime_constants, max(span['peak_rss_bytes'] for span in spans))
+
+    return Predictor(backend,
+                     {model: _non_negative_fit(*samples[model]) for model in samples},
+                     _machine(),
+                     datetime.datetime.now().isoformat(timespec='seconds'))
+
+
+def _machine():
+    return f'{platform.node()} ({platform.machine()}, {os.cpu_count()} CPUs)'
+
+
+class Predictor:
+    """Estimates a full calc run's runtime and peak memory from a calibration. Get one with
+    calibrate() or Predictor.load()."""
+    def __init__(self, backend, coefficients, machine, calibrated_at):
+        self.backend = backend
+        self.coefficients = coefficients
+        self.machine = machine
+        self.calibrated_at = calibrated_at
+
+    def save(self, path=CALIBRATION_PATH):
+        """Add this calibration to the file at path, replacing any earlier one for its backend"""
+        calibrations = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as calibration_file:
+                calibrations = json.load(calibration_file)
+        calibrations[self.backend] = {'coefficients': self.coefficients,
+                                      'machine': self.machine,
+                                      'calibrated_at': self.calibrated_at}
+        with open(path, 'w', encoding='utf-8') as calibration_file:
+            json.dump(calibrations, calibration_file, indent=2)
+
+    @classmethod
+    def load(cls, path=CALIBRATION_PATH, backend=PYDTMC):
+        """Read backend's calibration from the file at path, warning if it was made on a different
+        machine. Raises KeyError if that backend hasn't been calibrated."""
+        with open(path, 'r', encoding='utf-8') as calibration_file:
+            calibrations = json.load(calibration_file)
+        if backend not in calibrations:
+            raise KeyError(f"No calibration for the {backend} backend in {path}")
+        calibration = calibrations[backend]
+        if calibration['machine'] != _machine():
+            warnings.warn(f"The {backend} calibration in {path} was made on "
+                          f"{calibration['machine']}, so its estimates may not hold here")
+        return cls(backend, calibration['coefficients'], calibration['machine'],
+                   calibration['calibrated_at'])
+
+    def _predicted(self, model, runtime_constants):
+        return float(np.dot(self.coefficients[model], _features(model, runtime_constants)))
+
+    def estimate(self, runtime_constants):
+        """The Estimate for a run with runtime_constants (a dict overriding some or all of
+        runtime_constants.py)"""
+        runtime_constants = {**full_chain.current_runtime_constants(), **runtime_constants}
+        civilisations = runtime_constants['MAX_CIVILISATIONS']
+        return Estimate(
+            runtime_seconds=(civilisations * (self._predicted('perils', runtime_constants)
+                                              + self._predicted('multiplanetary', runtime_constants))
+                             + self._predicted('overhead', runtime_constants)),
+            peak_rss_bytes=int(self._predicted('peak_rss', runtime_constants)))
+
+    def check(self, runtime_constants, max_runtime_seconds=MAX_RUNTIME_SECONDS,
+              max_peak_rss_bytes=MAX_PEAK_RSS_BYTES, refuse=True):
+        """The Estimate for runtime_constants, after checking it against the given limits (either
+        of which can be None for no limit). If it exceeds them, raises LimitExceeded, or just warns
+        if not refuse."""
+        estimate = self.estimate(runtime_constants)
+        problems = []
+        if max_runtime_seconds is not None and estimate.runtime_seconds > max_runtime_seconds:
+            problems.append(f'an estimated runtime of {estimate.runtime_seconds:.0f} seconds '
+                            f'(limit {max_runtime_seconds:.0f})')
+        if max_peak_rss_bytes is not None and estimate.peak_rss_bytes > max_peak_rss_bytes:
+            problems.append(f'an estimated peak memory use of {estimate.peak_rss_bytes / 2 ** 30:.1f}'
+                            f'GiB (limit {max_peak_rss_bytes / 2 ** 30:.1f}GiB)')
+        if problems:
+            message = f"A run with {runtime_constants} has {' and '.join(problems)}"
+            if refuse:
+                raise LimitExceeded(message)
+            warnings.warn(message)
+        return estimate
+
+
+def main():
+    """Command line interface - see the module docstring"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calibration', default=CALIBRATION_PATH)
+    parser.add_argument('--backend', choices=BACKENDS, default=PYDTMC)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('calibrate', help='Time some small runs and save the fitted predictor')
+    estimate_parser = subparsers.add_parser('estimate', help='Estimate the cost of a run')
+    for name in full_chain.RUNTIME_CONSTANT_NAMES:
+        estimate_parser.add_argument(f'--{name.lower().replace("_", "-")}', dest=name, type=int,
+                                     help=f'{name} (default: runtime_constants.py)')
+    estimate_parser.add_argument('--max-runtime-seconds', type=float, default=MAX_RUNTIME_SECONDS)
+    estimate_parser.add_argument('--max-memory-gib', type=float,
+                                 default=MAX_PEAK_RSS_BYTES / 2 ** 30)
+    estimate_parser.add_argument('--json', action='store_true', help='Print the estimate as JSON')
+
+    args = parser.parse_args()
+    if args.command == 'calibrate':
+        calibrate(args.backend).save(args.calibration)
+        print(f'Saved the {args.backend} calibration to {args.calibration}')
+        return
+
+    predictor = Predictor.load(args.calibration, args.backend)
+    runtime_constants = {name: getattr(args, name) for name in full_chain.RUNTIME_CONSTANT_NAMES
+                         if getattr(args, name) is not None}
+    estimate = predictor.estimate(runtime_constants)
+    if args.json:
+        print(json.dumps(estimate._asdict()))
+    else:
+        print(f'Estimated runtime: {estimate.runtime_seconds:.0f} seconds')
+        print(f'Estimated peak memory: {estimate.peak_rss_bytes / 2 ** 30:.2f}GiB')
+    try:
+        predictor.check(runtime_constants, args.max_runtime_seconds,
+                        int(args.max_memory_gib * 2 ** 30))
+    except LimitExceeded as error:
+        parser.exit(1, f'{error}\n')
+
+
+if __name__ == '__main__':
+    main()
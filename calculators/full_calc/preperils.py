@@ -66,3 +66,15 @@ def perils_given_industrial(k, k1):
         # We can't transition to different civilisations from a preperils state
         return 0
     return 1 - extinction_given_industrial(k)
+
+
+def expected_time_in_preindustrial(k):
+    """Expected time in years that a preindustrial state in the kth civilisation lasts"""
+    p_params = params.preindustrial
+    return p_params.base_expected_time_in_years * p_params.stretch_per_reboot ** k
+
+
+def expected_time_in_industrial(k):
+    """Expected time in years that an industrial state in the kth civilisation lasts"""
+    i_params = params.industrial
+    return i_params.base_expected_time_in_years * i_params.stretch_per_reboot ** k
@@ -0,0 +1,300 @@
+"""A SQLite store for full calc results, in long format: one row per run in the runs table, plus one
+row per (run, state, quantity) in the results table, one per (run, param) in the run_params table
+and one per timed phase of the run in the run_spans table. Unlike a wide CSV, adding or removing
+params or civilisations never misaligns earlier runs, and both tables are indexed so runs can be
+looked up by any param value.
+
+Legacy results.csv-style files can be imported, and the store can be exported back to that wide
+format (eg for pasting into the shared worksheet) with
+
+    python -m calculators.full_calc.results_store import-csv results.csv results-2.csv
+    python -m calculators.full_calc.results_store export-csv my_results.csv
+"""
+
+from collections import OrderedDict
+from contextlib import closing
+import argparse
+import csv
+import datetime
+import json
+import re
+import sqlite3
+
+from calculators.full_calc.params import Params, parameter_hash
+
+RESULTS_PATH = 'results.sqlite'
+
+SUCCESS_PROBABILITY = 'success_probability' # Probability of eventually becoming interstellar
+EXPECTED_VISITS = 'expected_visits' # Expected times in the state, starting from perils-0
+EXPECTED_PROGRESS_YEARS = 'expected_progress_years' # Expected length of each perils-k visit
+
+_STATE_PATTERN = re.compile(r'^(preindustrial|industrial|perils|multiplanetary)-\d+$')
+_RUNTIME_CONSTANT_COLUMNS = {'MAX_PLANETS': 'max_planets',
+                             'MAX_CIVILISATIONS': 'max_civilisations',
+                             'MAX_PROGRESS_YEARS': 'max_progress_years'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    param_hash TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    runtime REAL,
+    max_planets INTEGER,
+    max_civilisations INTEGER,
+    max_progress_years INTEGER,
+    params TEXT,
+    description TEXT NOT NULL DEFAULT '',
+    notes TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT 'full_calc');
+CREATE INDEX IF NOT EXISTS runs_by_param_hash ON runs (param_hash);
+
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    state TEXT NOT NULL,
+    quantity TEXT NOT NULL,
+    value REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS results_by_run ON results (run_id, quantity, state);
+CREATE INDEX IF NOT EXISTS results_by_state ON results (quantity, state, value);
+
+CREATE TABLE IF NOT EXISTS run_params (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    value);
+CREATE INDEX IF NOT EXISTS run_params_by_value ON run_params (name, value);
+CREATE INDEX IF NOT EXISTS run_params_by_run ON run_params (run_id);
+
+CREATE TABLE IF NOT EXISTS run_spans (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    start REAL NOT NULL,
+    wall_seconds REAL NOT NULL,
+    cpu_seconds REAL,
+    peak_rss_bytes INTEGER,
+    attributes TEXT NOT NULL DEFAULT '{}');
+CREATE INDEX IF NOT EXISTS run_spans_by_run ON run_spans (run_id);
+"""
+
+
+def flatten_params(params_dict, prefix=''):
+    """params_dict as a flat ordered dict keyed by dotted path, eg 'perils.extinction.y_scale'"""
+    flattened = OrderedDict()
+    for key, value in params_dict.items():
+        if isinstance(value, dict):
+            flattened.update(flatten_params(value, prefix + key + '.'))
+        else:
+            flattened[prefix + key] = value
+    return flattened
+
+
+LOSS_OF_VALUE_COLUMNS = [
+    'Loss of value from Industrial-1 as proportion of loss of value from Preindustrial-1',
+    'Loss of value of reverting to Preindustrial-1 as as proportion of loss of value of extinction',
+    'Loss of value of reverting to Industrial-1 as proportion of loss of value of extinction',
+    'Absolute loss of expected value from transitioning to Preindustrial-1',
+    'Absolute loss of expected value from transitioning to Industrial-1']
+
+
+def loss_of_value_metrics(success_probabilities):
+    """The costs of a regression to preindustrial/industrial relative to extinction and to
+    astronomical value, keyed by LOSS_OF_VALUE_COLUMNS (blank if the run lacks the states)"""
+    try:
+        current = success_probabilities['perils-0']
+        preindustrial_loss = current - success_probabilities['preindustrial-1']
+        industrial_loss = current - success_probabilities['industrial-1']
+        metrics = [industrial_loss / preindustrial_loss,
+                   preindustrial_loss / current,
+                   industrial_loss / current,
+                   preindustrial_loss,
+                   industrial_loss]
+    except (KeyError, ZeroDivisionError):
+        metrics = [''] * len(LOSS_OF_VALUE_COLUMNS)
+    return OrderedDict(zip(LOSS_OF_VALUE_COLUMNS, metrics))
+
+
+class ResultsStore:
+    """Read and write full calc results in a SQLite database at path"""
+    def __init__(self, path=RESULTS_PATH):
+        self.path = path
+        with self._connect() as connection, connection:
+            connection.executescript(_SCHEMA)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return closing(connection)
+
+    def add_run(self, params_dict, runtime_constants, results, runtime=None, description='',
+                notes='', created_at=None, source='full_calc', spans=()):
+        """Record a run and return its id. results maps each quantity (eg SUCCESS_PROBABILITY) to a
+        dict of state name to value; params_dict is structured like params.yml (or already flat,
+        for legacy imports); spans are the run's tracing spans, as recorded by a tracing.Tracer."""
+        flat_params = flatten_params(params_dict)
+        with self._connect() as connection, connection:
+            run_id = connection.execute(
+                '''INSERT INTO runs (param_hash, created_at, runtime, max_planets,
+                   max_civilisations, max_progress_years, params, description, notes, source)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (parameter_hash(params_dict, runtime_constants),
+                 created_at or datetime.datetime.now().isoformat(timespec='seconds'),
+                 runtime,
+                 runtime_constants.get('MAX_PLANETS'),
+                 runtime_constants.get('MAX_CIVILISATIONS'),
+                 runtime_constants.get('MAX_PROGRESS_YEARS'),
+                 json.dumps(params_dict),
+                 description, notes, source)).lastrowid
+            connection.executemany(
+                'INSERT INTO results (run_id, state, quantity, value) VALUES (?, ?, ?, ?)',
+                [(run_id, state, quantity, float(value))
+                 for quantity, values in results.items() for state, value in values.items()])
+            connection.executemany(
+                'INSERT INTO run_params (run_id, name, value) VALUES (?, ?, ?)',
+                [(run_id, name, value) for name, value in flat_params.items()])
+            connection.executemany(
+                '''INSERT INTO run_spans (run_id, name, start, wall_seconds, cpu_seconds,
+                   peak_rss_bytes, attributes) VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                [(run_id, span['name'], span['start'], span['wall_seconds'], span['cpu_seconds'],
+                  span['peak_rss_bytes'], json.dumps(span['attributes'])) for span in spans])
+        return run_id
+
+    def runs(self, param_hash=None, **param_values):
+        """Runs (as dicts, without their results) matching param_hash, if given, and every
+        param_values entry, given as dotted param paths with '__' instead of '.', eg
+        store.runs(perils__extinction__y_scale=0.00035)"""
+        query = 'SELECT * FROM runs WHERE 1 = 1'
+        arguments = []
+        if param_hash:
+            query += ' AND param_hash = ?'
+            arguments.append(param_hash)
+        for name, value in param_values.items():
+            query += ' AND id IN (SELECT run_id FROM run_params WHERE name = ? AND value = ?)'
+            arguments += [name.replace('__', '.'), value]
+        with self._connect() as connection:
+            rows = connection.execute(query + ' ORDER BY id', arguments).fetchall()
+        return [_decoded_run(row) for row in rows]
+
+    def results(self, run_id, quantity=SUCCESS_PROBABILITY):
+        """An ordered dict of state name to value of quantity for the given run"""
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT state, value FROM results WHERE run_id = ? AND quantity = ? ORDER BY rowid',
+                (run_id, quantity)).fetchall()
+        return OrderedDict((row['state'], row['value']) for row in rows)
+
+    def run_params(self, run_id):
+        """An ordered dict of dotted param path to value for the given run"""
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT name, value FROM run_params WHERE run_id = ? ORDER BY rowid',
+                (run_id,)).fetchall()
+        return OrderedDict((row['name'], row['value']) for row in rows)
+
+    def spans(self, run_id):
+        """The tracing spans recorded for the given run, in the format add_run() takes"""
+        with self._connect() as connection:
+            rows = connection.execute(
+                '''SELECT name, start, wall_seconds, cpu_seconds, peak_rss_bytes, attributes
+                   FROM run_spans WHERE run_id = ? ORDER BY rowid''', (run_id,)).fetchall()
+        return [{**dict(row), 'attributes': json.loads(row['attributes'])} for row in rows]
+
+    def import_csv(self, path):
+        """Import every row of a legacy results.csv-style file, using that file's own header to
+        tell states, runtime constants and params apart (the derived loss-of-value columns are
+        skipped, since export_csv recalculates them). Returns the number of runs imported."""
+        with open(path, newline='', encoding='utf-8') as csvfile:
+            rows = list(csv.reader(csvfile))
+        header = [column.strip() for column in rows[0]]
+        # Params come after the runtime constants (with keys joined by underscores)
+        params_start = (header.index('MAX_PROGRESS_YEARS') + 1 if 'MAX_PROGRESS_YEARS' in header
+                        else len(header))
+        # Store the params under the same names as add_run() does, so exported runs share columns
+        # whichever way they were recorded. Params no longer in params.yml keep their legacy names.
+        dotted_names = _dotted_param_names()
+        imported = 0
+        for row in rows[1:]:
+            cells = {column: cell.strip() for column, cell in zip(header, row) if column}
+            success_probabilities = OrderedDict(
+                (column, float(cell)) for column, cell in cells.items()
+                if _STATE_PATTERN.match(column) and cell)
+            if not success_probabilities:
+                continue
+            runtime_constants = {name: int(float(cells[name]))
+                                 for name in _RUNTIME_CONSTANT_COLUMNS if cells.get(name)}
+            params_dict = OrderedDict((dotted_names.get(column, column), _parsed(cells[column]))
+                                      for column in header[params_start:]
+                                      if column and cells.get(column))
+            self.add_run(params_dict, runtime_constants,
+                         {SUCCESS_PROBABILITY: success_probabilities},
+                         description=cells.get('Brief description', ''),
+                         notes=cells.get('Notes', ''), source=f'csv:{path}')
+            imported += 1
+        return imported
+
+    def export_csv(self, path):
+        """Write every run to path in the wide results.csv layout, with the union of all runs'
+        states and params as columns, so no run's values end up under another's headers"""
+        runs = self.runs()
+        run_results = [self.results(run['id']) for run in runs]
+        run_params = [self.run_params(run['id']) for run in runs]
+        states = list(OrderedDict.fromkeys(
+            state for results in run_results for state in results))
+        param_names = list(OrderedDict.fromkeys(
+            name for params in run_params for name in params))
+
+        with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['Brief description', 'Notes'] + LOSS_OF_VALUE_COLUMNS + states
+                            + list(_RUNTIME_CONSTANT_COLUMNS) + param_names
+                            + ['Runtime', 'Created'])
+            for run, results, params in zip(runs, run_results, run_params):
+                writer.writerow([run['description'], run['notes']]
+                                + list(loss_of_value_metrics(results).values())
+                                + [results.get(state, '') for state in states]
+                                + [run[column] for column in _RUNTIME_CONSTANT_COLUMNS.values()]
+                                + [params.get(name, '') for name in param_names]
+                                + [run['runtime'], run['created_at']])
+
+
+def _dotted_param_names():
+    """Legacy results.csv param columns (params.yml paths joined by underscores) mapped to the
+    dotted paths add_run() stores params under"""
+    params = Params()
+    return dict(zip(params.get_param_keys(key_separator='_'),
+                    params.get_param_keys(key_separator='.')))
+
+
+def _parsed(cell):
+    try:
+        return float(cell)
+    except ValueError:
+        return cell
+
+
+def _decoded_run(row):
+    run = dict(row)
+    run['params'] = json.loads(run['params']) if run['params'] else None
+    return run
+
+
+def main():
+    """Command line interface - see the module docstring"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--store', default=RESULTS_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import-csv', help='Import legacy results CSVs')
+    import_parser.add_argument('paths', nargs='+')
+    export_parser = subparsers.add_parser('export-csv', help='Export every run as a wide CSV')
+    export_parser.add_argument('path')
+
+    args = parser.parse_args()
+    store = ResultsStore(args.store)
+    if args.command == 'import-csv':
+        for path in args.paths:
+            print(f'Imported {store.import_csv(path)} runs from {path}')
+    else:
+        store.export_csv(args.path)
+        print(f'Exported {len(store.runs())} runs to {args.path}')
+
+
+if __name__ == '__main__':
+    main()
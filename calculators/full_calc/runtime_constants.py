@@ -13,6 +13,10 @@
 # MAX_PLANETS = 10, MAX_CIVILISATIONS = 20, MAX_PROGRESS_YEARS = 1000, runtime = 98 seconds
 # MAX_PLANETS = 20, MAX_CIVILISATIONS = 10, MAX_PROGRESS_YEARS = 2000, runtime = 196 seconds
 # MAX_PLANETS = 10, MAX_CIVILISATIONS = 20, MAX_PROGRESS_YEARS = 2000, runtime = 399 seconds
+# (For up-to-date timings and peak memory use on your own hardware, per phase of the calculation,
+# run python -m calculators.benchmark --help)
+# To estimate the runtime and peak memory of particular values before running them, calibrate
+# python -m calculators.full_calc.predictor on your machine (see its docstring).
 
 
 MAX_PLANETS = 20 # Gas giant moons and hollowed out asteroids might be self-sustainy
@@ -38,3 +42,13 @@ if MAX_PROGRESS_YEARS < 2:
 MAX_PROGRESS_YEAR_REGRESSION_STEPS = 50
 if MAX_PROGRESS_YEAR_REGRESSION_STEPS < 1:
     raise 'Need at least one possible regression'
+
+# Every transition matrix is checked before it's solved (see validation.py). If this is True, rows
+# that are invalid (eg because some param values make probabilities sum to more than 1) are
+# renormalised with a warning, rather than stopping the run.
+REPAIR_TRANSITION_PROBABILITIES = False
+
+# If this is True, the sub-chains are solved with a float32 factorisation refined to float64
+# accuracy (see mixed_precision.py), which roughly halves the peak memory of solving the perils
+# sub-chains, so allows higher values of MAX_PROGRESS_YEARS on the same machine.
+MIXED_PRECISION_SOLVE = False
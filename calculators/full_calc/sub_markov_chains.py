@@ -5,68 +5,147 @@ respectively in the decay/perils-focused models described here:
 https://forum.effectivealtruism.org/s/gWsTMm5Nbgdxedyns/p/YnBwoNNqe6knBJH8p#The_decay_model
 """
 
+import numpy as np
 from pydtmc import MarkovChain
 
 import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc import mixed_precision
 from calculators.full_calc import multiplanetary
 from calculators.full_calc import perils
-from calculators.full_calc.params import Params
+from calculators.full_calc import validation
+from calculators.full_calc.graph_functions import row_remainders
+from calculators.full_calc.params import parameter_hash
 
 # See https://dbader.org/blog/python-memoization for a primer on caching
 # TODO look into https://github.com/pymc-devs/pymc
 # https://github.com/riccardoscalco/Pykov
 # and https://martin-thoma.com/python-markov-chain-packages/
 
+def exit_probabilities_key(kind, k, params_dict, runtime_constants):
+    """A hash identifying the exit probabilities of the kind ('perils' or 'multiplanetary')
+    sub-chain for civilisation k under params_dict and runtime_constants, covering only what they
+    depend on, so that runs differing elsewhere can share them. (Multiplanetary sub-chains don't
+    depend on k at all.)"""
+    if kind == 'perils':
+        return parameter_hash(
+            {'kind': kind, 'k': k, 'perils': params_dict['perils']},
+            {'MAX_PROGRESS_YEARS': runtime_constants['MAX_PROGRESS_YEARS'],
+             'MAX_PROGRESS_YEAR_REGRESSION_STEPS': constant.MAX_PROGRESS_YEAR_REGRESSION_STEPS})
+    if kind == 'multiplanetary':
+        return parameter_hash({'kind': kind, 'multiplanetary': params_dict['multiplanetary']},
+                              {'MAX_PLANETS': runtime_constants['MAX_PLANETS']})
+    raise ValueError(f"Unknown sub-chain kind: {kind}")
+
+def _absorption_probabilities(chain, name, transient_count, start_states):
+    """The absorption probabilities of a sub-chain wrapper's chain from each of its transient states
+    in start_states, as an array with a column per start state. If constant.MIXED_PRECISION_SOLVE
+    is set these are found with mixed_precision.py, and the wrapper's solve_residual set to the
+    residual it achieved, unless refinement fails, in which case pydtmc's float64 solve is used."""
+    if constant.MIXED_PRECISION_SOLVE:
+        try:
+            probabilities, chain.solve_residual = mixed_precision.absorption_probabilities(
+                chain.mc.p, transient_count, start_states)
+        except mixed_precision.RefinementFailed as error:
+            print(f"{error} for the {name} sub-chain, so solving it in float64 instead")
+        else:
+            print(f"Solved the {name} sub-chain in mixed precision, with a residual of "
+                  f"{chain.solve_residual:.3g}")
+            return probabilities
+    return np.asarray(chain.mc.absorption_probabilities())[:, start_states]
+
 class IntraPerilsMCWrapper():
     """Wrapper for a Markov chain representing the transition probabilities between different
     progress years in a given time of perils, between that time of perils and the other
-    civilisational states"""
-    def __init__(self, k):
-        print(f"Initialising IntraPerilsMCWrapper for k = {k}")
+    civilisational states.
+
+    Everything the full chain needs from it is in exit_probabilities(), so an equivalent wrapper
+    can be recreated from those without rebuilding the chain (eg from a checkpoint) by passing
+    them as exit_probabilities, in which case mc is None."""
+    # Rows and columns of exit_probabilities()
+    EXIT_STATES = ('extinction', 'preindustrial', 'industrial', 'multiplanetary', 'interstellar')
+    FROM_YEAR_0 = 0
+    FROM_STARTING_YEAR = 1
+
+    def __init__(self, k, exit_probabilities=None):
         self.k = k
+        self.starting_year = perils.params['current_progress_year']
+        self.solve_residual = None # Only set by a mixed precision solve
+        # TODO: make it easier to investigate different values for this param
+        # self.starting_year = 0 # For testing
+        self.mc = None
+        self._exit_probabilities = exit_probabilities
+        if exit_probabilities is not None:
+            return
+        print(f"Initialising IntraPerilsMCWrapper for k = {k}")
 
         # Transitional probabilities from non-absorbing states
         year_range = range(0, constant.MAX_PROGRESS_YEARS)
 
+        # Advancing a progress year (or staying put in the last one) is whatever's left of each row,
+        # so it's left as 0 here and recomputed below from the rest of the row, without the
+        # rounding error of 1 - sum(risks)
+        remainder_columns = np.minimum(np.arange(1, constant.MAX_PROGRESS_YEARS + 1),
+                                       constant.MAX_PROGRESS_YEARS - 1)
         intra_transition_probabilities = {
-            p: [perils.transition_to_year_n_given_perils(k, p, n) for n in year_range]
+            p: [0 if n == remainder_columns[p]
+                else perils.transition_to_year_n_given_perils(k, p, n)
+                for n in year_range]
             for p in year_range}
 
-        exit_probabilities = {p:[perils.extinction_given_perils(k, p),
-                                 perils.preindustrial_given_perils(k, p),
-                                 perils.industrial_given_perils(k, p),
-                                 perils.multiplanetary_given_perils(k, p),
-                                 perils.interstellar_given_perils(k, p)] for p in year_range}
-
-        year_p_rows = [intra_transition_probabilities[p] + exit_probabilities[p]
-                       for p in year_range]
+        # Exits that are impossible under these params are left out of the chain, and filled back
+        # in as zeros by exit_probabilities() (Extinction always stays, so there's an absorbing
+        # state to end in)
+        self.exit_targets = [index for index, target_state in enumerate(self.EXIT_STATES)
+                             if index == 0 or not perils.is_structurally_zero(k, target_state)]
+        exit_columns = [
+            perils.parameterised_transition_probabilities(k, year_range,
+                                                          self.EXIT_STATES[index]).tolist()
+            for index in self.exit_targets]
+        exit_probabilities = {p: [column[p] for column in exit_columns] for p in year_range}
+
+        year_p_rows = np.array([intra_transition_probabilities[p] + exit_probabilities[p]
+                                for p in year_range])
+        year_p_rows[np.arange(constant.MAX_PROGRESS_YEARS), remainder_columns] = row_remainders(
+            year_p_rows, remainder_columns)
 
         # Transitional probabilities from absorbing states (ie rows of 0s, with one 1)
-        extinction_row =        [0] * constant.MAX_PROGRESS_YEARS + [1,0,0,0,0]
-        preindustrial_row =     [0] * constant.MAX_PROGRESS_YEARS + [0,1,0,0,0]
-        industrial_row =        [0] * constant.MAX_PROGRESS_YEARS + [0,0,1,0,0]
-        multiplanetary_row =    [0] * constant.MAX_PROGRESS_YEARS + [0,0,0,1,0]
-        interstellar_row =      [0] * constant.MAX_PROGRESS_YEARS + [0,0,0,0,1]
-
-        probability_matrix = year_p_rows + [extinction_row,
-                                            preindustrial_row,
-                                            industrial_row,
-                                            multiplanetary_row,
-                                            interstellar_row]
+        absorbing_rows = [[0] * constant.MAX_PROGRESS_YEARS
+                          + [int(row == column) for column in range(len(self.exit_targets))]
+                          for row in range(len(self.exit_targets))]
 
         perils_years = [f"{num}" for num in year_range]
-
-
-        self.mc = MarkovChain(probability_matrix, perils_years
-                                            + ['Extinction',
-                                                'Preindustrial',
-                                                'Industrial',
-                                                'Multiplanetary',
-                                                'Interstellar'])
-
-        self.starting_year = Params().dictionary['perils']['current_progress_year']
-        # TODO: make it easier to investigate different values for this param
-        # self.starting_year = 0 # For testing
+        states = perils_years + [self.EXIT_STATES[index].capitalize()
+                                 for index in self.exit_targets]
+
+        probability_matrix = validation.validated(np.vstack([year_p_rows, absorbing_rows]), states,
+                                                  f'perils-{k} sub-chain')
+        self.mc = MarkovChain(probability_matrix, states)
+
+    def exit_probabilities(self):
+        """Solve the chain if necessary, and return the probabilities of it ending in each of its
+        absorbing states (Extinction, Preindustrial, Industrial, Multiplanetary, Interstellar) as a
+        5x2 array, with columns for starting at year 0 and at the starting year"""
+        if self._exit_probabilities is None:
+            self._exit_probabilities = np.zeros((len(self.EXIT_STATES), 2))
+            self._exit_probabilities[self.exit_targets] = _absorption_probabilities(
+                self, f'perils-{self.k}', constant.MAX_PROGRESS_YEARS, [0, self.starting_year])
+        return self._exit_probabilities
+
+    def expected_progress_years(self):
+        """The expected number of progress years (ie transitions) this time of perils lasts before
+        it's exited, as an array with columns for starting at year 0 and at the starting year, or
+        None if the wrapper was recreated from its exit probabilities (so has no chain to ask).
+        These are the row sums of the fundamental matrix for those two rows, found with one solve
+        of the transposed system rather than by inverting it."""
+        if self.mc is None:
+            return None
+        years = constant.MAX_PROGRESS_YEARS
+        unit_vectors = np.zeros((years, 2))
+        unit_vectors[[0, self.starting_year], [0, 1]] = 1
+        # I - Q, adding 1s to the diagonal in place rather than building an identity matrix
+        fundamental_inverse = -self.mc.p[:years, :years]
+        fundamental_inverse[np.diag_indices(years)] += 1
+        return np.linalg.solve(fundamental_inverse.T, unit_vectors).sum(axis=0)
 
     def extinction_given_perils(self):
         """Return the overall transitional probability of extinction for the kth civilisation, given
@@ -76,15 +155,15 @@ class IntraPerilsMCWrapper():
             # extinct
 
             # Min() function corrects a pydtmc floating point error that can make this above 1
-            return min(self.mc.absorption_probabilities()[1][0] # preindustrial
-                        + self.mc.absorption_probabilities()[2][0] # industrial
-                        + self.mc.absorption_probabilities()[0][0] # extinction
+            return min(self.exit_probabilities()[1][self.FROM_YEAR_0] # preindustrial
+                        + self.exit_probabilities()[2][self.FROM_YEAR_0] # industrial
+                        + self.exit_probabilities()[0][self.FROM_YEAR_0] # extinction
                         , 1)
         if self.k == 0:
-            return self.mc.absorption_probabilities()[0][self.starting_year]
+            return self.exit_probabilities()[0][self.FROM_STARTING_YEAR]
             # Assume we start from where we actually are in the current time of perils, but in
             # future ones we start from year 0
-        return min(self.mc.absorption_probabilities()[0][0], 1)
+        return min(self.exit_probabilities()[0][self.FROM_YEAR_0], 1)
 
     def preindustrial_given_perils(self, k1):
         """Return the overall probability of transitioning to a preindustrial state for the kth
@@ -92,9 +171,9 @@ class IntraPerilsMCWrapper():
         if self.k + 1 >= constant.MAX_CIVILISATIONS:
             return 0
         if self.k == 0 and k1 == 1:
-            return self.mc.absorption_probabilities()[1][self.starting_year]
+            return self.exit_probabilities()[1][self.FROM_STARTING_YEAR]
         if self.k + 1 == k1:
-            return self.mc.absorption_probabilities()[1][0]
+            return self.exit_probabilities()[1][self.FROM_YEAR_0]
         # The only preindustrial state we can reach from perils_k is preindustrial_(k+1)
         return 0
 
@@ -104,9 +183,9 @@ class IntraPerilsMCWrapper():
         if self.k + 1 >= constant.MAX_CIVILISATIONS:
             return 0
         if self.k == 0 and k1 == 1:
-            return self.mc.absorption_probabilities()[2][self.starting_year]
+            return self.exit_probabilities()[2][self.FROM_STARTING_YEAR]
         if self.k + 1 == k1:
-            return self.mc.absorption_probabilities()[2][0]
+            return self.exit_probabilities()[2][self.FROM_YEAR_0]
         # The only industrial state we can reach from perils_k is industrial_(k+1)
         return 0
 
@@ -114,9 +193,9 @@ class IntraPerilsMCWrapper():
         """Return the overall probability of transitioning to a multiplanetary state for the kth
         civilisation, given that it's in a time of perils"""
         if self.k == 0 and k1 == 0:
-            return self.mc.absorption_probabilities()[3][self.starting_year]
+            return self.exit_probabilities()[3][self.FROM_STARTING_YEAR]
         if self.k == k1:
-            return self.mc.absorption_probabilities()[3][0]
+            return self.exit_probabilities()[3][self.FROM_YEAR_0]
         # The only multiplanetary state we can reach from perils_k is multiplanetary_k
         return 0
 
@@ -135,50 +214,81 @@ class IntraPerilsMCWrapper():
 class IntraMultiplanetaryMCWrapper():
     """Wrapper for a Markov chain representing the transition probabilities given different numbers
     of independent self-sustaining settlements in a multiplanetary state, between that time of
-    perils and the other civilisational states"""
-    def __init__(self, k):
+    perils and the other civilisational states. As with IntraPerilsMCWrapper, passing
+    exit_probabilities recreates the wrapper without building the chain."""
+    # Entries of exit_probabilities()
+    EXIT_STATES = ('extinction', 'preindustrial', 'industrial', 'perils', 'interstellar')
+
+    def __init__(self, k, exit_probabilities=None):
         self.k = k
+        self.mc = None
+        self.solve_residual = None # Only set by a mixed precision solve
+        self._exit_probabilities = exit_probabilities
+        if exit_probabilities is not None:
+            return
         print(f"Initialising IntraMultiplanetaryMCWrapper for k = {k}")
 
-        extinction_row =     [0] * (constant.MAX_PLANETS - 1) + [1,0,0,0,0]
-        preindustrial_row =  [0] * (constant.MAX_PLANETS - 1) + [0,1,0,0,0]
-        industrial_row =     [0] * (constant.MAX_PLANETS - 1) + [0,0,1,0,0]
-        perils_row =         [0] * (constant.MAX_PLANETS - 1) + [0,0,0,1,0]
-        interstellar_row =   [0] * (constant.MAX_PLANETS - 1) + [0,0,0,0,1]
         planet_range = range(2, constant.MAX_PLANETS + 1) # Python range excludes max value
 
+        # Gaining a settlement (or staying at the maximum) is whatever's left of each row, so as for
+        # advancing a progress year in IntraPerilsMCWrapper, it's recomputed below from the rest
+        remainder_columns = np.minimum(np.arange(1, constant.MAX_PLANETS), constant.MAX_PLANETS - 2)
         intra_transition_probabilities = {
-            q: [multiplanetary.transition_to_n_planets_given_multiplanetary(q, n)
-               for n in planet_range]
-            for q in planet_range}
-        exit_probabilities = {
-            q: [multiplanetary.extinction_given_multiplanetary(q),
-                multiplanetary.preindustrial_given_multiplanetary(),
-                multiplanetary.industrial_given_multiplanetary(),
-                multiplanetary.perils_given_multiplanetary(q),
-                multiplanetary.interstellar_given_multiplanetary(q)]
+            q: [0 if n - 2 == remainder_columns[q - 2]
+                else multiplanetary.transition_to_n_planets_given_multiplanetary(q, n)
+                for n in planet_range]
             for q in planet_range}
-
-        qth_planet_rows = [intra_transition_probabilities[q] + exit_probabilities[q]
-                           for q in planet_range]
+        # As for the perils sub-chain, impossible exits are left out of the chain
+        self.exit_targets = [index for index, target_state in enumerate(self.EXIT_STATES)
+                             if index == 0 or not multiplanetary.is_structurally_zero(target_state)]
+        exit_columns = [self._exit_column(self.EXIT_STATES[index], planet_range)
+                        for index in self.exit_targets]
+        exit_probabilities = {q: [column[q - 2] for column in exit_columns] for q in planet_range}
+
+        qth_planet_rows = np.array([intra_transition_probabilities[q] + exit_probabilities[q]
+                                    for q in planet_range])
+        qth_planet_rows[np.arange(constant.MAX_PLANETS - 1), remainder_columns] = row_remainders(
+            qth_planet_rows, remainder_columns)
 
         # qth_planet_list = {q:qth_planet_rows[q - 2] for q in planet_range}
         # Useful for figuring out the row corresponding to q planets, not used in code
 
-        probability_matrix = qth_planet_rows + [extinction_row,
-                                                preindustrial_row,
-                                                industrial_row,
-                                                perils_row,
-                                                interstellar_row]
+        absorbing_rows = [[0] * (constant.MAX_PLANETS - 1)
+                          + [int(row == column) for column in range(len(self.exit_targets))]
+                          for row in range(len(self.exit_targets))]
 
         planet_counts = [f"{num}" for num in planet_range]
-        self.mc = MarkovChain(probability_matrix, planet_counts
-                                                + ['Extinction',
-                                                    'Preindustrial',
-                                                    'Industrial',
-                                                    'Perils',
-                                                    'Interstellar'])
-
+        states = planet_counts + [self.EXIT_STATES[index].capitalize()
+                                  for index in self.exit_targets]
+
+        probability_matrix = validation.validated(np.vstack([qth_planet_rows, absorbing_rows]),
+                                                  states,
+                                                  f'multiplanetary-{k} sub-chain')
+        self.mc = MarkovChain(probability_matrix, states)
+
+    @staticmethod
+    def _exit_column(target_state, planet_range):
+        """The probabilities of exiting to target_state from each planet count in planet_range"""
+        if target_state == 'extinction':
+            return multiplanetary.parameterised_decaying_transition_probabilities(
+                'extinction', planet_range).tolist()
+        if target_state == 'preindustrial':
+            return [multiplanetary.preindustrial_given_multiplanetary()] * len(planet_range)
+        if target_state == 'industrial':
+            return [multiplanetary.industrial_given_multiplanetary()] * len(planet_range)
+        if target_state == 'perils':
+            return [multiplanetary.perils_given_multiplanetary(q) for q in planet_range]
+        return multiplanetary.interstellar_given_multiplanetary_counts(planet_range).tolist()
+
+    def exit_probabilities(self):
+        """Solve the chain if necessary, and return the probabilities of it ending in each of its
+        absorbing states (Extinction, Preindustrial, Industrial, Perils, Interstellar), starting
+        from two settlements"""
+        if self._exit_probabilities is None:
+            self._exit_probabilities = np.zeros(len(self.EXIT_STATES))
+            self._exit_probabilities[self.exit_targets] = _absorption_probabilities(
+                self, f'multiplanetary-{self.k}', constant.MAX_PLANETS - 1, [0])[:, 0]
+        return self._exit_probabilities
 
     def extinction_given_multiplanetary(self):
         """Return the overall transitional probability of extinction for the kth civilisation, given
@@ -186,11 +296,11 @@ class IntraMultiplanetaryMCWrapper():
         if self.k + 1 >= constant.MAX_CIVILISATIONS:
             # When we hit the last civilisation, anything that would regress us means we just go
             # extinct
-            return (self.mc.absorption_probabilities()[0][0]
-                    + self.mc.absorption_probabilities()[1][0]
-                    + self.mc.absorption_probabilities()[2][0]
-                    + self.mc.absorption_probabilities()[3][0])
-        return self.mc.absorption_probabilities()[0][0]
+            return (self.exit_probabilities()[0]
+                    + self.exit_probabilities()[1]
+                    + self.exit_probabilities()[2]
+                    + self.exit_probabilities()[3])
+        return self.exit_probabilities()[0]
 
     def preindustrial_given_multiplanetary(self, k1):
         """Return the overall transitional probability to a preindustrial state for the kth
@@ -199,7 +309,7 @@ class IntraMultiplanetaryMCWrapper():
         # When we hit the last civilisation, anything that would regress us means we just go extinct
             return 0
         if self.k + 1 == k1:
-            return self.mc.absorption_probabilities()[1][0]
+            return self.exit_probabilities()[1]
         return 0
 
     def industrial_given_multiplanetary(self, k1):
@@ -209,7 +319,7 @@ class IntraMultiplanetaryMCWrapper():
         # When we hit the last civilisation, anything that would regress us means we just go extinct
             return 0
         if self.k + 1 == k1:
-            return self.mc.absorption_probabilities()[2][0]
+            return self.exit_probabilities()[2]
         return 0
 
     def perils_given_multiplanetary(self, k1):
@@ -219,10 +329,10 @@ class IntraMultiplanetaryMCWrapper():
         # When we hit the last civilisation, anything that would regress us means we just go extinct
             return 0
         if self.k + 1 == k1:
-            return self.mc.absorption_probabilities()[3][0]
+            return self.exit_probabilities()[3]
         return 0
 
     def interstellar_given_multiplanetary(self):
         """Return the overall transitional probability to an interstellar state for the kth
         civilisation, given that it's in a multiplanetary state"""
-        return self.mc.absorption_probabilities()[4][0]
+        return self.exit_probabilities()[4]
@@ -0,0 +1,219 @@
+# pylint: disable=too-many-locals
+
+"""A precomputed surrogate for the full calc, for exploratory queries that need answers faster than a
+run could give them.
+
+Building one evaluates the full chain at every point of a grid over a few params (holding everything
+else at some base params), which takes as long as that many runs. The resulting artifact then
+answers queries anywhere inside the grid by multilinear interpolation - a tensor-product linear
+spline - in microseconds, along with an estimate of the interpolation error. Use exact runs for any
+numbers you intend to publish.
+
+Build one with eg
+
+    python -m calculators.full_calc.surrogate build --spec my_spec.yml --output surrogate.npz
+
+where the spec is YAML in the same format as DEFAULT_SPEC below, then query it with
+
+    python -m calculators.full_calc.surrogate query surrogate.npz perils.extinction.y_scale=0.0005
+"""
+
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import json
+
+import numpy as np
+import yaml
+
+from calculators.full_calc import full_chain
+from calculators.full_calc.params import Params, parameter_hash, with_overrides
+
+DEFAULT_SPEC = {
+    'runtime_constants': {'MAX_PLANETS': 10, 'MAX_CIVILISATIONS': 5, 'MAX_PROGRESS_YEARS': 1000},
+    'dimensions': {
+        # The asymptotic annual risk of each exit from a time of perils, which the yml describes
+        # as the main determinants of the results
+        'perils.extinction.y_scale': [0.0001, 0.00035, 0.001, 0.002],
+        'perils.preindustrial.y_scale': [0.0003, 0.0009, 0.002],
+        'perils.industrial.y_scale': [0.0005, 0.0015, 0.003],
+        'perils.multiplanetary.y_scale': [0.02, 0.07, 0.15],
+    },
+}
+
+SURROGATE_PATH = 'full_calc_surrogate.npz'
+
+
+def _evaluate_point(params_dict, runtime_constants):
+    return full_chain.run(params_dict, runtime_constants)['success_probabilities']
+
+
+def build_surrogate(spec=None, params_dict=None, max_workers=None):
+    """Evaluate the full chain over the grid described by spec (see DEFAULT_SPEC), varying the
+    given dimensions of params_dict (defaulting to params.yml), and return a Surrogate fitted to
+    the results. Runs are spread across max_workers processes (default: one per CPU)."""
+    spec = spec or DEFAULT_SPEC
+    params_dict = params_dict if params_dict is not None else Params().dictionary
+    runtime_constants = {**full_chain.current_runtime_constants(),
+                         **spec.get('runtime_constants', {})}
+    dimension_names = list(spec['dimensions'])
+    axes = [np.array(sorted(values), dtype=float) for values in spec['dimensions'].values()]
+
+    grid_points = list(itertools.product(*axes))
+    point_params = [with_overrides(params_dict, dict(zip(dimension_names, map(float, point))))
+                    for point in grid_points]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_evaluate_point, point_params,
+                                    itertools.repeat(runtime_constants)))
+
+    output_states = list(results[0])
+    values = np.array([[result[state] for state in output_states] for result in results])
+    values = values.reshape(tuple(len(axis) for axis in axes) + (len(output_states),))
+
+    return Surrogate(dimension_names, axes, values, _interpolation_errors(axes, values),
+                     output_states, params_dict, runtime_constants)
+
+
+def _interpolation_errors(axes, values):
+    """Estimate the error of linear interpolation at each grid node as the sum over dimensions of
+    h^2/8 * |f''|, the standard bound for one dimension, with f'' taken from second divided
+    differences (so dimensions with fewer than three points contribute no estimate)"""
+    errors = np.zeros(values.shape)
+    for dimension, axis in enumerate(axes):
+        if len(axis) < 3:
+            continue
+        along = np.moveaxis(values, dimension, 0)
+        spacing = np.diff(axis)
+        slopes = np.diff(along, axis=0) / spacing.reshape((-1,) + (1,) * (along.ndim - 1))
+        curvatures = np.abs(2 * np.diff(slopes, axis=0)
+                            / (spacing[1:] + spacing[:-1]).reshape((-1,) + (1,) * (along.ndim - 1)))
+        # Each endpoint takes the curvature of its nearest interior node
+        curvatures = np.concatenate([curvatures[:1], curvatures, curvatures[-1:]])
+        widest_neighbouring_cell = np.maximum(np.concatenate([spacing[:1], spacing]),
+                                              np.concatenate([spacing, spacing[-1:]]))
+        errors += np.moveaxis(
+            curvatures * (widest_neighbouring_cell ** 2 / 8).reshape((-1,) + (1,) * (along.ndim - 1)),
+            0, dimension)
+    return errors
+
+
+class Surrogate:
+    """Interpolates full calc success probabilities over a grid of params. Load a saved one with
+    Surrogate.load(path)."""
+    def __init__(self, dimension_names, axes, values, errors, output_states, params_dict,
+                 runtime_constants):
+        self.dimension_names = list(dimension_names)
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.values = np.asarray(values)
+        self.errors = np.asarray(errors)
+        self.output_states = list(output_states)
+        self.params_dict = params_dict
+        self.runtime_constants = runtime_constants
+        self._axis_lists = [axis.tolist() for axis in self.axes] # bisect is faster on lists
+
+    def save(self, path):
+        """Write the surrogate to an .npz artifact"""
+        np.savez(path,
+                 dimension_names=np.array(self.dimension_names),
+                 values=self.values,
+                 errors=self.errors,
+                 output_states=np.array(self.output_states),
+                 params=np.array(json.dumps(self.params_dict)),
+                 runtime_constants=np.array(json.dumps(self.runtime_constants)),
+                 **{f'axis_{index}': axis for index, axis in enumerate(self.axes)})
+
+    @classmethod
+    def load(cls, path):
+        """Read a surrogate written by save()"""
+        with np.load(path) as artifact:
+            dimension_names = artifact['dimension_names'].tolist()
+            return cls(dimension_names,
+                       [artifact[f'axis_{index}'] for index in range(len(dimension_names))],
+                       artifact['values'],
+                       artifact['errors'],
+                       artifact['output_states'].tolist(),
+                       json.loads(artifact['params'].item()),
+                       json.loads(artifact['runtime_constants'].item()))
+
+    def predict(self, point):
+        """Interpolated success probabilities and their estimated errors at point, a dict of
+        dimension name to value (dimensions left out take their base param value). Returns a
+        pair of dicts keyed by state. Raises ValueError outside the grid, where the surrogate
+        would have to extrapolate."""
+        values = self.values
+        errors = self.errors
+        for dimension, axis in zip(self.dimension_names, self._axis_lists):
+            value = point.get(dimension, self._base_value(dimension))
+            if not axis[0] <= value <= axis[-1]:
+                raise ValueError(f"{dimension} = {value} is outside the surrogate's range "
+                                 f"[{axis[0]}, {axis[-1]}]")
+            if len(axis) == 1:
+                values, errors = values[0], errors[0]
+                continue
+            index = min(bisect_right(axis, value) - 1, len(axis) - 2)
+            weight = (value - axis[index]) / (axis[index + 1] - axis[index])
+            values = values[index] * (1 - weight) + values[index + 1] * weight
+            errors = np.maximum(errors[index], errors[index + 1])
+        return dict(zip(self.output_states, values.tolist())), dict(zip(self.output_states,
+                                                                        errors.tolist()))
+
+    def estimate_for(self, params_dict, runtime_constants):
+        """predict() for a full params dict, or None if it differs from the surrogate's base params
+        or runtime constants anywhere other than its dimensions, or falls outside its grid"""
+        if runtime_constants != self.runtime_constants:
+            return None
+        point = {dimension: _value_at(params_dict, dimension)
+                 for dimension in self.dimension_names}
+        if parameter_hash(with_overrides(params_dict, {dimension: self._base_value(dimension)
+                                                       for dimension in self.dimension_names}),
+                          runtime_constants) != parameter_hash(self.params_dict, runtime_constants):
+            return None
+        try:
+            return self.predict(point)
+        except ValueError:
+            return None
+
+    def _base_value(self, dimension):
+        return _value_at(self.params_dict, dimension)
+
+
+def _value_at(params_dict, dotted_path):
+    for key in dotted_path.split('.'):
+        params_dict = params_dict[key]
+    return params_dict
+
+
+def main():
+    """Command line interface - see the module docstring"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Evaluate a grid and save a surrogate')
+    build_parser.add_argument('--spec', help='YAML grid spec (default: DEFAULT_SPEC)')
+    build_parser.add_argument('--output', default=SURROGATE_PATH)
+    build_parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+
+    query_parser = subparsers.add_parser('query', help='Query a saved surrogate')
+    query_parser.add_argument('surrogate')
+    query_parser.add_argument('point', nargs='*', help='dimension=value pairs')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        spec = None
+        if args.spec:
+            with open(args.spec, 'r', encoding='utf-8') as stream:
+                spec = yaml.safe_load(stream)
+        build_surrogate(spec, max_workers=args.workers).save(args.output)
+        print(f'Saved surrogate to {args.output}')
+    else:
+        point = {dimension: float(value)
+                 for dimension, value in (pair.split('=', 1) for pair in args.point)}
+        values, errors = Surrogate.load(args.surrogate).predict(point)
+        for state, value in values.items():
+            print(f'{state}: {value} (+/- {errors[state]:.2g})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Structured timing and memory instrumentation for full calc runs.
+
+Code marks out a phase of work with
+
+    with tracing.span('perils_build', k=k):
+        ...
+
+which does nothing unless a Tracer is active (see tracing()), in which case the tracer records the
+span's wall time, CPU time and the process's peak RSS at its end, along with any attributes. A
+tracer's spans can be written as JSON lines, or as a Chrome trace file to load into
+chrome://tracing or https://ui.perfetto.dev.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+JSONL = 'jsonl'
+CHROME = 'chrome'
+FORMATS = (JSONL, CHROME)
+
+_active_tracer = None
+
+
+def peak_rss_bytes():
+    """The peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Linux reports kilobytes
+
+
+class Tracer:
+    """Collects spans, each a dict of name, start (seconds since the tracer was created),
+    wall_seconds, cpu_seconds, peak_rss_bytes and attributes, in the order they finish"""
+    def __init__(self):
+        self.spans = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Record the enclosed block as a span called name"""
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.spans.append({'name': name,
+                               'start': start - self._origin,
+                               'wall_seconds': time.perf_counter() - start,
+                               'cpu_seconds': time.process_time() - start_cpu,
+                               'peak_rss_bytes': peak_rss_bytes(),
+                               'attributes': attributes})
+
+    def totals(self):
+        """An ordered dict of span name to its total wall seconds across every span of that name"""
+        totals = OrderedDict()
+        for span in self.spans:
+            totals[span['name']] = totals.get(span['name'], 0) + span['wall_seconds']
+        return totals
+
+    def write(self, path, trace_format=JSONL):
+        """Write the spans to path as JSON lines (one span per line) or a Chrome trace"""
+        if trace_format not in FORMATS:
+            raise ValueError(f"Unknown trace format: {trace_format} (expected one of {FORMATS})")
+        with open(path, 'w', encoding='utf-8') as trace_file:
+            if trace_format == JSONL:
+                for span in self.spans:
+                    trace_file.write(json.dumps(span) + '\n')
+            else:
+                json.dump(self.chrome_trace(), trace_file)
+
+    def chrome_trace(self):
+        """The spans in Chrome's Trace Event Format, as complete ('X') events"""
+        return {'traceEvents': [{'name': span['name'],
+                                 'cat': 'full_calc',
+                                 'ph': 'X',
+                                 'ts': span['start'] * 1e6,
+                                 'dur': span['wall_seconds'] * 1e6,
+                                 'pid': os.getpid(),
+                                 'tid': threading.get_ident(),
+                                 'args': {'cpu_seconds': span['cpu_seconds'],
+                                          'peak_rss_bytes': span['peak_rss_bytes'],
+                                          **span['attributes']}}
+                                for span in self.spans],
+                'displayTimeUnit': 'ms'}
+
+
+@contextmanager
+def tracing(tracer):
+    """Make tracer the one that span() records to for the duration of the block"""
+    global _active_tracer # pylint: disable=global-statement
+    previous_tracer = _active_tracer
+    _active_tracer = tracer
+    try:
+        yield tracer
+    finally:
+        _active_tracer = previous_tracer
+
+
+def span(name, **attributes):
+    """A context manager recording the enclosed block as a span on the active tracer, if any"""
+    if _active_tracer is None:
+        return nullcontext()
+    return _active_tracer.span(name, **attributes)
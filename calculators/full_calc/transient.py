@@ -0,0 +1,180 @@
+"""Transient analysis of the full model: how the probability of having become interstellar (or gone
+extinct) grows over time, rather than only its eventual value. Stream the cumulative absorption
+curve from our current time of perils as CSV with eg
+
+    python -m calculators.full_calc.transient --max-years 100000 --every 100
+
+Each step is a year. The state distribution within every time of perils (by progress year) and
+multiplanetary state (by planet count) is propagated with sparse matrix-vector products, since even
+one dense matrix power is infeasible once a sub-chain has thousands of states. The preperils states
+have no internal structure, so they're treated as lasting exactly their expected time in years
+(see preperils.py), with their extinction probability counted when they end. Stretches of time when
+nothing is in a time of perils or multiplanetary state are skipped.
+"""
+
+from collections import namedtuple
+from contextlib import redirect_stdout
+import argparse
+import io
+import sys
+
+import numpy as np
+from scipy import sparse
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc import preperils
+from calculators.full_calc import sub_markov_chains
+
+# Probability mass left in the perils and multiplanetary states below which we stop propagating it
+TOLERANCE = 1e-15
+
+CurvePoint = namedtuple('CurvePoint', ['year', 'extinction', 'interstellar'])
+
+
+def _sparse_blocks(chain):
+    """The transposed transitions between the transient states of a sub-chain wrapper's chain, and
+    from them to each of its EXIT_STATES (including any it left out of the chain), as sparse
+    matrices, so that with x a distribution over the transient states, transitions @ x is next
+    year's distribution and exits @ x the probabilities of exiting to each state this year"""
+    transition_matrix = np.asarray(chain.mc.p)
+    transient_count = len(chain.mc.states) - len(chain.exit_targets)
+    exits = np.zeros((len(chain.EXIT_STATES), transient_count))
+    exits[chain.exit_targets] = transition_matrix[:transient_count, transient_count:].T
+    return (sparse.csr_matrix(transition_matrix[:transient_count, :transient_count].T),
+            sparse.csr_matrix(exits))
+
+
+def absorption_curve(max_years, tolerance=TOLERANCE):
+    """Yield a CurvePoint of the cumulative probabilities of having gone extinct and having become
+    interstellar by the end of each year, starting from the current progress year of our current
+    time of perils, for up to max_years years. Years in which nothing changes are skipped, and it
+    stops early once everything has been absorbed (to within tolerance).
+
+    Uses the params and runtime constants currently in use (see full_chain.use_params())."""
+    civilisations = constant.MAX_CIVILISATIONS
+    # Every civilisation's states side by side, so each year takes a few sparse products. Each
+    # sub-chain is converted as soon as it's built, so only one dense matrix is held at a time.
+    perils_blocks = []
+    with redirect_stdout(io.StringIO()): # The sub-chains announce themselves as they're built
+        for k in range(civilisations):
+            chain = sub_markov_chains.IntraPerilsMCWrapper(k)
+            perils_blocks.append(_sparse_blocks(chain))
+            if k == 0:
+                starting_year = chain.starting_year
+            del chain
+        # Only how we leave a multiplanetary state depends on k, so one chain does for every k
+        multiplanetary_blocks = _sparse_blocks(sub_markov_chains.IntraMultiplanetaryMCWrapper(0))
+    perils_transitions = sparse.block_diag([block[0] for block in perils_blocks], format='csr')
+    perils_exits = sparse.block_diag([block[1] for block in perils_blocks], format='csr')
+    multiplanetary_transitions, multiplanetary_exits = (
+        sparse.kron(sparse.identity(civilisations), block, format='csr')
+        for block in multiplanetary_blocks)
+    del perils_blocks, multiplanetary_blocks
+    perils_exit = sub_markov_chains.IntraPerilsMCWrapper.EXIT_STATES.index
+    multiplanetary_exit = sub_markov_chains.IntraMultiplanetaryMCWrapper.EXIT_STATES.index
+
+    perils_distributions = np.zeros((civilisations, constant.MAX_PROGRESS_YEARS))
+    perils_distributions[0, starting_year] = 1
+    multiplanetary_distributions = np.zeros((civilisations, constant.MAX_PLANETS - 1))
+
+    # Year -> [probability of going extinct, probabilities of entering each perils-k] as the
+    # preperils states that were entered earlier end
+    scheduled = {}
+    extinction = interstellar = 0
+
+    def _schedule(year, extinction_probability, perils_k=None, perils_probability=0):
+        arrivals = scheduled.setdefault(year, [0, np.zeros(civilisations)])
+        arrivals[0] += extinction_probability
+        if perils_k is not None:
+            arrivals[1][perils_k] += perils_probability
+
+    # Each preperils state's length in years and probability of surviving it, by civilisation
+    preindustrial_years = [max(round(preperils.expected_time_in_preindustrial(k)), 1)
+                           for k in range(civilisations)]
+    industrial_years = [max(round(preperils.expected_time_in_industrial(k)), 1)
+                        for k in range(civilisations)]
+    industrial_given_preindustrial = [preperils.industrial_given_preindustrial(k, k)
+                                      for k in range(civilisations)]
+    perils_given_industrial = [preperils.perils_given_industrial(k, k)
+                               for k in range(civilisations)]
+
+    def _enter_industrial(year, k, probability):
+        _schedule(year + industrial_years[k], probability * (1 - perils_given_industrial[k]),
+                  k, probability * perils_given_industrial[k])
+
+    def _enter_preindustrial(year, k, probability):
+        end = year + preindustrial_years[k]
+        _schedule(end, probability * (1 - industrial_given_preindustrial[k]))
+        _enter_industrial(end, k, probability * industrial_given_preindustrial[k])
+
+    year = 0
+    while year < max_years:
+        # Everything that leaves a state this year arrives at its next one at the start of the next
+        next_year = year + 1
+        next_perils = (perils_transitions @ perils_distributions.ravel()).reshape(
+            perils_distributions.shape)
+        next_multiplanetary = (multiplanetary_transitions
+                               @ multiplanetary_distributions.ravel()).reshape(
+                                   multiplanetary_distributions.shape)
+        # Rows are civilisations, columns each wrapper's EXIT_STATES
+        from_perils = (perils_exits @ perils_distributions.ravel()).reshape(civilisations, -1)
+        from_multiplanetary = (multiplanetary_exits
+                               @ multiplanetary_distributions.ravel()).reshape(civilisations, -1)
+
+        extinction += (from_perils[:, perils_exit('extinction')].sum()
+                       + from_multiplanetary[:, multiplanetary_exit('extinction')].sum())
+        interstellar += (from_perils[:, perils_exit('interstellar')].sum()
+                         + from_multiplanetary[:, multiplanetary_exit('interstellar')].sum())
+        next_multiplanetary[:, 0] += from_perils[:, perils_exit('multiplanetary')]
+        to_preindustrial = (from_perils[:, perils_exit('preindustrial')]
+                            + from_multiplanetary[:, multiplanetary_exit('preindustrial')])
+        to_industrial = (from_perils[:, perils_exit('industrial')]
+                         + from_multiplanetary[:, multiplanetary_exit('industrial')])
+        to_perils = from_multiplanetary[:, multiplanetary_exit('perils')]
+        # As in the full chain, regressing from the last civilisation means extinction
+        extinction += to_preindustrial[-1] + to_industrial[-1] + to_perils[-1]
+        next_perils[1:, 0] += to_perils[:-1]
+        for k in np.flatnonzero(to_preindustrial[:-1]):
+            _enter_preindustrial(next_year, k + 1, to_preindustrial[k])
+        for k in np.flatnonzero(to_industrial[:-1]):
+            _enter_industrial(next_year, k + 1, to_industrial[k])
+
+        arrivals = scheduled.pop(next_year, None)
+        if arrivals:
+            extinction += arrivals[0]
+            next_perils[:, 0] += arrivals[1]
+        perils_distributions, multiplanetary_distributions = next_perils, next_multiplanetary
+        yield CurvePoint(next_year, extinction, interstellar)
+
+        year = next_year
+        if perils_distributions.sum() + multiplanetary_distributions.sum() <= tolerance:
+            if not scheduled:
+                return
+            # Nothing happens until the next preperils state ends
+            perils_distributions[:] = 0
+            multiplanetary_distributions[:] = 0
+            year = min(scheduled) - 1
+
+
+def main():
+    """Command line interface - see the module docstring"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-years', type=int, required=True)
+    parser.add_argument('--every', type=int, default=1,
+                        help='Only write years that are a multiple of this (default: every year)')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    sys.stdout.write('year,extinction,interstellar\n')
+    point = None
+    for point in absorption_curve(args.max_years, args.tolerance):
+        if point.year % args.every == 0:
+            sys.stdout.write(f'{point.year},{point.extinction!r},{point.interstellar!r}\n')
+            sys.stdout.flush()
+    if point is not None and point.year % args.every != 0:
+        sys.stdout.write(f'{point.year},{point.extinction!r},{point.interstellar!r}\n')
+
+
+if __name__ == '__main__':
+    main()
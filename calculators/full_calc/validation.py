@@ -0,0 +1,57 @@
+"""Checks that a transition matrix is valid - no negative entries, and every row summing to 1 - before
+it's handed to pydtmc, whose own check only says that something is wrong somewhere (and loops over
+every entry in Python). This is vectorised, so it takes milliseconds even for the largest perils
+sub-chains, and is always on.
+
+If constant.REPAIR_TRANSITION_PROBABILITIES is set, invalid rows are repaired instead of stopping
+the run: negative entries are set to 0 and each row rescaled to sum to 1, with a warning naming the
+worst of them.
+"""
+
+import warnings
+
+import numpy as np
+
+import calculators.full_calc.runtime_constants as constant
+
+# Rows are normally within a few multiples of machine epsilon of summing to 1
+TOLERANCE = 1e-9
+MAX_REPORTED_STATES = 5
+
+
+class InvalidTransitionProbabilities(ValueError):
+    """Raised when a transition matrix has negative entries or rows that don't sum to 1"""
+
+
+def row_errors(matrix):
+    """For each row of matrix, the larger of how far it sums from 1 and how negative its most
+    negative entry is"""
+    return np.maximum(np.abs(matrix.sum(axis=1) - 1), -np.minimum(matrix.min(axis=1), 0))
+
+
+def validated(matrix, states, chain_name, tolerance=TOLERANCE, repair=None):
+    """matrix (anything numpy can turn into a square float array) as an array, after checking every
+    row against tolerance. If any fail, raises InvalidTransitionProbabilities naming the worst of
+    them by their state in states, unless repair (default: constant.REPAIR_TRANSITION_PROBABILITIES)
+    is set, in which case they're repaired in place with a warning."""
+    matrix = np.asarray(matrix, dtype=float)
+    errors = row_errors(matrix)
+    invalid_rows = np.flatnonzero(errors > tolerance)
+    if not invalid_rows.size:
+        return matrix
+
+    invalid_rows = invalid_rows[np.argsort(-errors[invalid_rows], kind='stable')]
+    description = ', '.join(
+        f"{states[row]} (sums to {matrix[row].sum():.12g}, smallest entry {matrix[row].min():.3g})"
+        for row in invalid_rows[:MAX_REPORTED_STATES])
+    message = (f"The {chain_name} has {invalid_rows.size} rows of transition probabilities that "
+               f"don't sum to 1 or have negative entries, the worst being from {description}")
+    if not (constant.REPAIR_TRANSITION_PROBABILITIES if repair is None else repair):
+        raise InvalidTransitionProbabilities(message)
+
+    rows = matrix[invalid_rows]
+    np.maximum(rows, 0, out=rows)
+    rows /= rows.sum(axis=1, keepdims=True)
+    matrix[invalid_rows] = rows
+    warnings.warn(message + ' - these have been renormalised')
+    return matrix
@@ -0,0 +1,248 @@
+# pylint: disable=broad-except, invalid-name
+
+"""A small HTTP/JSON server for other local services to evaluate the calculators without importing
+Streamlit or shelling out to full_calc.py. Start it with
+
+    python -m calculators.server --port 8765
+
+It only listens on 127.0.0.1, and exposes
+
+- GET /health
+- POST /simple with a JSON object of SimpleCalc keyword transition probabilities (omitted ones
+  default to 0), returning {"success_probabilities": {state: probability}}
+- POST /full with {"params": {...}, "runtime_constants": {...}}, both optional overrides (as taken
+  by calculators/full_calc/batch.py), returning {"success_probabilities": ..., "runtime": ...}
+
+Identical requests that arrive while one is already being computed wait for that computation
+rather than starting another, and results are kept in LRU caches. Concurrent simple calc requests
+are gathered into micro-batches and solved with one vectorised call. Full calc requests run on a
+pool of worker processes, which share sub-chains between requests as the batch runner does.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from calculators.full_calc import batch
+from calculators.full_calc import full_chain
+from calculators.full_calc.params import Params, parameter_hash, with_overrides
+from calculators.full_calc.predictor import CALIBRATION_PATH, LimitExceeded, Predictor
+from calculators.simple_calc import simple_calc
+
+HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+SIMPLE_CALC_CACHE_SIZE = 4096
+FULL_CALC_CACHE_SIZE = 256
+FULL_CALC_WORKERS = 2
+
+# A micro-batch is solved once it has this many requests, or this long after its first one arrived
+MAX_BATCH_SIZE = 256
+MAX_BATCH_WAIT_SECONDS = 0.002
+
+
+class CoalescingCache:
+    """An LRU cache of results that also coalesces concurrent requests for the same key into
+    a single computation"""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.computations = 0
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.RLock() # Re-entrant, since a future may already be done when we
+        # add its callback, in which case the callback runs immediately in this thread
+
+    def result(self, key, submit):
+        """The result for key, from the cache, from a computation of it that's already in flight,
+        or from a new one started by calling submit() (which should return a Future). Raises
+        whatever the computation raised."""
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+            future = self._in_flight.get(key)
+            if future is None:
+                self.computations += 1
+                future = submit()
+                self._in_flight[key] = future
+                future.add_done_callback(lambda finished: self._finished(key, finished))
+        return future.result()
+
+    def _finished(self, key, future):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if future.exception() is None:
+                self._results[key] = future.result()
+                if len(self._results) > self.maxsize:
+                    self._results.popitem(last=False)
+
+
+class SimpleCalcBatcher:
+    """Gathers simple calc evaluations submitted from many threads into micro-batches for
+    simple_calc.batch_absorption_probabilities()"""
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_seconds=MAX_BATCH_WAIT_SECONDS):
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.batch_sizes = [] # For monitoring
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, transition_probabilities):
+        """A Future for the success probabilities of the given (already validated) keyword
+        transition probabilities"""
+        future = Future()
+        self._queue.put((transition_probabilities, future))
+        return future
+
+    def close(self):
+        """Stop once the requests already submitted have been answered"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            requests = [item]
+            deadline = time.monotonic() + self.max_wait_seconds
+            while len(requests) < self.max_batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None) # Stop after answering this batch
+                    break
+                requests.append(item)
+            self.batch_sizes.append(len(requests))
+            try:
+                absorption_probabilities = simple_calc.batch_absorption_probabilities(
+                    [transition_probabilities for transition_probabilities, _ in requests])
+            except Exception as error:
+                for _, future in requests:
+                    future.set_exception(error)
+                continue
+            for (_, future), probabilities in zip(requests, absorption_probabilities):
+                future.set_result({'success_probabilities': dict(zip(
+                    simple_calc.TRANSIENT_STATES,
+                    probabilities[simple_calc.ABSORBING_STATES.index('Interstellar')].tolist()))})
+
+
+class CalculatorServer(ThreadingHTTPServer):
+    """The HTTP server, plus the caches and workers its requests share. Use port 0 to pick any
+    free port (see server_address)."""
+    daemon_threads = True
+    request_queue_size = 128 # The default of 5 resets connections under even modest concurrency
+
+    def __init__(self, port=DEFAULT_PORT, full_calc_workers=FULL_CALC_WORKERS, predictor=None):
+        super().__init__((HOST, port), _RequestHandler)
+        self.predictor = predictor
+        self.base_params = Params().dictionary
+        self.base_runtime_constants = full_chain.current_runtime_constants()
+        self.simple_calc_batcher = SimpleCalcBatcher()
+        self.simple_calc_results = CoalescingCache(SIMPLE_CALC_CACHE_SIZE)
+        self.full_calc_results = CoalescingCache(FULL_CALC_CACHE_SIZE)
+        # Worker processes are spawned rather than forked, since forking a process with threads
+        # running can deadlock
+        self.full_calc_executor = ProcessPoolExecutor(
+            max_workers=full_calc_workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def simple_calc(self, request):
+        """The response to a /simple request"""
+        if not isinstance(request, dict):
+            raise ValueError('Expected a JSON object of transition probabilities')
+        simple_calc.transition_matrix(**request) # Validate here, so one bad request can't fail
+        # a whole batch
+        key = tuple(float(request.get(name, 0))
+                    for name in simple_calc.TRANSITION_PROBABILITY_NAMES)
+        return self.simple_calc_results.result(
+            key, lambda: self.simple_calc_batcher.submit(request))
+
+    def full_calc(self, request):
+        """The response to a /full request"""
+        if not isinstance(request, dict) or set(request) - {'params', 'runtime_constants'}:
+            raise ValueError('Expected a JSON object with optional params and runtime_constants')
+        runtime_constants = {**self.base_runtime_constants, **request.get('runtime_constants', {})}
+        unknown_constants = set(runtime_constants) - set(full_chain.RUNTIME_CONSTANT_NAMES)
+        if unknown_constants:
+            raise ValueError(f"Unknown runtime constants: {', '.join(sorted(unknown_constants))}")
+        params_dict = with_overrides(self.base_params, request.get('params', {}))
+        if self.predictor:
+            self.predictor.check(runtime_constants)
+        return self.full_calc_results.result(
+            parameter_hash(params_dict, runtime_constants),
+            lambda: self.full_calc_executor.submit(batch.evaluate, params_dict, runtime_constants))
+
+    def server_close(self):
+        super().server_close()
+        self.simple_calc_batcher.close()
+        self.full_calc_executor.shutdown(cancel_futures=True)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    routes = {'/simple': CalculatorServer.simple_calc, '/full': CalculatorServer.full_calc}
+
+    def do_GET(self):
+        """Health check"""
+        if self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': f'Unknown path: {self.path}'})
+
+    def do_POST(self):
+        """Evaluate one of the calculators"""
+        route = self.routes.get(self.path)
+        if route is None:
+            self._send(404, {'error': f'Unknown path: {self.path}'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            response = route(self.server, request)
+        except LimitExceeded as error:
+            self._send(422, {'error': str(error)})
+        except (ValueError, TypeError, KeyError) as error:
+            self._send(400, {'error': str(error)})
+        except Exception as error:
+            self._send(500, {'error': f'{type(error).__name__}: {error}'})
+        else:
+            self._send(200, response)
+
+    def _send(self, status, body):
+        encoded = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+def main():
+    """Command line interface - see the module docstring"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--full-calc-workers', type=int, default=FULL_CALC_WORKERS)
+    args = parser.parse_args()
+
+    predictor = Predictor.load(CALIBRATION_PATH) if os.path.exists(CALIBRATION_PATH) else None
+    server = CalculatorServer(args.port, args.full_calc_workers, predictor)
+    print(f'Serving on http://{HOST}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,10 @@
 
 """Implementation of the simple calculator."""
 
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+import copy
+import threading
+from types import MappingProxyType
 from pydtmc import MarkovChain
 import numpy as np
 
@@ -20,6 +23,11 @@ import numpy as np
 
 # TODO Nia's comments: https://github.com/niajane/lrisk_calc_comments/pull/1/files
 
+STATES = ('Extinction', 'Preindustrial', 'Industrial', 'Present perils', 'Future perils',
+          'Multiplanetary', 'Interstellar')
+ABSORBING_STATES = ('Extinction', 'Interstellar')
+TRANSIENT_STATES = tuple(state for state in STATES if state not in ABSORBING_STATES)
+
 # Transition probabilities
 
 def rounded(func):
@@ -33,6 +41,112 @@ def rounded(func):
         return val
     return inner
 
+_TRANSITION_ATTRIBUTES = {
+    # Keyword name: (SimpleCalc attribute, origin state of the transition)
+    'extinction_given_preindustrial': ('ext_g_pi', 'Preindustrial'),
+    'extinction_given_industrial': ('ext_g_i', 'Industrial'),
+    'extinction_given_present_perils': ('ext_g_pp', 'Present perils'),
+    'preindustrial_given_present_perils': ('pi_g_pp', 'Present perils'),
+    'industrial_given_present_perils': ('i_g_pp', 'Present perils'),
+    'future_perils_given_present_perils': ('fp_g_pp', 'Present perils'),
+    'interstellar_given_present_perils': ('int_g_pp', 'Present perils'),
+    'extinction_given_future_perils': ('ext_g_fp', 'Future perils'),
+    'preindustrial_given_future_perils': ('pi_g_fp', 'Future perils'),
+    'industrial_given_future_perils': ('i_g_fp', 'Future perils'),
+    'interstellar_given_future_perils': ('int_g_fp', 'Future perils'),
+    'extinction_given_multiplanetary': ('ext_g_mp', 'Multiplanetary'),
+    'preindustrial_given_multiplanetary': ('pi_g_mp', 'Multiplanetary'),
+    'industrial_given_multiplanetary': ('i_g_mp', 'Multiplanetary'),
+    'future_perils_given_multiplanetary': ('fp_g_mp', 'Multiplanetary'),
+}
+
+class AbsorptionSolver:
+    """Absorption probabilities for a Markov chain, computed from the fundamental matrix
+    N = (I - Q)^-1 of its transient states. The chain's matrices are small enough that keeping N
+    itself is the cheapest factorisation, and it lets a change to a single row of the transition
+    matrix be absorbed with a Sherman-Morrison rank-one update instead of a fresh inversion.
+
+    Instances are never modified in place, so they can safely be shared."""
+
+    MAX_RANK_ONE_UPDATES = 50 # Refactorise from scratch after this many consecutive updates, so
+    # floating point errors can't accumulate indefinitely
+
+    def __init__(self, transition_matrix, transient_indices, absorbing_indices,
+                 fundamental_matrix=None, rank_one_updates=0):
+        self.transition_matrix = transition_matrix
+        self.transient_indices = transient_indices
+        self.absorbing_indices = absorbing_indices
+        if fundamental_matrix is None:
+            fundamental_matrix = np.linalg.inv(np.identity(len(transient_indices))
+                                               - self.transient_matrix())
+            rank_one_updates = 0
+        self.fundamental_matrix = fundamental_matrix
+        self.rank_one_updates = rank_one_updates
+
+    @classmethod
+    def from_transition_matrix(cls, transition_matrix):
+        """Create a solver for a full transition matrix, treating states which transition to
+        themselves with probability 1 as absorbing. Raises numpy.linalg.LinAlgError if some
+        transient states can never be absorbed."""
+        diagonal = np.diagonal(transition_matrix)
+        return cls(transition_matrix,
+                   transient_indices=np.flatnonzero(diagonal != 1),
+                   absorbing_indices=np.flatnonzero(diagonal == 1))
+
+    def transient_matrix(self):
+        """Q: transitions between transient states"""
+        return self.transition_matrix[np.ix_(self.transient_indices, self.transient_indices)]
+
+    def absorbing_matrix(self):
+        """R: transitions from transient states to absorbing ones"""
+        return self.transition_matrix[np.ix_(self.transient_indices, self.absorbing_indices)]
+
+    def absorption_probabilities(self):
+        """One row per absorbing state, one column per transient state, as in pydtmc"""
+        return (self.fundamental_matrix @ self.absorbing_matrix()).T
+
+    def with_row(self, row_index, row):
+        """Return a solver for the same chain but with transition matrix row row_index (a
+        transient state) replaced by row"""
+        transition_matrix = self.transition_matrix.copy()
+        transition_matrix[row_index] = row
+        if self.rank_one_updates >= self.MAX_RANK_ONE_UPDATES:
+            return AbsorptionSolver(transition_matrix, self.transient_indices,
+                                    self.absorbing_indices)
+        fundamental_matrix = self._updated_fundamental_matrices(row_index, np.array([row]))[0]
+        return AbsorptionSolver(transition_matrix, self.transient_indices, self.absorbing_indices,
+                                fundamental_matrix, self.rank_one_updates + 1)
+
+    def preview_rows(self, row_index, rows):
+        """Absorption probabilities for each candidate replacement of row row_index, as an
+        array of shape (len(rows), absorbing states, transient states)"""
+        fundamental_matrices = self._updated_fundamental_matrices(row_index, rows)
+        absorbing_matrices = np.repeat(self.absorbing_matrix()[np.newaxis], len(rows), axis=0)
+        position = self._transient_position(row_index)
+        absorbing_matrices[:, position] = rows[:, self.absorbing_indices]
+        return np.transpose(fundamental_matrices @ absorbing_matrices, (0, 2, 1))
+
+    def _transient_position(self, row_index):
+        positions = np.flatnonzero(self.transient_indices == row_index)
+        if not positions.size:
+            raise ValueError(f"Row {row_index} belongs to an absorbing state")
+        return positions[0]
+
+    def _updated_fundamental_matrices(self, row_index, rows):
+        """Sherman-Morrison: replacing row i of Q with q adds e_i d^T to Q, where d = q - Q[i], so
+        (I - Q - e_i d^T)^-1 = N + (N e_i)(d^T N) / (1 - d^T N e_i)"""
+        position = self._transient_position(row_index)
+        changes = rows[:, self.transient_indices] - self.transient_matrix()[position]
+        column = self.fundamental_matrix[:, position]
+        changed_rows = changes @ self.fundamental_matrix
+        denominators = 1 - changed_rows[:, position]
+        if np.any(np.isclose(denominators, 0)):
+            raise np.linalg.LinAlgError("Some transient states can never be absorbed")
+        return (self.fundamental_matrix
+                + column[np.newaxis, :, np.newaxis] * changed_rows[:, np.newaxis, :]
+                / denominators[:, np.newaxis, np.newaxis])
+
+
 class SimpleCalc:
     """Wrapper for the pydtmc MarkovChain class that calculates the probability of becoming
     interstellar given user-specified credences"""
@@ -69,6 +183,7 @@ class SimpleCalc:
         self.fp_g_mp = future_perils_given_multiplanetary
 
         self.mc = None
+        self.solver = None
 
     # From preindustrial
     @rounded
@@ -206,12 +321,8 @@ class SimpleCalc:
                     + self.industrial_given_multiplanetary()
                     + self.future_perils_given_multiplanetary())
 
-    def markov_chain(self):
-        """Generate or returned cached pydtmc MarkovChain object based on the user-specified
-        transitional probabilities according to the cyclical model of civilisation described
-        here: https://forum.effectivealtruism.org/s/gWsTMm5Nbgdxedyns/p/YnBwoNNqe6knBJH8p"""
-        if self.mc:
-            return self.mc
+    def transition_probability_rows(self):
+        """The rows of the transition matrix, one per state in STATES order"""
         extinction_transition_probabilities =     [1, 0, 0, 0, 0, 0, 0]
         preindustrial_transition_probabilities =  [self.extinction_given_preindustrial(),
                                                    0,
@@ -250,23 +361,83 @@ class SimpleCalc:
                                                    self.interstellar_given_multiplanetary()]
         interstellar_transition_probabilities =   [0, 0, 0, 0, 0, 0, 1]
 
-        transition_probability_matrix = [extinction_transition_probabilities,
-                                         preindustrial_transition_probabilities,
-                                         industrial_transition_probabilities,
-                                         present_perils_transition_probabilities,
-                                         future_perils_transition_probabilities,
-                                         multiplanetary_transition_probabilities,
-                                         interstellar_transition_probabilities]
-
-        self.mc = MarkovChain(transition_probability_matrix, ['Extinction',
-                                                             'Preindustrial',
-                                                             'Industrial',
-                                                             'Present perils',
-                                                             'Future perils',
-                                                             'Multiplanetary',
-                                                             'Interstellar'])
+        return [extinction_transition_probabilities,
+                preindustrial_transition_probabilities,
+                industrial_transition_probabilities,
+                present_perils_transition_probabilities,
+                future_perils_transition_probabilities,
+                multiplanetary_transition_probabilities,
+                interstellar_transition_probabilities]
+
+    def markov_chain(self):
+        """Generate or returned cached pydtmc MarkovChain object based on the user-specified
+        transitional probabilities according to the cyclical model of civilisation described
+        here: https://forum.effectivealtruism.org/s/gWsTMm5Nbgdxedyns/p/YnBwoNNqe6knBJH8p"""
+        if self.mc:
+            return self.mc
+        self.mc = MarkovChain(self.transition_probability_rows(), list(STATES))
         return self.mc
 
+    def absorption_solver(self):
+        """Generate or return the cached AbsorptionSolver for the current transition
+        probabilities"""
+        if self.solver is None:
+            self.solver = AbsorptionSolver.from_transition_matrix(
+                np.array(self.transition_probability_rows(), dtype=float))
+        return self.solver
+
+    def absorption_probabilities(self):
+        """Probabilities of ending in each absorbing state, laid out like pydtmc's
+        absorption_probabilities(): one row per absorbing state (Extinction, then Interstellar),
+        one column per transient state in STATES order."""
+        return self.absorption_solver().absorption_probabilities()
+
+    def transition_probabilities(self):
+        """The user-specified probabilities, as a dict of the constructor's keyword names to their
+        values"""
+        return {name: getattr(self, attribute)
+                for name, (attribute, _) in _TRANSITION_ATTRIBUTES.items()}
+
+    def update_transition_probabilities(self, **transition_probabilities):
+        """Change some of the user-specified probabilities (using the constructor's keyword
+        names). If they're all transitions out of the same state, only one row of the
+        transition matrix changes, so the cached solver is updated with a rank-one update rather
+        than being rebuilt."""
+        origin_states = {_TRANSITION_ATTRIBUTES[name][1] for name in transition_probabilities}
+        for name, value in transition_probabilities.items():
+            setattr(self, _TRANSITION_ATTRIBUTES[name][0], value)
+        self.mc = None
+
+        if self.solver is not None and len(origin_states) == 1:
+            origin_index = STATES.index(origin_states.pop())
+            self.solver = self.solver.with_row(
+                origin_index, self.transition_probability_rows()[origin_index])
+        else:
+            self.solver = None
+
+    def preview_absorption_probabilities(self, candidates):
+        """What-if absorption probabilities for each of a sequence of candidate changes, each
+        a dict of keyword transition probabilities out of one and the same origin state (eg
+        every value a slider could take, with the other sliders rebalanced to match).
+
+        Returns an array of shape (len(candidates), 2, 5), each entry laid out as in
+        absorption_probabilities(). Doesn't change this calculator."""
+        origin_states = {_TRANSITION_ATTRIBUTES[name][1]
+                         for candidate in candidates for name in candidate}
+        if len(origin_states) != 1:
+            raise ValueError("Every candidate must only change transitions out of the same state")
+        origin_index = STATES.index(origin_states.pop())
+
+        candidate_rows = []
+        for candidate in candidates:
+            candidate_calc = copy.copy(self)
+            for name, value in candidate.items():
+                setattr(candidate_calc, _TRANSITION_ATTRIBUTES[name][0], value)
+            candidate_rows.append(candidate_calc.transition_probability_rows()[origin_index])
+
+        return self.absorption_solver().preview_rows(origin_index,
+                                                     np.array(candidate_rows, dtype=float))
+
     # Convenience methods for the probability of direct-path transitions
 
     def probability_of_preindustrial_to_perils_directly(self):
@@ -275,23 +446,23 @@ class SimpleCalc:
 
     def net_interstellar_from_preindustrial(self):
         "Probability of eventually (by any path) becoming interstellar from a preindustrial state"
-        return self.markov_chain().absorption_probabilities()[1][0]
+        return self.absorption_probabilities()[1][0]
 
     def net_interstellar_from_industrial(self):
         "Probability of eventually (by any path) becoming interstellar from an industrial state"
-        return self.markov_chain().absorption_probabilities()[1][1]
+        return self.absorption_probabilities()[1][1]
 
     def net_interstellar_from_present_perils(self):
         "Probability of eventually (by any path) becoming interstellar from our current state"
-        return self.markov_chain().absorption_probabilities()[1][2]
+        return self.absorption_probabilities()[1][2]
 
     def net_interstellar_from_future_perils(self):
         "Probability of eventually (by any path) becoming interstellar from a future time of perils"
-        return self.markov_chain().absorption_probabilities()[1][3]
+        return self.absorption_probabilities()[1][3]
 
     def net_interstellar_from_multiplanetary(self):
         "Probability of eventually (by any path) becoming interstellar from a multiplanetary state"
-        return self.markov_chain().absorption_probabilities()[1][4]
+        return self.absorption_probabilities()[1][4]
 
     # Convenience methods for describing the signed proportionate change in expected value from
     # transitioning to other states than our current one relative to some astronomical value V
@@ -393,3 +564,105 @@ class SimpleCalc:
             ('Multiplanetary', np.nan),
             ('Interstellar', np.nan)
         ])
+
+
+# Cached evaluation
+
+TRANSITION_PROBABILITY_NAMES = (
+    'extinction_given_preindustrial', 'extinction_given_industrial',
+    'extinction_given_present_perils', 'preindustrial_given_present_perils',
+    'industrial_given_present_perils', 'future_perils_given_present_perils',
+    'interstellar_given_present_perils', 'extinction_given_future_perils',
+    'preindustrial_given_future_perils', 'industrial_given_future_perils',
+    'interstellar_given_future_perils', 'extinction_given_multiplanetary',
+    'preindustrial_given_multiplanetary', 'industrial_given_multiplanetary',
+    'future_perils_given_multiplanetary')
+
+RESULTS_CACHE_SIZE = 4096 # Each entry is a few dozen floats, so this is well under a megabyte
+
+_results_cache = OrderedDict() # Transition probabilities, in TRANSITION_PROBABILITY_NAMES order, to
+# their SimpleCalcResults, least recently used first
+_results_cache_lock = threading.Lock()
+
+SimpleCalcResults = namedtuple('SimpleCalcResults', ['success_probabilities',
+                                                     'probability_differences',
+                                                     'probability_proportion_differences'])
+SimpleCalcResults.__doc__ = """Everything the app displays for one set of transition probabilities.
+Each field is a read-only ordered mapping of state name to value, since cached instances are shared
+between every caller that asks for the same probabilities."""
+
+def transition_matrix(**transition_probabilities):
+    """The transition matrix, as an array ordered like STATES, for the given keyword transition
+    probabilities (as taken by SimpleCalc, with omitted values defaulting to 0). Raises TypeError
+    for unknown names, and ValueError if the probabilities don't make a valid chain (eg if
+    the given probabilities out of a state sum to more than 1)."""
+    unknown_names = set(transition_probabilities) - set(TRANSITION_PROBABILITY_NAMES)
+    if unknown_names:
+        raise TypeError(f"Unknown transition probabilities: {', '.join(sorted(unknown_names))}")
+    matrix = np.array(SimpleCalc(**transition_probabilities).transition_probability_rows(),
+                      dtype=float)
+    if not ((matrix >= 0) & (matrix <= 1)).all() or not np.allclose(matrix.sum(axis=1), 1):
+        invalid_states = [state for state, row in zip(STATES, matrix)
+                          if (row < 0).any() or (row > 1).any() or not np.isclose(row.sum(), 1)]
+        raise ValueError("The transition probabilities out of these states must each be between 0 "
+                         "and 1, and sum to at most 1: " + ', '.join(invalid_states))
+    return matrix
+
+def batch_absorption_probabilities(transition_probability_sets):
+    """Absorption probabilities for many independent sets of keyword transition probabilities at
+    once, solving all their chains in one vectorised call. Returns an array of shape
+    (len(transition_probability_sets), 2, 5), each entry laid out as in
+    SimpleCalc.absorption_probabilities(). Raises as transition_matrix() does if any set is
+    invalid."""
+    matrices = np.array([transition_matrix(**transition_probabilities)
+                         for transition_probabilities in transition_probability_sets])
+    transient_indices = [STATES.index(state) for state in TRANSIENT_STATES]
+    absorbing_indices = [STATES.index(state) for state in ABSORBING_STATES]
+    transient_matrices = matrices[:, transient_indices][:, :, transient_indices]
+    absorbing_matrices = matrices[:, transient_indices][:, :, absorbing_indices]
+    return np.transpose(np.linalg.solve(np.identity(len(transient_indices)) - transient_matrices,
+                                        absorbing_matrices), (0, 2, 1))
+
+def evaluate(calc=None, **transition_probabilities):
+    """Return the SimpleCalcResults for the given keyword transition probabilities (as taken by
+    SimpleCalc, with omitted values defaulting to 0). Results are kept in a bounded LRU cache shared
+    by the whole process, so eg every Streamlit session asking for the same values reuses them.
+
+    On a cache miss, calc (eg one held for a Streamlit session) is used if it's given: it's updated
+    to these probabilities with update_transition_probabilities(), so if they only differ from its
+    current ones out of one state (as after moving one slider) its solver gets a rank-one update
+    rather than being rebuilt. Raises as transition_matrix() does if they're invalid."""
+    unknown_names = set(transition_probabilities) - set(TRANSITION_PROBABILITY_NAMES)
+    if unknown_names:
+        raise TypeError(f"Unknown transition probabilities: {', '.join(sorted(unknown_names))}")
+    key = tuple(float(transition_probabilities.get(name, 0))
+                for name in TRANSITION_PROBABILITY_NAMES)
+    with _results_cache_lock:
+        if key in _results_cache:
+            _results_cache.move_to_end(key)
+            return _results_cache[key]
+
+    transition_probabilities = dict(zip(TRANSITION_PROBABILITY_NAMES, key))
+    transition_matrix(**transition_probabilities) # Raises if they don't make a valid chain
+    if calc is None:
+        calc = SimpleCalc(**transition_probabilities)
+    else:
+        current_probabilities = calc.transition_probabilities()
+        changes = {name: value for name, value in transition_probabilities.items()
+                   if value != current_probabilities[name]}
+        if changes:
+            calc.update_transition_probabilities(**changes)
+    transient_states = [STATES[index] for index in calc.absorption_solver().transient_indices]
+    results = SimpleCalcResults(
+        success_probabilities=MappingProxyType(OrderedDict(
+            zip(transient_states, calc.absorption_probabilities()[1]))),
+        probability_differences=MappingProxyType(calc.probability_differences()),
+        probability_proportion_differences=MappingProxyType(
+            calc.probability_proportion_differences()))
+
+    with _results_cache_lock:
+        results = _results_cache.setdefault(key, results) # Another thread may have got there first
+        _results_cache.move_to_end(key)
+        if len(_results_cache) > RESULTS_CACHE_SIZE:
+            _results_cache.popitem(last=False)
+    return results
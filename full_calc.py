@@ -1,253 +1,153 @@
 # pylint: disable=line-too-long, fixme, too-many-locals, forgotten-debug-statement
 
-"""Module containing the full Markov chain, and code to run it (ending in a breakpoint)."""
+"""Script to run the full Markov chain and record its results."""
 
-from functools import cache
+import argparse
 import datetime
-import csv
 import os
 
-from pydtmc import MarkovChain
-
 import calculators.full_calc.runtime_constants as constant
-from calculators.full_calc import preperils
-from calculators.full_calc import sub_markov_chains
+from calculators.full_calc import tracing
+from calculators.full_calc.bundle import can_write_bundle, write_bundle
+from calculators.full_calc.checkpoints import CHECKPOINT_DIRECTORY, CheckpointStore
+from calculators.full_calc.full_chain import (full_markov_chain, current_runtime_constants,
+                                              expected_visits, reboot_distribution,
+                                              reduced_success_probabilities, solved_sub_chains,
+                                              success_probabilities)
 from calculators.full_calc.params import Params
-
-def full_markov_chain():
-    """Wrapper for a pydtmc Markov chain that implements the full decay/perils-focused/multiplanetary
-    model as described here: https://forum.effectivealtruism.org/s/gWsTMm5Nbgdxedyns/p/YnBwoNNqe6knBJH8p"""
-    def _zero_probabilities():
-        """Represents a set of zero-probability transitions, eg all the preindustrial states'
-        transitional probabilities from an industrial state. For perils and multiplanetary rows,
-        we'll need to add an extra value, since they potentially include the current civilisation"""
-        return [0] * (constant.MAX_CIVILISATIONS - 1)
-
-    transient_states_count = 4 * constant.MAX_CIVILISATIONS - 2 # 4 classes of transient state,
-    # (preindustrial, industrial, perils, multiplanetary) * max civilisations, minus the two
-    # preperils states in our current civilisation)
-    extinction_row   = [0] * transient_states_count + [1, 0]
-    interstellar_row = [0] * transient_states_count + [0, 1]
-    preperils_civilisation_range = range(1, constant.MAX_CIVILISATIONS)
-    modern_civilisation_range = range(0, constant.MAX_CIVILISATIONS)
-
-    preindustrial_rows = [
-        _zero_probabilities()
-        # ^Preindustrial states
-        + [preperils.industrial_given_preindustrial(k,k1) for k1 in preperils_civilisation_range]
-        # ^Industrial states
-        + _zero_probabilities() + [0]
-        # ^Perils states (which include the current civilisation)
-        + _zero_probabilities() + [0]
-        # ^Multiplanetary states (which potentially include the current civilisation)
-        + [preperils.extinction_given_preindustrial(k)] + [0]
-        # ^Extinction and Interstellar respectively
-        for k in preperils_civilisation_range]
-
-    industrial_rows =   [
-        _zero_probabilities()
-        # ^Preindustrial states
-        + _zero_probabilities()
-        # ^Other industrial states
-        + [preperils.perils_given_industrial(k,k1) for k1 in modern_civilisation_range]
-        # ^Perils states (which include the current civilisation)
-        + _zero_probabilities() + [0]
-        # ^Multiplanetary states (which potentially include the current civilisation)
-        + [preperils.extinction_given_industrial(k)] + [0]
-        # ^Extinction and Interstellar respectively
-        for k in preperils_civilisation_range]
-
-    @cache
-    def perils_chain(k):
-        # Create and cache a time of perils sub-chain for civilisation k
-        return sub_markov_chains.IntraPerilsMCWrapper(k)
-
-    # TODO: allow transition to perils k+1
-    perils_rows = [[perils_chain(k).preindustrial_given_perils(k1)
-                   for k1 in range(1, constant.MAX_CIVILISATIONS)]
-                # ^Transition probabilities to future preindustrial states
-                + [perils_chain(k).industrial_given_perils(k1)
-                   for k1 in range(1, constant.MAX_CIVILISATIONS)]
-                # ^Transition probabilities to future industrial states
-                + _zero_probabilities() + [0]
-                # ^Transition probabilities to perils states (which include our current civilisation)
-                + [perils_chain(k).multiplanetary_given_perils(k1)
-                   for k1 in range(0, constant.MAX_CIVILISATIONS)]
-                # ^Transition probabilities to multiplanetary states (which potentially include our
-                #  current civilisation)
-                + [perils_chain(k).extinction_given_perils()]
-                # ^Transition probability to the Extinction state (single-element list)
-                + [perils_chain(k).interstellar_given_perils()]
-                # ^Transition probabilities to the Interstellar state (single-element list)
-                for k in range(0, constant.MAX_CIVILISATIONS)]
-
-    @cache
-    def multiplanetary_chain(k):
-        # Create and cache a multiplanetary sub-chain for civilisation k
-        return sub_markov_chains.IntraMultiplanetaryMCWrapper(k)
-
-    print('Creating multiplanetary subchain')
-
-    multiplanetary_rows = []
-    for k in range(0, constant.MAX_CIVILISATIONS):
-        preindustrial_transitions = [multiplanetary_chain(k).preindustrial_given_multiplanetary(k1)
-                               for k1 in range(1, constant.MAX_CIVILISATIONS)]
-        # ^Probabilities of transitioning from the multiplanetary state in the
-        # kth civilisation to the predindustrial state in the k1th civilisation
-        industrial_transitions = [multiplanetary_chain(k).industrial_given_multiplanetary(k1)
-                               for k1 in range(1, constant.MAX_CIVILISATIONS)]
-        # ^Probabilities of transitioning from the multiplanetary state in the
-        # kth civilisation to the industrial state in the k1th civilisation
-        perils_transitions = [multiplanetary_chain(k).perils_given_multiplanetary(k1)
-                               for k1 in range(0, constant.MAX_CIVILISATIONS)]
-        # ^Probabilities of transitioning from the multiplanetary state in the
-        # kth civilisation to the perils state in the k1th civilisation
-        multiplanetary_transitions = _zero_probabilities() + [0]
-        # ^Probabilities of transitioning from the multiplanetary state in the
-        # kth civilisation to the multiplanetary state in the k1th civilisation
-        extinction_transition = [multiplanetary_chain(k).extinction_given_multiplanetary()]
-        # ^Probabilities of transitioning from the multiplanetary state in the
-        # kth civilisation to the (only) Extinction state
-        interstellar_transition =[multiplanetary_chain(k).interstellar_given_multiplanetary()]
-        # ^Probabilities of transitioning from the multiplanetary state in the
-        # kth civilisation to the (only) Interstellar state
-        transition_probabilities = (preindustrial_transitions + industrial_transitions
-            + perils_transitions + multiplanetary_transitions + extinction_transition
-            + interstellar_transition)
-
-        multiplanetary_rows.append(transition_probabilities)
-
-    probability_matrix = (preindustrial_rows
-                          + industrial_rows
-                          + perils_rows
-                          + multiplanetary_rows
-                          + [extinction_row]
-                          + [interstellar_row])
-
-    preindustrial_names = ['preindustrial-' + str(index[0] + 1)
-                           for index in enumerate(preindustrial_rows)]
-    industrial_names = ['industrial-' + str(index[0] + 1)
-                        for index in enumerate(industrial_rows)]
-    perils_names = ['perils-' + str(index[0])
-                    for index in enumerate(perils_rows)]
-    multiplanetary_names = ['multiplanetary-' + str(index[0])
-                            for index in enumerate(multiplanetary_rows)]
-    print('Creating full Markov chain')
-    return MarkovChain(probability_matrix, preindustrial_names
-                                           + industrial_names
-                                           + perils_names
-                                           + multiplanetary_names
-                                           + ['Extinction']
-                                           + ['Interstellar'])
-
+from calculators.full_calc.predictor import CALIBRATION_PATH, Predictor, current_backend
+from calculators.full_calc.results_store import (ResultsStore, RESULTS_PATH, SUCCESS_PROBABILITY,
+                                                 EXPECTED_VISITS, EXPECTED_PROGRESS_YEARS)
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('--trace', help='Also write the timing and memory use of each phase of the run to this file')
+parser.add_argument('--trace-format', choices=tracing.FORMATS, default=tracing.JSONL,
+                    help='jsonl for one span per line, or chrome for chrome://tracing or ui.perfetto.dev')
+parser.add_argument('--resume', action='store_true',
+                    help='Reuse any sub-chains already solved by an interrupted run with the same params and runtime constants')
+parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIRECTORY,
+                    help='Where to checkpoint solved sub-chains until the results are saved')
+parser.add_argument('--reduced', action='store_true',
+                    help="Solve a smaller chain without the preperils states instead of the full chain (there's then no mc to query, or visit counts)")
+parser.add_argument('--perils-years', action='store_true',
+                    help='Also find the expected number of progress years each time of perils lasts (about one more solve of each perils sub-chain)')
+parser.add_argument('--mixed-precision', action='store_true',
+                    help='Solve the sub-chains with a float32 factorisation refined to float64 accuracy, using about half the memory (see calculators/full_calc/mixed_precision.py)')
+parser.add_argument('--export', metavar='DIRECTORY',
+                    help='Also write the solved chains to DIRECTORY, to query later without recomputing them (see calculators/full_calc/bundle.py)')
+args = parser.parse_args()
+if args.export and not can_write_bundle(args.export):
+    parser.error(f"{args.export} already exists and isn't a bundle, so won't be replaced")
+if args.mixed_precision:
+    constant.MIXED_PRECISION_SOLVE = True
+
+tracer = tracing.Tracer()
+with tracing.tracing(tracer):
+    params = Params()
 
 print('Runtime constants:')
 print('Max planets: ' + str(constant.MAX_PLANETS))
 print('Max civilisations: ' + str(constant.MAX_CIVILISATIONS))
 print('Max progress years: ' + str(constant.MAX_PROGRESS_YEARS))
 print('With params as follows:')
-print(Params().describe())
+print(params.describe())
 print("Read about what these params mean in the calculators/full_calc/params.yml file\n")
+if os.path.exists(CALIBRATION_PATH):
+    try:
+        predictor = Predictor.load(CALIBRATION_PATH, current_backend())
+    except KeyError:
+        print(f"No runtime or memory estimate is available, since the {current_backend()} backend"\
+              " hasn't been calibrated (see calculators/full_calc/predictor.py)\n")
+    else:
+        estimate = predictor.check(current_runtime_constants(), refuse=False)
+        print(f"Estimated runtime: {round(estimate.runtime_seconds)} seconds, using up to"\
+              f" {estimate.peak_rss_bytes / 2 ** 30:.1f}GiB of memory\n")
 start = datetime.datetime.now()
-mc = full_markov_chain()
-runtime = (datetime.datetime.now() - start).seconds
-current_perils_index = mc.states.index('perils-0')
-first_preindustrial_index = mc.states.index('preindustrial-1')
-first_industrial_index = mc.states.index('industrial-1')
-# print(f"""From this breakpoint, you can query the MarkovChain (variable name mc) object as
-#     described at https://github.com/TommasoBelluzzo/PyDTMC, and in this repo's README.md
-
-#     Example values of interest:
-#     From our current time of perils, your parameters imply that our chance of ultimately becoming
-#     interstellar is
-#     ~{round(mc.absorption_probabilities()[1][current_perils_index] * 100)}%.
-
-#     If we we to regress once to a preindustrial state, our chance of becoming interstellar would be
-#     ~{round(mc.absorption_probabilities()[1][first_preindustrial_index] * 100)}%.
-
-#     If we we to regress once to an industrial state, our chance of becoming interstellar would be
-#     ~{round(mc.absorption_probabilities()[1][first_industrial_index] * 100)}%.
-
-#     (the runtime with these parameters was {runtime} seconds)""")
-# # Intentionally checked in breakpoint - this is where you can manually query the results
-
-print('Total runtime: ' + str(runtime) + ' seconds\n')
+checkpoints = CheckpointStore(params.dictionary, current_runtime_constants(), args.checkpoint_dir,
+                              resume=args.resume)
+with tracing.tracing(tracer):
+    perils_chains, multiplanetary_chains = solved_sub_chains(checkpoints=checkpoints)
+    visits = {}
+    if args.reduced:
+        mc = None
+        with tracing.span('reduced_solve'):
+            probabilities = reduced_success_probabilities(perils_chains, multiplanetary_chains)
+    else:
+        mc = full_markov_chain(perils_chains=perils_chains,
+                               multiplanetary_chains=multiplanetary_chains)
+        with tracing.span('full_solve'):
+            probabilities = success_probabilities(mc)
+        with tracing.span('visit_counts'):
+            visits = expected_visits(mc)
+    perils_years = {}
+    if args.perils_years:
+        for k, chain in enumerate(perils_chains):
+            with tracing.span('perils_years', k=k):
+                years = chain.expected_progress_years() # None if restored from a checkpoint
+            if years is not None:
+                perils_years[f'perils-{k}'] = years[chain.FROM_STARTING_YEAR if k == 0
+                                                    else chain.FROM_YEAR_0]
+        skipped = [f'perils-{k}' for k in range(len(perils_chains))
+                   if f'perils-{k}' not in perils_years]
+        if skipped:
+            print(f"Warning: no expected progress years for {', '.join(skipped)}, since they were"\
+                  " restored from checkpoints rather than built - rerun without --resume for"\
+                  " them\n")
+runtime = (datetime.datetime.now() - start).total_seconds()
+
+print('Total runtime: ' + str(round(runtime)) + ' seconds, of which')
+for span_name, seconds in tracer.totals().items():
+    print(f'    {span_name}: {seconds:.3g} seconds')
+print()
 print('Probability of becoming interstellar from perils-0:')
-print(mc.absorption_probabilities()[1][mc.states.index('perils-0')])
+print(probabilities['perils-0'])
 print('Probability of becoming interstellar from multiplanetary-0:')
-print(mc.absorption_probabilities()[1][mc.states.index('multiplanetary-0')])
+print(probabilities['multiplanetary-0'])
 print('*' * 20)
 for i in range(1, constant.MAX_CIVILISATIONS):
     print('Probability of becoming interstellar from preindustrial-' + str(i) + ':')
-    print(mc.absorption_probabilities()[1][mc.states.index(f'preindustrial-{i}')])
+    print(probabilities[f'preindustrial-{i}'])
     print('Probability of becoming interstellar from industrial-' + str(i) + ':')
-    print(mc.absorption_probabilities()[1][mc.states.index(f'industrial-{i}')])
+    print(probabilities[f'industrial-{i}'])
     print('Probability of becoming interstellar from perils-' + str(i) + ':')
-    print(mc.absorption_probabilities()[1][mc.states.index(f'perils-{i}')])
+    print(probabilities[f'perils-{i}'])
     print('Probability of becoming interstellar from multiplanetary-' + str(i) + ':')
-    print(mc.absorption_probabilities()[1][mc.states.index(f'multiplanetary-{i}')])
+    print(probabilities[f'multiplanetary-{i}'])
     print('*' * 20)
-print("These results have been saved in the ./results.csv file - please consider submitting them to the"\
-      " repo or just copying and pasting them here: https://docs.google.com/spreadsheets/d/132hveII9MYkGrW0uDvYzh1pqcmAqKuxQ3pHq6iCZH2A/edit#gid=0")
-
-import os
-file_name = 'results.csv'
-
-states = []
-for i in range(1, constant.MAX_CIVILISATIONS):
-    for state in (f'preindustrial-{i}', f'industrial-{i}', f'perils-{i}', f'multiplanetary-{i}'):
-        states.append(state)
-
-success_probabilities = []
-numbered_states = []
-for i in range(1, 10): # ideally this would go up to constant.MAX_CIVILISATIONS, but that messes up
-                       # the CSV columns; if you want to save the results beyond civ-10, you'll
-                       # store them manually from the printed output
-
-    for state in (f'preindustrial-{i}', f'industrial-{i}', f'perils-{i}', f'multiplanetary-{i}'):
-        numbered_states.append(state)
-        probability = mc.absorption_probabilities()[1][mc.states.index(state)]
-        success_probabilities.append(probability)
-
-# Check if the file is empty or doesn't exist
-file_exists = os.path.exists(file_name) and os.path.getsize(file_name) > 0
-
-with open(file_name, 'a', newline='') as csvfile:
-    writer = csv.writer(csvfile)
-
-    civ_0_states = ['perils-0', 'multiplanetary-0']
-    all_numbered_states = civ_0_states + numbered_states
-
-    civ_0_probabilities = [mc.absorption_probabilities()[1][mc.states.index('perils-0')],
-                           mc.absorption_probabilities()[1][mc.states.index('multiplanetary-0')]]
-    all_success_probabilities = civ_0_probabilities + success_probabilities
-    preindustrial_in_terms_of_astronomical_value = civ_0_probabilities[0] - success_probabilities[0]
-    preindustrial_as_extinction_proportion = (preindustrial_in_terms_of_astronomical_value) / civ_0_probabilities[0]
-    industrial_in_terms_of_astronomical_value = civ_0_probabilities[0] - success_probabilities[1]
-    industrial_as_extinction_proportion = (industrial_in_terms_of_astronomical_value) / civ_0_probabilities[0]
-    industrial_as_preindustrial_proportion = industrial_in_terms_of_astronomical_value / preindustrial_in_terms_of_astronomical_value
-
-    if not file_exists:
-        # Write header only if file is empty or doesn't exist
-        writer.writerow(
-            ['Brief description ', 'Notes',
-             'Loss of value from Industrial-1 as proportion of loss of value from Preindustrial-1',
-             "Loss of value of reverting to Preindustrial-1 as as proportion of loss of value of extinction",
-             "Loss of value of reverting to Industrial-1 as proportion of loss of value of extinction",
-             "Absolute loss of expected value from transitioning to Preindustrial-1",
-             "Absolute loss of expected value from transitioning to Industrial-1"]
-            # Leave first two columns for people to enter their
-            # names/descriptions of their params etc, and next four to show costs of a regression to
-            # preindustrial/industrial relative to extinction to to astronomical value
-            + all_numbered_states
-            + ['MAX_PLANETS', 'MAX_CIVILISATIONS', 'MAX_PROGRESS_YEARS']
-            + Params().get_param_keys())
-    writer.writerow(
-        [' ', ' ', industrial_as_preindustrial_proportion]
-        + [preindustrial_as_extinction_proportion, industrial_as_extinction_proportion]
-        + [preindustrial_in_terms_of_astronomical_value, industrial_in_terms_of_astronomical_value]
-        + all_success_probabilities
-        + [constant.MAX_PLANETS, constant.MAX_CIVILISATIONS, constant.MAX_PROGRESS_YEARS]
-        + Params().get_param_values())
+reboots = reboot_distribution(perils_chains, multiplanetary_chains)
+print('Starting from perils-0, the chance of each outcome after exactly k reboots:')
+for k, (interstellar, extinction) in enumerate(zip(reboots['interstellar'], reboots['extinction'])):
+    print(f'    k = {k}: becoming interstellar {interstellar:.4g}, going extinct {extinction:.4g}')
+if visits:
+    print('Expected number of times in each state, starting from perils-0:')
+    for state, expected in visits.items():
+        print(f'    {state}: {expected:.4g}')
+if perils_years:
+    print('Expected progress years per time of perils (from the current progress year for perils-0):')
+    for state, years in perils_years.items():
+        print(f'    {state}: {years:.4g}')
+
+with tracing.tracing(tracer), tracing.span('results_write'):
+    # The run's spans are copied as of now, so don't include this one
+    results = {SUCCESS_PROBABILITY: probabilities, EXPECTED_VISITS: visits,
+               EXPECTED_PROGRESS_YEARS: perils_years}
+    run_id = ResultsStore().add_run(params.dictionary, current_runtime_constants(),
+                                    {quantity: values for quantity, values in results.items() if values},
+                                    runtime=runtime, spans=list(tracer.spans))
+if args.export:
+    with tracing.tracing(tracer), tracing.span('export'):
+        write_bundle(args.export, params.dictionary, current_runtime_constants(), probabilities, mc,
+                     perils_chains, multiplanetary_chains)
+    print(f"The solved chains have been written to {args.export} - load them with"\
+          " calculators.full_calc.bundle.Bundle")
+checkpoints.clear()
+print(f"These results have been saved as run {run_id} in ./{RESULTS_PATH} - please consider exporting"\
+      " them with `python -m calculators.full_calc.results_store export-csv <file name>` and either"\
+      " submitting them to the repo or just copying and pasting them here:"\
+      " https://docs.google.com/spreadsheets/d/132hveII9MYkGrW0uDvYzh1pqcmAqKuxQ3pHq6iCZH2A/edit#gid=0")
+
+if args.trace:
+    tracer.write(args.trace, args.trace_format)
+    print(f"The timings of each phase of the run have been written to {args.trace}")
 
 os.system('echo -n "\a"') # Make a beep noise to indicate the program has finished
@@ -15,5 +15,5 @@ The cyclical model and perils-focused models from that post correspond respectiv
 
 You can use the simple calculator from this site's homepage. It's designed to be straightforward to use and fast to run, and so makes the naive assumption that all future technological states are equivalent if they have equivalent levels of technology, or at least can be averaged over (except that it separates out our current era, on the grounds that we've survived through a number of globally catastrophic near-misses to get where we are, which might count for something).
 
-The advanced calculator doesn't have a UI, and must be run as a script (see the [README](https://github.com/Arepo/lrisk_calculator) for instructions), but allows the user to plug in more granular [estimates of current risks](https://forum.effectivealtruism.org/posts/JQQAQrunyGGhzE23a/database-of-existential-risk-estimates), and to be more opinionated about how different civilisations might predictably face different challenges.
+The advanced calculator takes minutes rather than milliseconds to run, so on the Full Calculator page its runs are queued and processed in the background (you can also run it as a script - see the [README](https://github.com/Arepo/lrisk_calculator) for instructions). It allows the user to plug in more granular [estimates of current risks](https://forum.effectivealtruism.org/posts/JQQAQrunyGGhzE23a/database-of-existential-risk-estimates), and to be more opinionated about how different civilisations might predictably face different challenges.
 """)
@@ -0,0 +1,141 @@
+# pylint: disable=invalid-name, line-too-long
+
+"""Renders the 'Full Calculator' Streamlit page, which submits full calc runs to a pool of
+background workers and polls them for progress."""
+
+from contextlib import suppress
+import os
+import time
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+import yaml
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc import jobs
+from calculators.full_calc.params import check_structure
+from calculators.full_calc.predictor import (CALIBRATION_PATH, LimitExceeded, Predictor,
+                                             current_backend)
+from calculators.full_calc.surrogate import SURROGATE_PATH, Surrogate
+
+POLL_INTERVAL_SECONDS = 2
+
+# Generous enough for high-fidelity runs, but low enough that one user can't tie up a worker for hours
+MAX_RUNTIME_CONSTANTS = {'MAX_PLANETS': 50, 'MAX_CIVILISATIONS': 20, 'MAX_PROGRESS_YEARS': 4000}
+MIN_RUNTIME_CONSTANTS = {'MAX_PLANETS': 2, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 71}
+
+@st.cache_resource
+def job_runner():
+    """One worker pool and job table shared by every session, refusing runs too big for this
+    machine if it has been calibrated for the backend the jobs will use (see
+    calculators/full_calc/predictor.py)"""
+    predictor = None
+    if os.path.exists(CALIBRATION_PATH):
+        with suppress(KeyError): # There's no calibration for this backend
+            predictor = Predictor.load(CALIBRATION_PATH, current_backend())
+    return jobs.JobRunner(predictor=predictor)
+
+@st.cache_resource
+def surrogate():
+    """The precomputed surrogate, if one has been built (see calculators/full_calc/surrogate.py)"""
+    return Surrogate.load(SURROGATE_PATH) if os.path.exists(SURROGATE_PATH) else None
+
+@st.cache_data
+def default_params_yaml():
+    """The contents of params.yml, comments and all"""
+    with open('calculators/full_calc/params.yml', 'r', encoding="utf-8") as stream:
+        return stream.read()
+
+st.markdown("""
+# Full calculator
+
+This runs the perils-focused model described [here](https://forum.effectivealtruism.org/s/gWsTMm5Nbgdxedyns/p/YnBwoNNqe6knBJH8p). Runs
+take anything from seconds to many minutes depending on the runtime constants, so they're queued
+and run in the background - you can leave this page and come back to it. Anyone who has already
+submitted the exact same params and constants will have cached the results for you.
+""")
+
+with st.form('full_calc'):
+    st.write("**Runtime constants** (higher values give a higher fidelity representation of the model, but rapidly increase runtime)")
+    runtime_constants = {
+        name: int(st.number_input(
+            label=name,
+            min_value=MIN_RUNTIME_CONSTANTS[name],
+            max_value=MAX_RUNTIME_CONSTANTS[name],
+            value=getattr(constant, name),
+            step=1))
+        for name in MAX_RUNTIME_CONSTANTS}
+
+    params_yaml = st.text_area(
+        label="**Params** (see the comments for what each one represents)",
+        value=default_params_yaml(),
+        height=400)
+
+    submitted = st.form_submit_button('Run full calculator')
+
+if submitted:
+    try:
+        params_dict = yaml.safe_load(params_yaml)
+        check_structure(params_dict)
+    except (yaml.YAMLError, ValueError) as error:
+        st.error(f"Couldn't read those params: {error}")
+    else:
+        try:
+            st.session_state['full_calc_job'] = job_runner().submit(params_dict, runtime_constants)
+        except LimitExceeded as error:
+            st.error(f"{error}, which is more than this server can handle - try lower runtime constants.")
+        else:
+            st.session_state['full_calc_estimate'] = (
+                surrogate().estimate_for(params_dict, runtime_constants) if surrogate() else None)
+
+job_id = st.session_state.get('full_calc_job')
+job = job_runner().job(job_id) if job_id else None
+
+if job:
+    '---'
+    st.markdown(f"## Run `{job_id[:12]}`")
+
+    if job['status'] in (jobs.QUEUED, jobs.RUNNING):
+        estimate = st.session_state.get('full_calc_estimate')
+        if estimate:
+            values, errors = estimate
+            st.markdown(f"Instant estimate while you wait (interpolated from precomputed runs): ~{round(values['perils-0'] * 100)}% chance of becoming interstellar (estimated error ±{errors['perils-0'] * 100:.1g} percentage points)")
+        completed_steps = job['completed_steps']
+        total_steps = job['total_steps'] or 1
+        st.progress(completed_steps / total_steps,
+                    text=f"{job['status'].capitalize()}: {completed_steps} of {job['total_steps'] or '?'} sub-chains solved")
+    elif job['status'] == jobs.FINISHED:
+        success_probabilities = job['result']['success_probabilities']
+        st.markdown(f"### tl;dr: we have a {round(success_probabilities['perils-0'] * 100)}% chance of becoming interstellar")
+        probabilities_df = pd.DataFrame(
+            success_probabilities.items(),
+            columns=['Civilisation state', 'Probability of becoming interstellar'])
+        st.plotly_chart(px.bar(probabilities_df,
+                               x='Civilisation state',
+                               y='Probability of becoming interstellar'),
+                        use_container_width=True)
+        st.caption(f"Runtime: {round(job['result']['runtime'])} seconds")
+    else:
+        st.error(f"This run {job['status']} - resubmit it to try again.")
+        if job['error']:
+            st.code(job['error'])
+
+'---'
+
+st.markdown("### Recent runs")
+recent_jobs = job_runner().recent_jobs()
+if recent_jobs:
+    st.dataframe(pd.DataFrame(
+        [{'Run': recent_job['id'][:12],
+          'Status': recent_job['status'],
+          'Submitted': recent_job['submitted_at'],
+          'perils-0': (recent_job['result'] or {}).get('success_probabilities', {}).get('perils-0'),
+          **recent_job['runtime_constants']}
+         for recent_job in recent_jobs]),
+        hide_index=True)
+
+if job and job['status'] in (jobs.QUEUED, jobs.RUNNING):
+    # Everything's been rendered, so waiting here doesn't block the page
+    time.sleep(POLL_INTERVAL_SECONDS)
+    st.experimental_rerun()
@@ -0,0 +1,48 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring, redefined-outer-name, protected-access
+
+import json
+
+import pytest
+
+from calculators.full_calc import batch, full_chain
+from calculators.full_calc.params import Params, with_overrides
+
+SMALL_RUNTIME_CONSTANTS = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 80}
+
+@pytest.fixture(autouse=True)
+def restore_runtime_constants():
+    """Evaluating in this process overrides the runtime constants for the whole process"""
+    original_runtime_constants = full_chain.current_runtime_constants()
+    yield
+    full_chain.use_runtime_constants(original_runtime_constants)
+
+def test_streams_results_and_reports_bad_lines():
+    lines = [json.dumps({'id': 'base'}),
+             '',
+             json.dumps({'params': {'perils.extinction.y_scale': 0.0001}}),
+             json.dumps({'params': {'no_such_param': 1}}),
+             'not json']
+    results = {}
+    def emit(line_number, request_id, _params_dict, _runtime_constants, result):
+        results[line_number] = (request_id, result)
+
+    assert batch.run_batch(lines, emit, base_runtime_constants=SMALL_RUNTIME_CONSTANTS,
+                           max_workers=1) == 4
+    assert sorted(results) == [1, 3, 4, 5]
+    assert 'Unknown param' in results[4][1]['error']
+    assert 'JSONDecodeError' in results[5][1]['error']
+    assert results[1][0] == 'base'
+    assert (results[1][1]['success_probabilities']
+            == full_chain.run(Params().dictionary, SMALL_RUNTIME_CONSTANTS,
+                              reduced=True)['success_probabilities'])
+    assert (results[3][1]['success_probabilities']['perils-0']
+            > results[1][1]['success_probabilities']['perils-0'])
+
+def test_shares_sub_chains_between_parameter_sets(monkeypatch):
+    monkeypatch.setattr(batch, '_sub_chain_cache', batch.OrderedDict())
+    params_dict = Params().dictionary
+    batch.evaluate(params_dict, SMALL_RUNTIME_CONSTANTS)
+    assert len(batch._sub_chain_cache) == 3 # A perils sub-chain per k, one multiplanetary for all
+    batch.evaluate(with_overrides(params_dict, {'multiplanetary.extinction.two_planet_risk': 0.2}),
+                   SMALL_RUNTIME_CONSTANTS)
+    assert len(batch._sub_chain_cache) == 4
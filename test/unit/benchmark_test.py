@@ -0,0 +1,18 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+from calculators.benchmark import regressions
+
+def _results(perils_solve_seconds, batch_seconds):
+    return {'full_calc': [{'runtime_constants': {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2,
+                                                 'MAX_PROGRESS_YEARS': 80},
+                           'seconds': {'perils_solve': perils_solve_seconds}}],
+            'simple_calc': {'seconds': {'batch_evaluation': batch_seconds}}}
+
+def test_regressions_flags_only_phases_slower_than_the_threshold():
+    slower = regressions(_results(1.0, 0.1), _results(1.1, 0.5), threshold=1.2)
+    assert slower == [('simple_calc', 'batch_evaluation', 0.1, 0.5)]
+
+def test_regressions_ignores_grid_points_missing_from_the_baseline():
+    baseline = _results(1.0, 0.1)
+    baseline['full_calc'][0]['runtime_constants']['MAX_PLANETS'] = 5
+    assert regressions(baseline, _results(10.0, 0.1)) == []
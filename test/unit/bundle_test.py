@@ -0,0 +1,54 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import numpy as np
+import pytest
+
+from calculators.full_calc import full_chain
+from calculators.full_calc.bundle import Bundle, write_bundle
+from calculators.full_calc.params import Params
+
+SMALL_RUNTIME_CONSTANTS = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 80}
+
+@pytest.fixture(autouse=True)
+def restore_runtime_constants():
+    original_runtime_constants = full_chain.current_runtime_constants()
+    yield
+    full_chain.use_runtime_constants(original_runtime_constants)
+
+def test_bundle_round_trips_memory_mapped(tmp_path):
+    full_chain.use_runtime_constants(SMALL_RUNTIME_CONSTANTS)
+    perils_chains, multiplanetary_chains = full_chain.solved_sub_chains()
+    mc = full_chain.full_markov_chain(perils_chains=perils_chains,
+                                      multiplanetary_chains=multiplanetary_chains)
+    probabilities = full_chain.success_probabilities(mc)
+    directory = str(tmp_path / 'run')
+    write_bundle(directory, Params().dictionary, SMALL_RUNTIME_CONSTANTS, probabilities, mc,
+                 perils_chains, multiplanetary_chains)
+
+    bundle = Bundle(directory)
+    assert bundle.runtime_constants == SMALL_RUNTIME_CONSTANTS
+    assert isinstance(bundle['full_transition_matrix'], np.memmap)
+    assert np.array_equal(bundle['full_transition_matrix'], mc.p)
+    assert np.array_equal(bundle['perils-1_transition_matrix'], perils_chains[1].mc.p)
+    for state, probability in probabilities.items():
+        assert bundle.entry('success_probabilities', state) == probability
+        assert bundle.entry('full_absorption_probabilities', 'Interstellar', state) == probability
+    assert bundle.entry('multiplanetary-0_exit_probabilities', 'perils') == (
+        multiplanetary_chains[0].exit_probabilities()[3])
+    assert 'multiplanetary-2_transition_matrix' not in bundle.names()
+
+def test_only_replaces_existing_bundles(tmp_path):
+    probabilities = {'perils-0': 0.5}
+    directory = tmp_path / 'run'
+    write_bundle(str(directory), {}, SMALL_RUNTIME_CONSTANTS, probabilities)
+    write_bundle(str(directory), {}, SMALL_RUNTIME_CONSTANTS, {'perils-0': 0.25})
+    assert Bundle(str(directory)).entry('success_probabilities', 'perils-0') == 0.25
+    assert [path.name for path in tmp_path.iterdir()] == ['run']
+
+    (tmp_path / 'notes').mkdir()
+    (tmp_path / 'notes' / 'keep.txt').write_text('Not a bundle', encoding='utf-8')
+    for not_a_bundle in (tmp_path / 'notes', tmp_path / 'notes' / 'keep.txt'):
+        with pytest.raises(FileExistsError):
+            write_bundle(str(not_a_bundle), {}, SMALL_RUNTIME_CONSTANTS, probabilities)
+    assert (tmp_path / 'notes' / 'keep.txt').read_text(encoding='utf-8') == 'Not a bundle'
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['notes', 'run']
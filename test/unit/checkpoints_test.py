@@ -0,0 +1,55 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring, redefined-outer-name
+
+import json
+import os
+
+import pytest
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc import full_chain
+from calculators.full_calc.checkpoints import CheckpointStore, MANIFEST
+from calculators.full_calc.params import Params
+
+SMALL_RUNTIME_CONSTANTS = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 80}
+
+@pytest.fixture(autouse=True)
+def restore_runtime_constants():
+    """full_chain.run() overrides the runtime constants for the whole process"""
+    original_runtime_constants = full_chain.current_runtime_constants()
+    yield
+    full_chain.use_runtime_constants(original_runtime_constants)
+
+def test_resumed_run_restores_sub_chains_and_matches(tmp_path):
+    params_dict = Params().dictionary
+    checkpoints = CheckpointStore(params_dict, SMALL_RUNTIME_CONSTANTS, str(tmp_path))
+    first = full_chain.run(params_dict, SMALL_RUNTIME_CONSTANTS, checkpoints=checkpoints)
+    assert sorted(os.listdir(checkpoints.directory)) == [
+        MANIFEST, 'multiplanetary-0.npz', 'multiplanetary-1.npz', 'perils-0.npz', 'perils-1.npz']
+
+    resumed = full_chain.run(params_dict, SMALL_RUNTIME_CONSTANTS, checkpoints=CheckpointStore(
+        params_dict, SMALL_RUNTIME_CONSTANTS, str(tmp_path), resume=True))
+    span_names = {span['name'] for span in resumed['spans']}
+    assert {'perils_restore', 'multiplanetary_restore'} <= span_names
+    assert not {'perils_build', 'multiplanetary_build'} & span_names
+    assert resumed['success_probabilities'] == first['success_probabilities']
+
+    checkpoints.clear()
+    assert not os.path.exists(checkpoints.directory)
+
+def test_rejects_checkpoints_for_other_params(tmp_path):
+    params_dict = Params().dictionary
+    checkpoints = CheckpointStore(params_dict, SMALL_RUNTIME_CONSTANTS, str(tmp_path))
+    with open(os.path.join(checkpoints.directory, MANIFEST), 'w', encoding='utf-8') as manifest:
+        json.dump({'param_hash': 'something else'}, manifest)
+    with pytest.raises(ValueError):
+        CheckpointStore(params_dict, SMALL_RUNTIME_CONSTANTS, str(tmp_path), resume=True)
+
+def test_misses_checkpoints_for_another_regression_window(tmp_path, monkeypatch):
+    params_dict = Params().dictionary
+    CheckpointStore(params_dict, SMALL_RUNTIME_CONSTANTS, str(tmp_path)).save('perils', 0, [0.5])
+    assert CheckpointStore(params_dict, SMALL_RUNTIME_CONSTANTS, str(tmp_path),
+                           resume=True).load('perils', 0) is not None
+    monkeypatch.setattr(constant, 'MAX_PROGRESS_YEAR_REGRESSION_STEPS',
+                        constant.MAX_PROGRESS_YEAR_REGRESSION_STEPS + 1)
+    assert CheckpointStore(params_dict, SMALL_RUNTIME_CONSTANTS, str(tmp_path),
+                           resume=True).load('perils', 0) is None
@@ -0,0 +1,42 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import pytest
+
+from calculators.full_calc import full_chain
+from calculators.full_calc.evaluation_graph import EvaluationGraph
+from calculators.full_calc.params import Params
+
+SMALL_RUNTIME_CONSTANTS = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 3, 'MAX_PROGRESS_YEARS': 80}
+
+@pytest.fixture(autouse=True)
+def restore_params_and_runtime_constants():
+    """Evaluating the graph overrides the params and runtime constants for the whole process"""
+    original_runtime_constants = full_chain.current_runtime_constants()
+    yield
+    full_chain.use_params(Params().dictionary)
+    full_chain.use_runtime_constants(original_runtime_constants)
+
+def test_only_recomputes_nodes_downstream_of_a_change():
+    graph = EvaluationGraph(runtime_constants=SMALL_RUNTIME_CONSTANTS)
+    graph.success_probabilities()
+    assert len(graph.recomputed) == 3 * 5 + 3 + 2 # Coefficients, sub-chains and the reduced solve
+
+    graph.update({'preperils.industrial.stretch_per_reboot': 1.5})
+    probabilities = graph.success_probabilities()
+    assert graph.recomputed == ['reduced_solve']
+    expected = full_chain.run(graph.params, SMALL_RUNTIME_CONSTANTS,
+                              reduced=True)['success_probabilities']
+    assert probabilities == expected
+
+    graph.update({'multiplanetary.extinction.two_planet_risk': 0.1})
+    graph.success_probabilities()
+    assert graph.recomputed == ['multiplanetary sub-chain', 'reduced_solve']
+
+    graph.update({'perils.progress_year_n.any_regression': 0.1})
+    graph.success_probabilities()
+    assert graph.recomputed == ['perils-0 sub-chain', 'perils-1 sub-chain', 'perils-2 sub-chain',
+                                'reduced_solve']
+
+def test_rejects_unknown_runtime_constants():
+    with pytest.raises(ValueError, match='MAX_MOONS'):
+        EvaluationGraph(runtime_constants={'MAX_MOONS': 3})
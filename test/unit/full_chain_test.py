@@ -0,0 +1,50 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import numpy as np
+import pytest
+
+from calculators.full_calc import full_chain
+from calculators.full_calc.params import Params
+
+SMALL_RUNTIME_CONSTANTS = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 3, 'MAX_PROGRESS_YEARS': 80}
+
+@pytest.fixture(autouse=True)
+def restore_runtime_constants():
+    """full_chain.run() overrides the runtime constants for the whole process"""
+    original_runtime_constants = full_chain.current_runtime_constants()
+    yield
+    full_chain.use_runtime_constants(original_runtime_constants)
+
+def test_reduced_chain_matches_full_chain():
+    params_dict = Params().dictionary
+    full = full_chain.run(params_dict, SMALL_RUNTIME_CONSTANTS)['success_probabilities']
+    reduced = full_chain.run(params_dict, SMALL_RUNTIME_CONSTANTS, reduced=True)
+    assert list(reduced['success_probabilities']) == list(full)
+    assert list(reduced['success_probabilities'].values()) == pytest.approx(list(full.values()),
+                                                                           abs=1e-12)
+    assert 'reduced_solve' in {span['name'] for span in reduced['spans']}
+    assert 'full_assembly' not in {span['name'] for span in reduced['spans']}
+
+def test_expected_visits_match_fundamental_matrix():
+    full_chain.use_runtime_constants(SMALL_RUNTIME_CONSTANTS)
+    mc = full_chain.full_markov_chain()
+    fundamental_matrix = np.asarray(mc.fundamental_matrix)
+    transient_states = list(full_chain.success_probabilities(mc))
+    start = transient_states.index('perils-0')
+    visits = full_chain.expected_visits(mc)
+    assert list(visits.values()) == pytest.approx(fundamental_matrix[start].tolist())
+    returns = full_chain.expected_visits(mc, ['perils-1', 'multiplanetary-2'], start=None)
+    assert list(returns.values()) == pytest.approx(
+        [fundamental_matrix[index, index] for index in (transient_states.index('perils-1'),
+                                                        transient_states.index('multiplanetary-2'))])
+    with pytest.raises(ValueError):
+        full_chain.expected_visits(mc, start=None)
+
+def test_reboot_distribution_sums_to_success_probability():
+    full_chain.use_runtime_constants(SMALL_RUNTIME_CONSTANTS)
+    perils_chains, multiplanetary_chains = full_chain.solved_sub_chains()
+    distribution = full_chain.reboot_distribution(perils_chains, multiplanetary_chains)
+    assert len(distribution['interstellar']) == len(distribution['extinction']) == 3
+    assert sum(distribution['interstellar']) == pytest.approx(full_chain.reduced_success_probabilities(
+        perils_chains, multiplanetary_chains)['perils-0'])
+    assert sum(distribution['interstellar']) + sum(distribution['extinction']) == pytest.approx(1)
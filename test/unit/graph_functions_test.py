@@ -0,0 +1,39 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import math
+
+import numpy as np
+
+from calculators.full_calc.graph_functions import (sigmoid_curved_risk, sigmoid_curved_risks,
+                                                   exponentially_decaying_risk,
+                                                   exponentially_decaying_risks,
+                                                   row_remainders)
+
+def test_sigmoid_curved_risks_match_scalar_version_including_zero_branch():
+    progress_years = np.arange(0, 200)
+    for x_scale, y_scale, x_translation, sharpness in ((315, 0.00035, 15, 6), (1, 0, 0, 0),
+                                                       (85, 0.0015, 0, 0.9)):
+        risks = sigmoid_curved_risks(progress_years, x_scale, y_scale, x_translation, sharpness)
+        expected = [sigmoid_curved_risk(year, x_scale, y_scale, x_translation, sharpness)
+                    for year in range(0, 200)]
+        assert np.allclose(risks, expected, rtol=1e-12, atol=0)
+        assert not risks[:x_translation + 1].any()
+
+def test_sigmoid_curved_risks_broadcast_over_k():
+    x_scales = np.array([[90], [315]])
+    risks = sigmoid_curved_risks(np.arange(0, 50), x_scales, 0.002, 5, 2)
+    assert risks.shape == (2, 50)
+    assert np.isclose(risks[1, 30], sigmoid_curved_risk(30, 315, 0.002, 5, 2))
+
+def test_exponentially_decaying_risks_match_scalar_version():
+    planet_counts = np.arange(2, 20)
+    risks = exponentially_decaying_risks(planet_counts, 0.12, 0.45, 0.01)
+    assert np.allclose(risks, [exponentially_decaying_risk(q, 0.12, 0.45, 0.01)
+                               for q in range(2, 20)])
+
+def test_row_remainders_make_rows_sum_to_1():
+    rng = np.random.default_rng(0)
+    matrix = rng.random((50, 200)) * 1e-3
+    columns = rng.integers(0, 200, 50)
+    matrix[np.arange(50), columns] = row_remainders(matrix, columns)
+    assert all(math.fsum(row) == 1 for row in matrix)
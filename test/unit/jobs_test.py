@@ -0,0 +1,44 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import time
+
+import pytest
+
+from calculators.full_calc.jobs import JobRunner, FINISHED
+from calculators.full_calc.params import Params, check_structure
+
+SMALL_RUNTIME_CONSTANTS = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 80}
+
+def _wait_for(runner, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while runner.job(job_id)['status'] not in (FINISHED, 'failed'):
+        assert time.time() < deadline, 'Job took too long'
+        time.sleep(0.1)
+    return runner.job(job_id)
+
+def test_runs_job_in_background_and_deduplicates_submissions(tmp_path):
+    runner = JobRunner(database_path=str(tmp_path / 'jobs.sqlite'), max_workers=1,
+                       checkpoint_directory=str(tmp_path / 'checkpoints'))
+    try:
+        params_dict = Params().dictionary
+        job_id = runner.submit(params_dict, SMALL_RUNTIME_CONSTANTS)
+        assert runner.submit(params_dict, SMALL_RUNTIME_CONSTANTS) == job_id
+        job = _wait_for(runner, job_id)
+        assert job['status'] == FINISHED, job['error']
+        assert job['completed_steps'] == job['total_steps'] == 4
+        assert 0 < job['result']['success_probabilities']['perils-0'] < 1
+
+        # Resubmitting a finished job reuses its results instead of rerunning it
+        assert runner.submit(params_dict, SMALL_RUNTIME_CONSTANTS) == job_id
+        assert runner.job(job_id)['finished_at'] == job['finished_at']
+        assert len(runner.recent_jobs()) == 1
+    finally:
+        runner.shutdown()
+
+def test_check_structure_rejects_params_unlike_params_yml():
+    params_dict = Params().dictionary
+    check_structure(params_dict)
+    for malformed in (['preperils'], 0.5, {'preperils': params_dict['preperils']},
+                      {**params_dict, 'perils': 3}):
+        with pytest.raises(ValueError):
+            check_structure(malformed)
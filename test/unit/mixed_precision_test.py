@@ -0,0 +1,58 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import numpy as np
+import pytest
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc import full_chain
+from calculators.full_calc import mixed_precision
+from calculators.full_calc import sub_markov_chains
+
+@pytest.fixture(autouse=True)
+def restore_runtime_constants():
+    original_runtime_constants = full_chain.current_runtime_constants()
+    yield
+    full_chain.use_runtime_constants(original_runtime_constants)
+    constant.MIXED_PRECISION_SOLVE = False
+
+def test_matches_pydtmc_to_float64_accuracy():
+    full_chain.use_runtime_constants({'MAX_PLANETS': 6, 'MAX_PROGRESS_YEARS': 200})
+    chain = sub_markov_chains.IntraPerilsMCWrapper(1)
+    transient_count = 200
+    expected = np.asarray(chain.mc.absorption_probabilities())[:, [0, 150]]
+    probabilities, residual = mixed_precision.absorption_probabilities(chain.mc.p,
+                                                                       transient_count, [0, 150])
+    assert np.allclose(probabilities, expected, rtol=0, atol=1e-13)
+    assert residual < 1e-13
+
+def test_wrappers_solve_in_mixed_precision_when_set():
+    full_chain.use_runtime_constants({'MAX_PLANETS': 6, 'MAX_PROGRESS_YEARS': 100})
+    expected = [sub_markov_chains.IntraPerilsMCWrapper(0).exit_probabilities(),
+                sub_markov_chains.IntraMultiplanetaryMCWrapper(0).exit_probabilities()]
+    constant.MIXED_PRECISION_SOLVE = True
+    chains = [sub_markov_chains.IntraPerilsMCWrapper(0),
+              sub_markov_chains.IntraMultiplanetaryMCWrapper(0)]
+    for chain, probabilities in zip(chains, expected):
+        assert np.allclose(chain.exit_probabilities(), probabilities, rtol=0, atol=1e-13)
+        assert chain.solve_residual < 1e-13
+
+def test_raises_if_refinement_fails():
+    # State 1 is transient in name only, so I - Q is singular
+    transition_matrix = np.array([[0.5, 0.25, 0.25],
+                                  [0, 1, 0],
+                                  [0, 0, 1]])
+    with pytest.raises(mixed_precision.RefinementFailed):
+        mixed_precision.absorption_probabilities(transition_matrix, 2, [0])
+
+def test_wrappers_fall_back_to_float64_if_refinement_fails(monkeypatch):
+    full_chain.use_runtime_constants({'MAX_PLANETS': 6, 'MAX_PROGRESS_YEARS': 100})
+    expected = sub_markov_chains.IntraPerilsMCWrapper(0).exit_probabilities()
+
+    def _failed_refinement(*_):
+        raise mixed_precision.RefinementFailed('Refinement failed')
+
+    monkeypatch.setattr(mixed_precision, 'absorption_probabilities', _failed_refinement)
+    constant.MIXED_PRECISION_SOLVE = True
+    chain = sub_markov_chains.IntraPerilsMCWrapper(0)
+    assert (chain.exit_probabilities() == expected).all()
+    assert chain.solve_residual is None
@@ -0,0 +1,28 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import numpy as np
+import pytest
+
+from calculators.full_calc.model_spec import StateFamily, Transition, compile_model
+
+def _toy_model(regression_probability=lambda k: 0.1 if k < 2 else 0):
+    return [StateFamily('a', range(0, 3), [Transition('b', 0, lambda k: 0.5),
+                                           Transition('Done', None, lambda k: 0.4)]),
+            StateFamily('b', range(0, 3), [Transition('a', 1, regression_probability),
+                                           Transition('Done', None, lambda k: 0.9)])]
+
+def test_compiles_families_to_sparse_blocks():
+    model = compile_model(_toy_model(), ['Done'])
+    assert model.states == ['a-0', 'a-1', 'a-2', 'b-0', 'b-1', 'b-2', 'Done']
+    assert model.index['b-1'] == 4
+    assert model.q[model.index['b-0'], model.index['a-1']] == 0.1
+    assert model.q.nnz == 5 # a-k -> b-k, and b-0 -> a-1, b-1 -> a-2
+    matrix = model.transition_matrix()
+    assert matrix[model.index['Done'], model.index['Done']] == 1
+    assert np.allclose(matrix[:3].sum(axis=1), 0.9)
+
+def test_rejects_transitions_outside_the_model():
+    with pytest.raises(ValueError, match='b-2 transitions to a-3'):
+        compile_model(_toy_model(regression_probability=lambda k: 0.1), ['Done'])
+    with pytest.raises(ValueError, match='unknown absorbing state Done'):
+        compile_model(_toy_model(), ['Extinction'])
@@ -0,0 +1,63 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring, redefined-outer-name
+
+import pytest
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc import perils
+from calculators.full_calc import sub_markov_chains
+
+@pytest.fixture
+def perils_params(monkeypatch):
+    """Swap in a small set of perils params, clearing the compiled coefficients either side"""
+    def use(target_params):
+        monkeypatch.setattr(perils, 'params', target_params)
+        perils.compiled_transition_parameters.cache_clear()
+    yield use
+    perils.compiled_transition_parameters.cache_clear()
+
+def _sigmoid_params(**overrides):
+    return {'y_scale': 0.002, 'base_x_scale': 80, 'stretch_per_reboot': 2, 'x_translation': 5,
+            'sharpness': 2, 'per_civilisation_background_risk_numerator': 1.5,
+            'base_background_risk_denominator': 1000, **overrides}
+
+def test_compiled_parameters_apply_stretch_and_background_risk(perils_params):
+    perils_params({'extinction': _sigmoid_params()})
+    coefficients = perils.compiled_transition_parameters(2, 'extinction')
+    assert coefficients.x_scale == 320
+    assert coefficients.background_risk == 1.5 ** 3 / 1000
+
+def test_compiled_parameters_only_use_current_perils_overrides_for_k_0(perils_params):
+    perils_params({'extinction': _sigmoid_params(current_perils_y_scale=0,
+                                                 current_perils_base_x_scale=100)})
+    current = perils.compiled_transition_parameters(0, 'extinction')
+    future = perils.compiled_transition_parameters(1, 'extinction')
+    assert (current.y_scale, current.x_scale) == (0, 100)
+    assert (future.y_scale, future.x_scale) == (0.002, 160)
+
+def test_structurally_zero_targets_need_no_sigmoid_or_background_risk(perils_params):
+    perils_params({'interstellar': _sigmoid_params(y_scale=0,
+                                                   per_civilisation_background_risk_numerator=0),
+                   'extinction': _sigmoid_params(y_scale=0)})
+    assert perils.is_structurally_zero(0, 'interstellar')
+    assert not perils.is_structurally_zero(0, 'extinction')
+
+def test_sub_chain_leaves_out_structurally_zero_exits(monkeypatch):
+    monkeypatch.setattr(constant, 'MAX_PROGRESS_YEARS', 80)
+    perils.compiled_transition_parameters.cache_clear()
+    chain = sub_markov_chains.IntraPerilsMCWrapper(0) # The default params never go interstellar
+    assert 'Interstellar' not in chain.mc.states
+    assert chain.exit_probabilities().shape == (5, 2)
+    assert (chain.exit_probabilities()[4] == 0).all()
+    assert chain.exit_probabilities().sum(axis=0) == pytest.approx([1, 1])
+
+@pytest.mark.parametrize('progress_year', [0, 10, 75])
+def test_zipf_regressions_share_out_any_regression(perils_params, progress_year, monkeypatch):
+    monkeypatch.setattr(constant, 'MAX_PROGRESS_YEARS', 80)
+    perils_params({'progress_year_n': {'algorithm': 'zipf', 'zipf_exponent': 1.5,
+                                       'any_regression': 0.02}})
+    regressions = [perils.transition_to_year_n_given_perils(0, progress_year, n)
+                   for n in range(progress_year + 1)]
+    assert sum(regressions) == pytest.approx(0.02)
+    assert regressions[-1] == max(regressions) # Staying put is the likeliest regression
+    if progress_year:
+        assert regressions[-1] / regressions[-2] == pytest.approx(2 ** 1.5)
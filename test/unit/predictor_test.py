@@ -0,0 +1,44 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import warnings
+
+import pytest
+
+import calculators.full_calc.runtime_constants as constant
+from calculators.full_calc.jobs import JobRunner
+from calculators.full_calc.predictor import (MIXED_PRECISION, PYDTMC, LimitExceeded, Predictor,
+                                             _non_negative_fit, calibrate, current_backend)
+
+def test_non_negative_fit_drops_negative_coefficients():
+    features = [[1, 1], [1, 2], [1, 3]]
+    assert _non_negative_fit(features, [3, 2, 1]) == [2.0, 0.0]
+    assert _non_negative_fit(features, [2, 4, 6]) == pytest.approx([0, 2])
+
+def test_calibrates_saves_and_checks_limits(tmp_path):
+    predictor = calibrate(grid={'MAX_PLANETS': [4, 8], 'MAX_CIVILISATIONS': [2],
+                                'MAX_PROGRESS_YEARS': [80, 120]})
+    predictor.save(tmp_path / 'calibration.json')
+    predictor = Predictor.load(tmp_path / 'calibration.json')
+    small = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 80}
+    large = {'MAX_PLANETS': 40, 'MAX_CIVILISATIONS': 20, 'MAX_PROGRESS_YEARS': 4000}
+    small_estimate = predictor.check(small)
+    assert 0 < small_estimate.runtime_seconds < predictor.estimate(large).runtime_seconds
+    assert small_estimate.peak_rss_bytes <= predictor.estimate(large).peak_rss_bytes
+    with pytest.raises(LimitExceeded):
+        predictor.check(large, max_runtime_seconds=small_estimate.runtime_seconds)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        predictor.check(large, max_peak_rss_bytes=1, refuse=False)
+    assert 'peak memory' in str(caught[0].message)
+
+def test_calibrates_the_mixed_precision_backend_separately(tmp_path, monkeypatch):
+    calibrate(MIXED_PRECISION, grid={'MAX_PLANETS': [4], 'MAX_CIVILISATIONS': [2],
+                                     'MAX_PROGRESS_YEARS': [80]}).save(tmp_path / 'calibration.json')
+    with pytest.raises(KeyError):
+        Predictor.load(tmp_path / 'calibration.json', PYDTMC)
+    predictor = Predictor.load(tmp_path / 'calibration.json', MIXED_PRECISION)
+    assert current_backend() == PYDTMC
+    with pytest.raises(ValueError):
+        JobRunner(database_path=str(tmp_path / 'jobs.sqlite'), predictor=predictor)
+    monkeypatch.setattr(constant, 'MIXED_PRECISION_SOLVE', True)
+    assert current_backend() == MIXED_PRECISION
@@ -0,0 +1,51 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import csv
+
+from calculators.full_calc.params import Params, parameter_hash
+from calculators.full_calc.results_store import ResultsStore, SUCCESS_PROBABILITY
+
+RUNTIME_CONSTANTS = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 80}
+
+def test_stores_runs_in_long_format_and_queries_by_param(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    params_dict = Params().dictionary
+    run_id = store.add_run(params_dict, RUNTIME_CONSTANTS,
+                           {SUCCESS_PROBABILITY: {'perils-0': 0.5, 'preindustrial-1': 0.4}},
+                           runtime=1.5)
+    assert store.results(run_id) == {'perils-0': 0.5, 'preindustrial-1': 0.4}
+    assert [run['id'] for run in store.runs(perils__extinction__y_scale=0.00035)] == [run_id]
+    assert not store.runs(perils__extinction__y_scale=0.1)
+    run = store.runs(param_hash=parameter_hash(params_dict, RUNTIME_CONSTANTS))[0]
+    assert (run['max_progress_years'], run['runtime'], run['params']) == (80, 1.5, params_dict)
+
+def test_imports_legacy_csv_and_exports_union_of_columns(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    assert store.import_csv('results.csv') == 57
+    assert store.import_csv('results-2.csv') == 1
+    store.export_csv(tmp_path / 'export.csv')
+    with open(tmp_path / 'export.csv', newline='', encoding='utf-8') as csvfile:
+        header, *rows = list(csv.reader(csvfile))
+    assert len(rows) == 58
+    assert all(len(row) == len(header) for row in rows)
+    assert rows[0][header.index('perils-0')] == '0.7051992015'
+
+def test_imports_legacy_params_under_the_same_names_as_new_runs(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    store.import_csv('results.csv')
+    run_id = store.add_run(Params().dictionary, RUNTIME_CONSTANTS, {SUCCESS_PROBABILITY: {}})
+    assert 'perils.extinction.y_scale' in store.run_params(1)
+    store.export_csv(tmp_path / 'export.csv')
+    with open(tmp_path / 'export.csv', newline='', encoding='utf-8') as csvfile:
+        header, *rows = list(csv.reader(csvfile))
+    assert 'perils_extinction_y_scale' not in header
+    column = header.index('perils.extinction.y_scale')
+    assert rows[0][column] and rows[run_id - 1][column]
+
+def test_stores_tracing_spans_with_runs(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    spans = [{'name': 'perils_build', 'start': 0.1, 'wall_seconds': 2.0, 'cpu_seconds': 1.9,
+              'peak_rss_bytes': 1024, 'attributes': {'k': 0}}]
+    run_id = store.add_run(Params().dictionary, RUNTIME_CONSTANTS,
+                           {SUCCESS_PROBABILITY: {'perils-0': 0.5}}, spans=spans)
+    assert store.spans(run_id) == spans
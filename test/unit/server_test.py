@@ -0,0 +1,68 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring, redefined-outer-name
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from calculators.server import CalculatorServer
+from calculators.simple_calc.simple_calc import evaluate
+
+SMALL_RUNTIME_CONSTANTS = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 80}
+
+@pytest.fixture
+def server():
+    server = CalculatorServer(port=0, full_calc_workers=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _post(server, path, body):
+    request = urllib.request.Request(f'http://127.0.0.1:{server.server_address[1]}{path}',
+                                     data=json.dumps(body).encode('utf-8'), method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error:
+        return error.code, json.load(error)
+
+def test_listens_on_localhost_only(server):
+    assert server.server_address[0] == '127.0.0.1'
+
+def test_micro_batches_and_coalesces_simple_calc_requests(server):
+    probability_sets = [{'extinction_given_present_perils': 0.01 * (index % 10 + 1),
+                         'interstellar_given_present_perils': 0.3,
+                         'interstellar_given_future_perils': 0.3}
+                        for index in range(40)]
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        responses = list(executor.map(lambda body: _post(server, '/simple', body),
+                                      probability_sets))
+    for probabilities, (status, response) in zip(probability_sets, responses):
+        assert status == 200
+        assert response['success_probabilities'] == pytest.approx(
+            dict(evaluate(**probabilities).success_probabilities))
+    # Only 10 distinct requests, so the rest were coalesced or cached
+    assert server.simple_calc_results.computations == 10
+    assert sum(server.simple_calc_batcher.batch_sizes) == 10
+
+def test_rejects_invalid_requests(server):
+    assert _post(server, '/simple', {'no_such_probability': 0.1})[0] == 400
+    assert _post(server, '/simple', {'extinction_given_present_perils': 0.9,
+                                     'interstellar_given_present_perils': 0.9})[0] == 400
+    assert _post(server, '/full', {'params': {'no_such_param': 1}})[0] == 400
+    assert _post(server, '/nowhere', {})[0] == 404
+
+def test_coalesces_identical_full_calc_requests(server):
+    body = {'params': {'perils.extinction.y_scale': 0.0001},
+            'runtime_constants': SMALL_RUNTIME_CONSTANTS}
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        responses = list(executor.map(lambda _: _post(server, '/full', body), range(3)))
+    assert [status for status, _ in responses] == [200] * 3
+    assert 0 < responses[0][1]['success_probabilities']['perils-0'] < 1
+    assert responses[0][1] == responses[1][1] == responses[2][1]
+    assert server.full_calc_results.computations == 1
@@ -1,7 +1,9 @@
 # pylint: disable=missing-function-docstring, missing-module-docstring, unused-import, trailing-newlines
 
 import pdb
-from calculators.simple_calc.simple_calc import SimpleCalc
+import numpy as np
+import pytest
+from calculators.simple_calc.simple_calc import SimpleCalc, batch_absorption_probabilities, evaluate
 
 def test_preindustrial_probabilities_sum_to_1():
     probabilities = {'extinction_given_preindustrial': 0.4}
@@ -59,3 +61,59 @@ def test_assembles_valid_markov_chain():
     calc = SimpleCalc(**probabilities)
     # The Markov chain library will throw a descriptive error here if anything's invalid
     calc.markov_chain()
+
+ALL_PROBABILITIES = {
+    'extinction_given_preindustrial': 0.4, 'extinction_given_industrial': 0.6,
+    'extinction_given_present_perils': 0.01, 'preindustrial_given_present_perils': 0.0001,
+    'industrial_given_present_perils': 0.2, 'future_perils_given_present_perils': 0.02,
+    'interstellar_given_present_perils': 0.3, 'extinction_given_future_perils': 0.02,
+    'preindustrial_given_future_perils': 0.0003, 'industrial_given_future_perils': 0.1,
+    'interstellar_given_future_perils': 0.2, 'extinction_given_multiplanetary': 0.2,
+    'preindustrial_given_multiplanetary': 0.003, 'industrial_given_multiplanetary': 0.3,
+    'future_perils_given_multiplanetary': 0.1}
+
+def test_evaluate_matches_simple_calc_and_is_cached():
+    calc = SimpleCalc(**ALL_PROBABILITIES)
+    results = evaluate(**ALL_PROBABILITIES)
+    assert results is evaluate(**ALL_PROBABILITIES)
+    assert results.success_probabilities['Present perils'] == (
+        calc.net_interstellar_from_present_perils())
+    assert dict(results.probability_differences) == dict(calc.probability_differences())
+    assert list(results.probability_proportion_differences) == [
+        'Extinction', 'Preindustrial', 'Industrial', 'Future perils', 'Multiplanetary',
+        'Interstellar']
+
+def test_evaluate_updates_a_given_calc_incrementally():
+    calc = SimpleCalc(**ALL_PROBABILITIES)
+    calc.absorption_probabilities()
+    changed = {**ALL_PROBABILITIES, 'extinction_given_multiplanetary': 0.15}
+    results = evaluate(calc=calc, **changed)
+    assert calc.absorption_solver().rank_one_updates == 1
+    assert results.success_probabilities['Multiplanetary'] == pytest.approx(
+        SimpleCalc(**changed).net_interstellar_from_multiplanetary())
+
+def test_single_state_update_matches_rebuilt_chain():
+    calc = SimpleCalc(**ALL_PROBABILITIES)
+    calc.absorption_probabilities()
+    changes = {'extinction_given_future_perils': 0.3, 'interstellar_given_future_perils': 0.05}
+    calc.update_transition_probabilities(**changes)
+    assert calc.absorption_solver().rank_one_updates == 1
+    rebuilt = SimpleCalc(**{**ALL_PROBABILITIES, **changes}).markov_chain()
+    assert np.allclose(calc.absorption_probabilities(), rebuilt.absorption_probabilities())
+
+def test_previews_match_rebuilt_chains_without_changing_calc():
+    calc = SimpleCalc(**ALL_PROBABILITIES)
+    before = calc.absorption_probabilities()
+    candidates = [{'extinction_given_multiplanetary': value} for value in (0, 0.25, 0.5)]
+    previews = calc.preview_absorption_probabilities(candidates)
+    for candidate, preview in zip(candidates, previews):
+        rebuilt = SimpleCalc(**{**ALL_PROBABILITIES, **candidate}).markov_chain()
+        assert np.allclose(preview, rebuilt.absorption_probabilities())
+    assert np.array_equal(calc.absorption_probabilities(), before)
+
+def test_batch_absorption_probabilities_match_individual_calcs():
+    probability_sets = [ALL_PROBABILITIES, {}, {**ALL_PROBABILITIES, 'extinction_given_industrial': 0.1}]
+    batch = batch_absorption_probabilities(probability_sets)
+    for probabilities, absorption_probabilities in zip(probability_sets, batch):
+        assert np.allclose(absorption_probabilities,
+                           SimpleCalc(**probabilities).markov_chain().absorption_probabilities())
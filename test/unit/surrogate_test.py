@@ -0,0 +1,27 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import math
+
+from calculators.full_calc.params import Params, with_overrides
+from calculators.full_calc.surrogate import Surrogate, build_surrogate
+
+SPEC = {'runtime_constants': {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 80},
+        'dimensions': {'perils.extinction.y_scale': [0.0001, 0.0004, 0.001],
+                       'perils.multiplanetary.y_scale': [0.05, 0.1]}}
+
+def test_surrogate_reproduces_grid_and_round_trips(tmp_path):
+    surrogate = build_surrogate(SPEC, max_workers=2)
+    values, errors = surrogate.predict({'perils.extinction.y_scale': 0.0004,
+                                        'perils.multiplanetary.y_scale': 0.1})
+    assert values['perils-0'] == surrogate.values[1, 1, surrogate.output_states.index('perils-0')]
+    assert all(math.isfinite(error) and error >= 0 for error in errors.values())
+
+    surrogate.save(tmp_path / 'surrogate.npz')
+    loaded = Surrogate.load(tmp_path / 'surrogate.npz')
+    point = {'perils.extinction.y_scale': 0.0002, 'perils.multiplanetary.y_scale': 0.07}
+    assert loaded.predict(point) == surrogate.predict(point)
+
+    params_dict = with_overrides(Params().dictionary, point)
+    assert loaded.estimate_for(params_dict, SPEC['runtime_constants']) == loaded.predict(point)
+    assert loaded.estimate_for(with_overrides(params_dict, {'perils.industrial.y_scale': 0.1}),
+                               SPEC['runtime_constants']) is None
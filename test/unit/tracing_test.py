@@ -0,0 +1,31 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import json
+
+from calculators.full_calc import tracing
+
+def test_spans_are_only_recorded_while_a_tracer_is_active():
+    tracer = tracing.Tracer()
+    with tracing.span('untraced'):
+        pass
+    with tracing.tracing(tracer):
+        with tracing.span('outer'):
+            with tracing.span('inner', k=1):
+                pass
+    assert [(span['name'], span['attributes']) for span in tracer.spans] == [('inner', {'k': 1}),
+                                                                             ('outer', {})]
+    inner, outer = tracer.spans
+    assert outer['wall_seconds'] >= inner['wall_seconds'] >= 0
+    assert inner['peak_rss_bytes'] > 0
+
+def test_writes_jsonl_and_chrome_traces(tmp_path):
+    tracer = tracing.Tracer()
+    with tracer.span('full_solve'):
+        pass
+    tracer.write(tmp_path / 'trace.jsonl')
+    tracer.write(tmp_path / 'trace.json', tracing.CHROME)
+    with open(tmp_path / 'trace.jsonl', encoding='utf-8') as trace_file:
+        assert [json.loads(line)['name'] for line in trace_file] == ['full_solve']
+    with open(tmp_path / 'trace.json', encoding='utf-8') as trace_file:
+        event, = json.load(trace_file)['traceEvents']
+    assert (event['name'], event['ph']) == ('full_solve', 'X')
@@ -0,0 +1,37 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import pytest
+
+from calculators.full_calc import full_chain
+from calculators.full_calc import transient
+from calculators.full_calc.params import Params, with_overrides
+
+SMALL_RUNTIME_CONSTANTS = {'MAX_PLANETS': 4, 'MAX_CIVILISATIONS': 2, 'MAX_PROGRESS_YEARS': 80}
+
+@pytest.fixture(autouse=True)
+def restore_params_and_runtime_constants():
+    """full_chain.run() overrides the params and runtime constants for the whole process"""
+    original_runtime_constants = full_chain.current_runtime_constants()
+    yield
+    full_chain.use_params(Params().dictionary)
+    full_chain.use_runtime_constants(original_runtime_constants)
+
+def test_absorption_curve_converges_to_success_probability():
+    # Short preperils states, so the curve doesn't take long to settle
+    params_dict = with_overrides(Params().dictionary,
+                                 {'preperils.preindustrial.base_expected_time_in_years': 50,
+                                  'preperils.industrial.base_expected_time_in_years': 20})
+    success_probability = full_chain.run(params_dict, SMALL_RUNTIME_CONSTANTS)[
+        'success_probabilities']['perils-0']
+
+    curve = list(transient.absorption_curve(max_years=10 ** 6))
+    assert [point.year for point in curve[:3]] == [1, 2, 3]
+    assert all(earlier.interstellar <= later.interstellar and earlier.extinction <= later.extinction
+               for earlier, later in zip(curve, curve[1:]))
+    assert curve[-1].year < 10 ** 6
+    assert curve[-1].interstellar == pytest.approx(success_probability, abs=1e-9)
+    assert curve[-1].extinction + curve[-1].interstellar == pytest.approx(1, abs=1e-9)
+
+def test_absorption_curve_stops_at_max_years():
+    full_chain.use_runtime_constants(SMALL_RUNTIME_CONSTANTS)
+    assert [point.year for point in transient.absorption_curve(max_years=5)] == [1, 2, 3, 4, 5]
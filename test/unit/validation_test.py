@@ -0,0 +1,24 @@
+# pylint: disable=missing-function-docstring, missing-module-docstring
+
+import numpy as np
+import pytest
+
+from calculators.full_calc import validation
+
+STATES = ['a', 'b', 'c']
+
+def test_valid_matrices_pass_unchanged():
+    matrix = np.array([[0.5, 0.5, 0], [0, 0.25, 0.75], [0, 0, 1]])
+    assert np.array_equal(validation.validated(matrix, STATES, 'toy chain'), matrix)
+
+def test_reports_the_worst_rows_by_state():
+    matrix = [[0.5, 0.6, 0], [0, 0.25, 0.75], [-0.1, 0.1, 1]]
+    with pytest.raises(validation.InvalidTransitionProbabilities,
+                       match=r'toy chain has 2 rows .* worst being from a \(sums to 1.1.*, c '):
+        validation.validated(matrix, STATES, 'toy chain', repair=False)
+
+def test_repairs_rows_in_place():
+    matrix = np.array([[0.5, 1.5, 0], [0, 0.25, 0.75], [-0.1, 0.1, 1]])
+    with pytest.warns(UserWarning, match='renormalised'):
+        repaired = validation.validated(matrix, STATES, 'toy chain', repair=True)
+    assert np.allclose(repaired, [[0.25, 0.75, 0], [0, 0.25, 0.75], [0, 0.1 / 1.1, 1 / 1.1]])